@@ -0,0 +1,134 @@
+import copy
+import time
+from collections import OrderedDict
+from threading import Lock
+
+from bson.objectid import ObjectId
+from flask import g, has_request_context
+
+from backend import db
+
+# read-through cache of application and connection configs. Within a request a config is read from the database once,
+# between requests the configs are kept for cache_ttl seconds and validated against their configVersion, a counter
+# that every write of a config increments, so a config changed by another process is never returned
+cache_ttl = 5  # seconds a config is kept between requests
+cache_size = 256  # configs kept between requests
+# increments the configVersion in an update with an aggregation pipeline, where $inc can not be used
+increment_config_version = {"$add": [{"$ifNull": ["$configVersion", 0]}, 1]}
+configs = OrderedDict()  # (collection name, config id) -> (configVersion, time it was read, config)
+configs_lock = Lock()
+
+
+def get_request_cache() -> dict | None:
+    """Returns the configs read during the current request
+
+    :return: dict of (collection name, config id) to config, None outside a request
+    """
+    if not has_request_context():
+        return None
+    if "config_cache" not in g:
+        g.config_cache = {}
+    return g.config_cache
+
+
+def get_config_version(collection_name: str, config_id: ObjectId) -> int | None:
+    """Returns the configVersion of a config, without reading the rest of the config
+
+    :param collection_name: either applications or connections
+    :param config_id: id of the application or connection
+    :return: the configVersion, None if the config does not exist
+    """
+    document = db[collection_name].find_one({"_id": config_id}, {"configVersion": 1})
+    if document is None:
+        return None
+    return document.get("configVersion", 0)
+
+
+def get_config(collection_name: str, config_id: str | ObjectId) -> dict | None:
+    """Returns a config from the cache, or from the database if it is not cached or changed since it was cached
+
+    The config is a copy, so it can be changed by the caller without changing the cache.
+
+    :param collection_name: either applications or connections
+    :param config_id: id of the application or connection in string or OBJECT format
+    :return: the config as stored in the database, None if it does not exist
+    """
+    config_id = ObjectId(config_id)
+    key = (collection_name, config_id)
+    request_cache = get_request_cache()
+    if request_cache is not None and key in request_cache:
+        return copy.deepcopy(request_cache[key])
+    with configs_lock:
+        cached = configs.get(key)
+    config = None
+    if cached is not None and time.monotonic() - cached[1] < cache_ttl:
+        if get_config_version(collection_name, config_id) == cached[0]:
+            config = cached[2]
+    if config is None:
+        config = db[collection_name].find_one({"_id": config_id})
+        if config is None:
+            invalidate(collection_name, config_id)
+            return None
+        with configs_lock:
+            configs[key] = (config.get("configVersion", 0), time.monotonic(), config)
+            configs.move_to_end(key)
+            while len(configs) > cache_size:
+                configs.popitem(last=False)
+    if request_cache is not None:
+        request_cache[key] = config
+    return copy.deepcopy(config)
+
+
+def get_fields(
+    collection_name: str, config_id: str | ObjectId, fields: list
+) -> dict | None:
+    """Returns fields of a config that were already read during the current request, either with the whole config or
+    with the same fields, see set_fields()
+
+    :param collection_name: either applications or connections
+    :param config_id: id of the application or connection in string or OBJECT format
+    :param fields: names of the fields to return
+    :return: dict with the fields that exist in the config, None if they were not read during the request
+    """
+    request_cache = get_request_cache()
+    if request_cache is None:
+        return None
+    config_id = ObjectId(config_id)
+    config = request_cache.get((collection_name, config_id))
+    if config is None:
+        config = request_cache.get((collection_name, config_id, tuple(fields)))
+        if config is None:
+            return None
+    return copy.deepcopy({field: config[field] for field in fields if field in config})
+
+
+def set_fields(
+    collection_name: str, config_id: str | ObjectId, fields: list, document: dict
+) -> None:
+    """Keeps fields of a config that were read with a projection for the rest of the current request
+
+    :param collection_name: either applications or connections
+    :param config_id: id of the application or connection in string or OBJECT format
+    :param fields: names of the fields that were read
+    :param document: the fields as read from the database
+    """
+    request_cache = get_request_cache()
+    if request_cache is not None:
+        request_cache[(collection_name, ObjectId(config_id), tuple(fields))] = (
+            copy.deepcopy(document)
+        )
+
+
+def invalidate(collection_name: str, config_id: str | ObjectId) -> None:
+    """Removes a config from the cache, this is done after every write of the config
+
+    :param collection_name: either applications or connections
+    :param config_id: id of the application or connection in string or OBJECT format
+    """
+    key = (collection_name, ObjectId(config_id))
+    with configs_lock:
+        configs.pop(key, None)
+    request_cache = get_request_cache()
+    if request_cache is not None:
+        for cached_key in [item for item in request_cache if item[:2] == key]:
+            request_cache.pop(cached_key)
@@ -0,0 +1,156 @@
+from bson.errors import InvalidId
+from bson.objectid import ObjectId
+from flask import request
+from pymongo import ASCENDING, DESCENDING
+
+from backend import db, ConfigCache
+
+# lightweight reads of application and connection configs, they only fetch the fields that are asked for
+applications = db["applications"]
+connections = db["connections"]
+sdk_fields = ["sdkGenerated", "sdkId"]
+auth_fields = ["securityScheme", "headerItems", "basicUsername", "basicPassword"]
+sort_orders = {"asc": ASCENDING, "desc": DESCENDING}
+
+
+def find_fields(collection: any, document_id: str | ObjectId, fields: list) -> dict:
+    """Returns the given fields of a config, the other fields are not sent by the database. Within a request the
+    fields are read once, see ConfigCache.get_fields()
+
+    :param collection: either the applications or connections collection
+    :param document_id: id of the application or connection in string or OBJECT format
+    :param fields: names of the fields to return
+    :return: dict with the fields that exist in the config, an empty dict if the config is not found
+    """
+    document = ConfigCache.get_fields(collection.name, document_id, fields)
+    if document is not None:
+        return document
+    projection = {field: 1 for field in fields}
+    projection["_id"] = 0
+    document = collection.find_one({"_id": ObjectId(document_id)}, projection)
+    if document is None:
+        document = {}
+    ConfigCache.set_fields(collection.name, document_id, fields, document)
+    return document
+
+
+def get_application_fields(application_id: str | ObjectId, fields: list) -> dict:
+    """Returns the given fields of an application config
+
+    :param application_id: id of application in string or OBJECT format
+    :param fields: names of the fields to return
+    :return: dict with the fields that exist in the config, an empty dict if the application is not found
+    """
+    return find_fields(applications, application_id, fields)
+
+
+def get_application_name(application_id: str | ObjectId) -> str:
+    """Returns the name of an application
+
+    :param application_id: id of application in string or OBJECT format
+    :return: the name, an empty string if the application is not found
+    """
+    return get_application_fields(application_id, ["name"]).get("name", "")
+
+
+def get_application_names(application_ids: list) -> dict:
+    """Returns the names of several applications with a single query
+
+    :param application_ids: ids of applications in string format
+    :return: dict of application id to name, applications that are not found are left out
+    """
+    object_ids = []
+    for application_id in set(application_ids):
+        try:
+            object_ids.append(ObjectId(application_id))
+        except (InvalidId, TypeError):
+            continue
+    return {
+        str(document["_id"]): document.get("name", "")
+        for document in applications.find({"_id": {"$in": object_ids}}, {"name": 1})
+    }
+
+
+def get_page_arguments(sort_fields: list, default_sort: str) -> tuple[int, int, list]:
+    """Returns the pagination and sorting of a listing request, given by its skip, limit, sort and order arguments
+
+    :param sort_fields: fields the listing can be sorted on
+    :param default_sort: field to sort on when no or an unknown field is given
+    :return: a tuple with the number of configs to skip, the maximum number of configs (0 for all) and the sort
+    """
+    skip = max(0, request.args.get("skip", default=0, type=int))
+    limit = max(0, request.args.get("limit", default=0, type=int))
+    sort = request.args.get("sort", default=default_sort, type=str)
+    if sort not in sort_fields:
+        sort = default_sort
+    order = sort_orders.get(
+        request.args.get("order", default="asc", type=str), ASCENDING
+    )
+    if sort == "_id":
+        return skip, limit, [("_id", order)]
+    return skip, limit, [(sort, order), ("_id", order)]  # _id keeps the pages stable
+
+
+def get_sdk_state(application_id: str | ObjectId) -> dict:
+    """Returns if the client SDK of an application is generated and its id
+
+    :param application_id: id of application in string or OBJECT format
+    :return: dict with sdkGenerated and sdkId, if they are set
+    """
+    return get_application_fields(application_id, sdk_fields)
+
+
+def get_auth_config(application_id: str | ObjectId) -> dict:
+    """Returns the authentication fields of an application
+
+    :param application_id: id of application in string or OBJECT format
+    :return: dict with securityScheme and its header items or basic credentials, if they are set
+    """
+    return get_application_fields(application_id, auth_fields)
+
+
+def get_connection_fields(connection_id: str | ObjectId, fields: list) -> dict:
+    """Returns the given fields of a connection config
+
+    :param connection_id: a unique identifier of a connection between applications
+    :param fields: names of the fields to return
+    :return: dict with the fields that exist in the config, an empty dict if the connection is not found
+    """
+    return find_fields(connections, connection_id, fields)
+
+
+def get_variables(connection_id: str | ObjectId) -> list | None:
+    """Returns the variables of a connection
+
+    :param connection_id: a unique identifier of a connection between applications
+    :return: list of variables, None if the connection has no variables
+    """
+    return get_connection_fields(connection_id, ["variables"]).get("variables")
+
+
+def get_endpoint_mapping(connection_id: str | ObjectId, mapping_id: str) -> dict | None:
+    """Returns a single endpoint mapping of a connection, the other mappings are not sent by the database
+
+    :param connection_id: a unique identifier of a connection between applications
+    :param mapping_id: Unique identifier for the connection between data schema items
+    :return: the mapping, None if it is not found
+    """
+    cached = ConfigCache.get_fields(
+        connections.name, connection_id, ["endpointMapping"]
+    )
+    if cached is not None:
+        return next(
+            (
+                mapping
+                for mapping in cached.get("endpointMapping", [])
+                if mapping["id"] == mapping_id
+            ),
+            None,
+        )
+    document = connections.find_one(
+        {"_id": ObjectId(connection_id)},
+        {"_id": 0, "endpointMapping": {"$elemMatch": {"id": mapping_id}}},
+    )
+    if document is None or not document.get("endpointMapping"):
+        return None
+    return document["endpointMapping"][0]
@@ -0,0 +1,299 @@
+import logging
+from datetime import datetime
+
+from bson import ObjectId
+from pymongo import ASCENDING, DESCENDING, MongoClient
+from pymongo.errors import PyMongoError
+
+from backend import db, mongo_url
+
+log = logging.getLogger(__name__)
+connect_timeout = 2000  # milliseconds to wait for Mongo before the indexes are skipped
+# fields the application and connection listings can be sorted on, _id is the tiebreaker of every sort, see
+# ConfigStore.get_page_arguments()
+application_sort_fields = ["name", "version", "description", "state"]
+connection_sort_fields = ["description", "version", "state", "static"]
+# the indexes per collection as (keys, options), the queries they serve are checked by explain_queries()
+indexes = {
+    "applications": [
+        ([(field, ASCENDING), ("_id", ASCENDING)], {})
+        for field in application_sort_fields
+    ],
+    "connections": [([("applicationIds", ASCENDING)], {})]
+    + [
+        ([(field, ASCENDING), ("_id", ASCENDING)], {})
+        for field in connection_sort_fields
+    ],  # the state index also serves the queries on state alone
+    "cache": [
+        ([("mappingId", ASCENDING)], {"unique": True}),
+    ],
+    "samples": [
+        (
+            [
+                ("applicationId", ASCENDING),
+                ("operation", ASCENDING),
+                ("url", ASCENDING),
+                ("hash", ASCENDING),
+            ],
+            {"unique": True},
+        ),
+        (
+            [
+                ("applicationId", ASCENDING),
+                ("operation", ASCENDING),
+                ("url", ASCENDING),
+                ("lastSeen", DESCENDING),
+            ],
+            {},
+        ),
+    ],
+    "sample_schemas": [
+        (
+            [
+                ("applicationId", ASCENDING),
+                ("operation", ASCENDING),
+                ("url", ASCENDING),
+            ],
+            {"unique": True},
+        ),
+    ],
+    "specs": [
+        (
+            [
+                ("applicationId", ASCENDING),
+                ("specsVersion", ASCENDING),
+                ("type", ASCENDING),
+                ("path", ASCENDING),
+                ("operation", ASCENDING),
+            ],
+            {},
+        ),
+    ],
+    "backfills": [
+        ([("backfillId", ASCENDING), ("mappingId", ASCENDING)], {}),
+        ([("connectionId", ASCENDING), ("startedAt", DESCENDING)], {}),
+    ],
+    "sync_control": [
+        (
+            [
+                ("type", ASCENDING),
+                ("state", ASCENDING),
+                ("command", ASCENDING),
+                ("createdAt", ASCENDING),
+            ],
+            {},
+        ),
+        ([("type", ASCENDING), ("heartbeat", ASCENDING)], {}),
+    ],
+    "sync_leases": [
+        ([("expiresAt", ASCENDING)], {}),
+    ],
+    "sync_log": [
+        ([("connectionId", ASCENDING), ("_id", ASCENDING)], {}),
+        ([("sessionId", ASCENDING), ("_id", ASCENDING)], {}),
+    ],
+    "sync_state": [
+        ([("running", ASCENDING), ("updatedAt", DESCENDING)], {}),
+    ],
+}
+
+
+def get_indexes() -> dict:
+    """Returns the indexes per collection, including the TTL indexes of the cache, the sync control documents and the
+    sync log, whose durations are set by their modules
+
+    :return: dict of collection name to a list of (keys, options)
+    """
+    from backend.sync_server import SyncServer, SyncServerControl, SyncServerHelpers
+
+    return dict(
+        indexes,
+        cache=indexes["cache"]
+        + [
+            (
+                [("updatedAt", ASCENDING)],
+                {"expireAfterSeconds": SyncServerHelpers.cache_ttl},
+            )
+        ],
+        sync_control=indexes["sync_control"]
+        + [
+            (
+                [("createdAt", ASCENDING)],
+                {"expireAfterSeconds": SyncServerControl.control_ttl},
+            ),
+            (
+                [("heartbeat", ASCENDING)],
+                {"expireAfterSeconds": SyncServerControl.control_ttl},
+            ),
+        ],
+        sync_log=indexes["sync_log"]
+        + [
+            ([("createdAt", ASCENDING)], {"expireAfterSeconds": SyncServer.log_ttl}),
+        ],
+    )
+
+
+def check_connection() -> bool:
+    """Checks once, with a short timeout, if Mongo can be reached
+
+    :return: bool if Mongo answered
+    """
+    client = MongoClient(mongo_url, serverSelectionTimeoutMS=connect_timeout)
+    try:
+        client.admin.command("ping")
+        return True
+    except PyMongoError as e:
+        log.warning("Mongo can not be reached, the indexes are not checked: %s", e)
+        return False
+    finally:
+        client.close()
+
+
+def ensure_indexes() -> None:
+    """Creates the indexes that do not exist yet, existing indexes are left as they are
+
+    When Mongo can not be reached the indexes are skipped, instead of waiting for the server selection timeout of every
+    index. A failing index, for example a unique index on a collection that has duplicates or a TTL index whose
+    duration changed, is reported and the other indexes are still created.
+    """
+    if not check_connection():
+        return
+    for collection_name, collection_indexes in get_indexes().items():
+        for keys, options in collection_indexes:
+            try:
+                db[collection_name].create_index(keys, **options)
+            except PyMongoError as e:
+                log.error(
+                    "Error while creating index %s %s: %s", collection_name, keys, e
+                )
+
+
+def get_hot_queries() -> list:
+    """Returns the queries that run most often, as (collection name, filter, sort)
+
+    The values in the filters are placeholders, the query plan only depends on the fields.
+
+    :return: list of queries
+    """
+    object_id = ObjectId()
+    now = datetime.utcnow()
+    endpoint = {"applicationId": str(object_id), "operation": "get", "url": "/"}
+    listings = [
+        (collection_name, {}, [(field, order), ("_id", order)])
+        for collection_name, fields in [
+            ("applications", application_sort_fields),
+            ("connections", connection_sort_fields),
+        ]
+        for field in fields
+        for order in [ASCENDING, DESCENDING]
+    ]
+    return listings + [
+        ("applications", {}, [("name", ASCENDING)]),
+        ("applications", {"_id": object_id}, None),
+        ("connections", {}, [("_id", ASCENDING)]),
+        ("connections", {"applicationIds": str(object_id)}, None),
+        ("connections", {"state": "Complete"}, None),
+        ("cache", {"mappingId": str(object_id)}, None),
+        ("samples", dict(endpoint, hash=""), None),
+        ("samples", endpoint, [("lastSeen", DESCENDING)]),
+        ("sample_schemas", endpoint, None),
+        (
+            "specs",
+            {
+                "applicationId": str(object_id),
+                "specsVersion": "",
+                "type": "operation",
+                "path": "/",
+                "operation": "get",
+            },
+            None,
+        ),
+        ("backfills", {"backfillId": "", "mappingId": ""}, None),
+        (
+            "backfills",
+            {"connectionId": str(object_id), "state": {"$ne": "complete"}},
+            [("startedAt", DESCENDING)],
+        ),
+        (
+            "sync_control",
+            {
+                "type": "command",
+                "state": "pending",
+                "command": "start",
+                "createdAt": {"$gt": now},
+            },
+            [("createdAt", ASCENDING)],
+        ),
+        ("sync_control", {"type": "status", "heartbeat": {"$gt": now}}, None),
+        ("sync_leases", {"expiresAt": {"$lt": now}}, [("expiresAt", ASCENDING)]),
+        ("sync_state", {"running": True}, [("updatedAt", DESCENDING)]),
+        ("sync_log", {"connectionId": str(object_id)}, [("_id", DESCENDING)]),
+        (
+            "sync_log",
+            {"sessionId": "", "_id": {"$gt": object_id}},
+            [("_id", ASCENDING)],
+        ),
+    ]
+
+
+def get_stages(plan: any) -> list:
+    """Returns the names of all stages in a query plan
+
+    :param plan: the winning plan of an explain(), or a part of it
+    :return: list of stage names, for example ["FETCH", "IXSCAN"]
+    """
+    stages = []
+    if isinstance(plan, dict):
+        if "stage" in plan:
+            stages.append(plan["stage"])
+        for value in plan.values():
+            stages.extend(get_stages(value))
+    elif isinstance(plan, list):
+        for item in plan:
+            stages.extend(get_stages(item))
+    return stages
+
+
+def explain_queries() -> list:
+    """Returns the query plan of every hot query, see get_hot_queries()
+
+    :return: list of dicts with the collection, filter, sort, stages and if the query scans the whole collection
+    """
+    results = []
+    for collection_name, query, sort in get_hot_queries():
+        cursor = db[collection_name].find(query)
+        if sort:
+            cursor = cursor.sort(sort)
+        plan = cursor.explain()["queryPlanner"]["winningPlan"]
+        stages = get_stages(plan)
+        results.append(
+            {
+                "collection": collection_name,
+                "filter": query,
+                "sort": sort,
+                "stages": stages,
+                "collectionScan": "COLLSCAN" in stages,
+            }
+        )
+    return results
+
+
+def check_query_plans() -> bool:
+    """Prints the query plan of every hot query and flags the queries that scan the whole collection
+
+    :return: bool if none of the queries scans the whole collection
+    """
+    success = True
+    for result in explain_queries():
+        if result["collectionScan"]:
+            success = False
+        print(
+            "COLLSCAN" if result["collectionScan"] else "ok",
+            result["collection"],
+            result["filter"],
+            "sort:",
+            result["sort"],
+            "stages:",
+            " > ".join(result["stages"]),
+        )
+    return success
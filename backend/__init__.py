@@ -1,7 +1,8 @@
 import pymongo
 from flask import Flask, jsonify
 
-mongo_client = pymongo.MongoClient("mongodb://database:27017/")
+mongo_url = "mongodb://database:27017/"
+mongo_client = pymongo.MongoClient(mongo_url)
 db = mongo_client["APIMapping"]
 
 
@@ -22,6 +23,18 @@ def create_app():
     app.register_blueprint(connection_low_level)
     app.register_blueprint(server)
 
+    from backend import Indexes
+
+    @app.cli.command("check-indexes")
+    def check_indexes() -> None:
+        """Runs explain() on the hot queries and exits with an error if one of them scans a whole collection
+
+        Run it with: flask check-indexes
+        """
+        if not Indexes.check_query_plans():
+            raise SystemExit(1)
+
+
     @app.route("/api/state/")
     def state_checker() -> tuple:
         """Returns success if called
@@ -38,3 +51,19 @@ def create_app():
             {"ContentType": "application/json"},
         )
     return app
+
+
+def start_server() -> None:
+    """Prepares the process that serves the app, it is not done by create_app() so CLI commands do not do it
+
+    The indexes the queries rely on are created, and unless the sync runs in separate workers the sync session that
+    was running when the backend stopped is continued. Called by the entry point, see backend/__main__.py
+    """
+    from backend import Indexes
+    from backend.sync_server import SyncServer, SyncServerControl, SyncServerState
+
+    Indexes.ensure_indexes()
+    if not SyncServerControl.remote_sync:
+        SyncServer.start_log_listener()
+        SyncServerState.install_shutdown_handler()
+        SyncServerState.resume_sync_server()
@@ -0,0 +1,15 @@
+"""Entry point of the backend server, run it with: python -m backend
+
+The reloader is off, it would run the server and so the resumed sync session in a second process.
+"""
+import os
+
+from backend import create_app, start_server
+
+app = create_app()
+start_server()
+app.run(
+    host=os.environ.get("FLASK_RUN_HOST", "0.0.0.0"),
+    port=int(os.environ.get("FLASK_RUN_PORT", 5000)),
+    use_reloader=False,
+)
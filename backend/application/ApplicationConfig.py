@@ -1,17 +1,33 @@
 import json
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from http.cookiejar import DefaultCookiePolicy
+from threading import BoundedSemaphore, Lock
+from urllib.parse import urlparse
 
 import requests
+import requests.adapters
 import validators
 from bson.objectid import ObjectId
-from flask import jsonify, request, Blueprint
+from flask import jsonify, request, stream_with_context, Blueprint, Response
+from pymongo import ASCENDING
 from requests.auth import HTTPBasicAuth
 
-from backend import db
-from backend.application import clientSDK, openAPI
+from backend import db, ConfigCache, ConfigStore
+from backend.application import clientSDK, openAPI, CrawlSamples, SpecStore
 from backend.connection import ConnectionConfig
 
 application_config = Blueprint("ApplicationConfig", __name__)
 collection = db["applications"]
+# every update increments the configVersion, a running sync server uses it to reload the endpoints of the application
+# and ConfigCache uses it to validate the cached config
+
+crawl_session = None  # requests session shared by all crawls, see get_crawl_session()
+crawl_pool_hosts = 10  # number of hosts the crawl session keeps connections to
+crawl_pool_size = 10  # connections the crawl session keeps per host
+crawl_workers = 16  # endpoints that a batch crawl crawls concurrently
+crawl_host_limit = 4  # concurrent crawls per host, over all crawl requests
+host_semaphores = {}
+host_semaphores_lock = Lock()
 
 
 def get_auth(application_id: str) -> tuple[dict, str] | tuple[dict, HTTPBasicAuth]:
@@ -24,7 +40,7 @@ def get_auth(application_id: str) -> tuple[dict, str] | tuple[dict, HTTPBasicAut
     :param application_id: id of application in string format
     :return: headers, basic
     """
-    config = get_application_config(application_id, internal=True)
+    config = ConfigStore.get_auth_config(application_id)
     if "securityScheme" in config:
         if config["securityScheme"] == "ApiKeyAuth":
             return config["headerItems"], ""
@@ -62,16 +78,60 @@ def set_state(application_id: ObjectId) -> bool:
     :param application_id: id of application in OBJECT format
     :return: boolean if state is set
     """
-    config = get_application_config(str(application_id), internal=True)
-    required = ["name", "description", "baseUrl", "securityScheme", "specs", "version"]
+    required = [
+        "name",
+        "description",
+        "baseUrl",
+        "securityScheme",
+        "specsVersion",
+        "version",
+    ]
+    config = ConfigStore.get_application_fields(application_id, required)
     if all(name in config for name in required):
         update = collection.update_one(
-            {"_id": application_id}, {"$set": {"state": "Complete"}}
+            {"_id": ObjectId(application_id)},
+            {"$set": {"state": "Complete"}, "$inc": {"configVersion": 1}},
         )
+        ConfigCache.invalidate("applications", application_id)
         return update.acknowledged
     return False
 
 
+def store_specs(application_id: ObjectId, config: dict) -> bool:
+    """Returns if specs are moved from the config to the spec store
+
+    Specs are not kept in the application document, they are saved per operation by SpecStore.save_specs() and the
+    application document only holds their version in specsVersion.
+
+    :param application_id: id of application in OBJECT format
+    :param config: the application config, its specs are replaced by specsVersion
+    :return: boolean if the config contained specs
+    """
+    if "specs" not in config:
+        return False
+    config["specsVersion"] = SpecStore.save_specs(
+        str(application_id), config.pop("specs")
+    )
+    return True
+
+
+def get_specs_version(application_id: str) -> str | None:
+    """Returns the version of the specs of an application, see SpecStore.save_specs()
+
+    Only the specsVersion is read, unless the specs are still kept in the application document, then they are moved to
+    the spec store like get_application_config() does.
+
+    :param application_id: id of application in string format
+    :return: the specsVersion, None if the application has no specs
+    """
+    config = ConfigStore.get_application_fields(
+        application_id, ["specsVersion", "specs"]
+    )
+    if "specs" in config:
+        config = get_application_config(application_id, internal=True, with_specs=False)
+    return config.get("specsVersion")
+
+
 def set_sdk(application_id: ObjectId) -> bool:
     """Returns boolean if the SDK of the application is set correctly.
 
@@ -147,6 +207,8 @@ def save_application_config() -> tuple:
 
     config["state"] = "Incomplete"
     config.pop("automaticImportFile")
+    config["_id"] = ObjectId()
+    store_specs(config["_id"], config)
     response = collection.insert_one(config)
     if response.acknowledged:
         set_state(response.inserted_id)
@@ -167,45 +229,81 @@ def save_application_config() -> tuple:
 def get_application_configs(internal: bool = False) -> tuple | list:
     """Returns the configurations for all the applications in teh database
 
-    This function gets all the configs and returns it as an JSON object.
+    This function gets all the configs and returns it as an JSON object. Only the listed fields are read. A request can
+    page and sort the list with the skip, limit, sort (name, version, description or state) and order (asc or desc)
+    arguments, the total number of applications is returned with the page.
 
     :param internal: bool to change return from Flask to python dict
     :return: JSON with all the configs
     """
+    fields = ["name", "version", "description", "state"]
+    if internal:
+        skip, limit, sort = 0, 0, [("name", ASCENDING)]
+    else:
+        skip, limit, sort = ConfigStore.get_page_arguments(fields, "name")
     applications = []
-    if collection.find({}):
-        for item in collection.find({}).sort("name"):
-            applications.append(
-                {
-                    "id": str(item["_id"]),
-                    "name": item["name"],
-                    "version": item["version"],
-                    "description": item["description"],
-                    "state": item["state"],
-                }
-            )
+    for item in collection.find({}, fields).sort(sort).skip(skip).limit(limit):
+        applications.append(
+            {
+                "id": str(item["_id"]),
+                "name": item["name"],
+                "version": item["version"],
+                "description": item["description"],
+                "state": item["state"],
+            }
+        )
     if internal:
         return applications
     else:
         return (
-            jsonify({"success": True, "applications": applications}),
+            jsonify(
+                {
+                    "success": True,
+                    "applications": applications,
+                    "total": collection.count_documents({}),
+                }
+            ),
             200,
             {"ContentType": "application/json"},
         )
 
 
 @application_config.route("/api/application/<application_id>", methods=["GET"])
-def get_application_config(application_id: str, internal: bool = False) -> tuple | dict:
+def get_application_config(
+    application_id: str, internal: bool = False, with_specs: bool = True
+) -> tuple | dict:
     """Returns the application config for a specific application
 
-    This function gets the application config form the database and returns it as an JSON object.
+    This function gets the application config form the database and returns it as an JSON object. The specs are
+    loaded from the spec store, only when they are needed. Specs that are still kept in an application document are
+    moved to the spec store on the first read.
     :param internal: bool to change return from Flask to python dict
     :param application_id: id of application in string format
+    :param with_specs: bool to load the specs
     :return: An JSON object containing the config of the application
     """
     application_id = ObjectId(application_id)
-    config = collection.find_one({"_id": application_id})
+    config = ConfigCache.get_config("applications", application_id)
     if config:
+        if "specs" in config:
+            specs = config["specs"]
+            store_specs(application_id, config)
+            collection.update_one(
+                {"_id": application_id},
+                {
+                    "$set": {"specsVersion": config["specsVersion"]},
+                    "$unset": {"specs": ""},
+                    "$inc": {"configVersion": 1},
+                },
+            )
+            ConfigCache.invalidate("applications", application_id)
+            config["specs"] = specs
+        elif with_specs and "specsVersion" in config:
+            config["specs"] = SpecStore.load_specs(
+                str(application_id), config["specsVersion"]
+            )
+        if not with_specs:
+            config.pop("specs", None)
         config["id"] = str(config["_id"])
         config.pop("_id")
         if internal:
@@ -239,6 +337,8 @@ def update_application_config(
         config = request.get_json()
     if "id" in config:
         config.pop("id")
+    config.pop("configVersion", None)
+    config.pop("specsVersion", None)
     if "automaticImportFile" in config:
         if config["automaticImportFile"] != "":
             state = openAPI.get_openapi(config, specs=config["automaticImportFile"])
@@ -280,8 +380,14 @@ def update_application_config(
                     400,
                     {"ContentType": "application/json"},
                 )
-    updated = collection.update_one({"_id": application_id}, {"$set": config})
+    update = {"$set": config, "$inc": {"configVersion": 1}}
+    if store_specs(application_id, config):
+        update["$unset"] = {"specs": ""}
+    updated = collection.update_one({"_id": application_id}, update)
+    ConfigCache.invalidate("applications", application_id)
     if updated.acknowledged:
+        if "specsVersion" in config:
+            SpecStore.prune_specs(str(application_id), config["specsVersion"])
         set_state(application_id)
         if check_sdk:
             set_sdk(application_id)
@@ -305,15 +411,18 @@ def delete_application_config(application_id: str) -> tuple:
     :param application_id: id of application in string format
     :return: an JSON object if removal of the application from the database was successful
     """
-    config = get_application_config(application_id, internal=True)
+    config = ConfigStore.get_sdk_state(application_id)
     if "sdkGenerated" in config and config["sdkGenerated"]:
         if not clientSDK.delete_sdk(application_id):
             jsonify(
                 {"success": False, "message": "Deleting application's SDK failed"}
             ), 500, {"ContentType": "application/json"}
     ConnectionConfig.delete_connections_with_application(application_id)
+    CrawlSamples.delete_samples(application_id)
+    SpecStore.delete_specs(application_id)
     application_id = ObjectId(application_id)
     deleted = collection.delete_one({"_id": application_id})
+    ConfigCache.invalidate("applications", application_id)
     if deleted.acknowledged:
         return jsonify({"success": True}), 200, {"ContentType": "application/json"}
     else:
@@ -342,6 +451,7 @@ def save_application_auth(application_id: str) -> tuple:
                         "securityScheme": auth_config["securityScheme"],
                         "basicUsername": auth_config["basicUsername"],
                         "basicPassword": auth_config["basicPassword"],
+                        "configVersion": ConfigCache.increment_config_version,
                     }
                 },
                 {"$unset": ["headerItems"]},
@@ -358,6 +468,7 @@ def save_application_auth(application_id: str) -> tuple:
                         "$set": {
                             "securityScheme": auth_config["securityScheme"],
                             "headerItems": headers,
+                            "configVersion": ConfigCache.increment_config_version,
                         }
                     },
                     {"$unset": ["basicUsername", "basicPassword"]},
@@ -374,10 +485,16 @@ def save_application_auth(application_id: str) -> tuple:
         auth = collection.update_one(
             {"_id": application_id},
             [
-                {"$set": {"securityScheme": auth_config["securityScheme"]}},
+                {
+                    "$set": {
+                        "securityScheme": auth_config["securityScheme"],
+                        "configVersion": ConfigCache.increment_config_version,
+                    }
+                },
                 {"$unset": ["basicUsername", "basicPassword", "headerItems"]},
             ],
         )
+    ConfigCache.invalidate("applications", application_id)
     if auth.acknowledged:
         set_state(application_id)
         return (
@@ -393,129 +510,181 @@ def save_application_auth(application_id: str) -> tuple:
         )
 
 
+def get_crawl_session() -> requests.Session:
+    """Returns the session that is shared by all crawls
+
+    The session keeps the connections to the crawled hosts alive, so crawling several endpoints of the same API does
+    not set up a new connection for every endpoint.
+
+    :return: the shared requests session
+    """
+    global crawl_session
+    if crawl_session is None:
+        crawl_session = requests.Session()
+        # the session is shared by the crawls of all applications, so it must not send cookies of one to another
+        crawl_session.cookies.set_policy(DefaultCookiePolicy(allowed_domains=[]))
+        adapter = requests.adapters.HTTPAdapter(
+            pool_connections=crawl_pool_hosts, pool_maxsize=crawl_pool_size
+        )
+        crawl_session.mount("http://", adapter)
+        crawl_session.mount("https://", adapter)
+    return crawl_session
+
+
+def get_host_semaphore(url: str) -> BoundedSemaphore:
+    """Returns the semaphore that limits the number of concurrent crawls of the host of the url
+
+    :param url: url of an API endpoint
+    :return: semaphore of the host
+    """
+    host = urlparse(url).netloc
+    with host_semaphores_lock:
+        if host not in host_semaphores:
+            host_semaphores[host] = BoundedSemaphore(crawl_host_limit)
+        return host_semaphores[host]
+
+
+def crawl_endpoint(
+    endpoint: dict, headers: dict, auth: str | HTTPBasicAuth
+) -> tuple[dict, int]:
+    """Returns the response of a crawled API endpoint and a http status code
+
+    This function safely crawls an API endpoint with the given operation, url and requestBody, through the shared
+    crawl session and with at most crawl_host_limit concurrent crawls per host. For a GET the type of the API is found
+    from the same response, it is not called twice. The response is read streamed and rejected when it is larger than
+    maxResponseSize bytes, openAPI.max_response_size by default.
+
+    :param endpoint: dict with the operation, url, body and optionally maxResponseSize of the endpoint
+    :param headers: authentication headers, see get_auth()
+    :param auth: basic authentication object, see get_auth()
+    :return: a dict with the endpoint's response or an error message and the http status code
+    """
+    max_size = endpoint.get("maxResponseSize", None)
+    body = ""
+    if not validators.url(endpoint["url"]):
+        return {"success": False, "message": "Endpoint URL is invalid"}, 400
+    if endpoint["operation"] != "get" and endpoint["body"] != "":
+        try:
+            body = json.loads(endpoint["body"])
+        except ValueError:
+            return {"success": False, "message": "Body needs to be valid json"}, 400
+    try:
+        with get_host_semaphore(endpoint["url"]):
+            response = openAPI.read_response(
+                get_crawl_session().request(
+                    endpoint["operation"],
+                    endpoint["url"],
+                    timeout=3600,
+                    auth=auth,
+                    headers=headers,
+                    json=body,
+                    stream=True,
+                ),
+                max_size,
+            )
+    except openAPI.ResponseTooLargeError as e:
+        return {"success": False, "message": str(e)}, 413
+    except requests.exceptions.Timeout:
+        return {"success": False, "message": "Try again later"}, 500
+    except requests.exceptions.TooManyRedirects:
+        return (
+            {"success": False, "message": "Too many redirects try a different URL"},
+            500,
+        )
+    except requests.exceptions.RequestException:
+        return {"success": False, "message": "Endpoint is not reachable"}, 500
+    if endpoint["operation"] == "get":
+        valid, _ = openAPI.find_api_type_of_response(response)
+        if not valid:
+            return (
+                {"success": False, "message": "API endpoint should be either JSON or XML"},
+                400,
+            )
+    if response.text != "":
+        try:
+            response_body = response.json()
+        except json.decoder.JSONDecodeError:
+            response_body = response.text
+    elif response.ok:
+        response_body = "The server responded correctly but with an empty response"
+    else:
+        return (
+            {
+                "success": False,
+                "message": "The server responded with an error and an empty response",
+                "status": response.status_code,
+            },
+            500,
+        )
+    return (
+        {
+            "success": True,
+            "response": response_body,
+            "header": dict(response.headers),
+            "status": response.status_code,
+        },
+        200,
+    )
+
+
 @application_config.route("/api/application/endpoint/crawl/<application_id>", methods=["POST"])
 def crawl_application_endpoint(application_id: str) -> tuple:
     """Returns a response from teh crawled API endpoint
 
     This function safely crawls an API endpoint with the given operation, url and requestBody. If present in the
-    application config, an authentication header or basic authentication object is added to the request.
+    application config, an authentication header or basic authentication object is added to the request, see
+    crawl_endpoint(). The response is stored as a sample, see CrawlSamples.save_sample().
 
     :param application_id: id of application in string format
     :return: an JSON object containing the endpoint's response or an error message
     """
     endpoint = request.get_json()
     headers, auth = get_auth(application_id)  # get authentication to crawl endpoint
-    body = ""
-    if validators.url(endpoint["url"]):
-        try:
-            if endpoint["operation"] == "get":
-                valid, _ = openAPI.find_api_type(endpoint["url"])
-                if not valid:
-                    return (
-                        jsonify(
-                            {
-                                "success": False,
-                                "message": "API endpoint should be either JSON or XML",
-                            }
-                        ),
-                        400,
-                        {"ContentType": "application/json"},
-                    )
-            else:
-                if endpoint["body"] != "":
-                    try:
-                        body = json.loads(endpoint["body"])
-                    except ValueError:
-                        return (
-                            jsonify(
-                                {
-                                    "success": False,
-                                    "message": "Body needs to be valid json",
-                                }
-                            ),
-                            400,
-                            {"ContentType": "application/json"},
-                        )
-            response = requests.request(
-                endpoint["operation"],
-                endpoint["url"],
-                timeout=3600,
-                auth=auth,
-                headers=headers,
-                json=body,
-            )
-        except requests.exceptions.Timeout:
-            return (
-                jsonify({"success": False, "message": "Try again later"}),
-                500,
-                {"ContentType": "application/json"},
-            )
-        except requests.exceptions.TooManyRedirects:
-            return (
-                jsonify(
-                    {
-                        "success": False,
-                        "message": "Too many redirects try a different URL",
-                    }
-                ),
-                500,
-                {"ContentType": "application/json"},
-            )
-        except requests.exceptions.RequestException:
-            return (
-                jsonify({"success": False, "message": "Endpoint is not reachable"}),
-                500,
-                {"ContentType": "application/json"},
-            )
-        if response.text != "":
-            try:
-                response.json()
-                return (
-                    jsonify(
-                        {
-                            "success": True,
-                            "response": response.json(),
-                            "header": dict(response.headers),
-                            "status": response.status_code,
-                        }
-                    ),
-                    200,
-                    {"ContentType": "application/json"},
-                )
-            except json.decoder.JSONDecodeError:
-                return (
-                    jsonify(
-                        {
-                            "success": True,
-                            "response": response.text,
-                            "header": dict(response.headers),
-                            "status": response.status_code,
-                        }
-                    ),
-                    200,
-                    {"ContentType": "application/json"},
-                )
-        else:
-            if response.ok:
-                return (
-                    jsonify(
-                        {
-                            "success": True,
-                            "response": "The server responded correctly but with an empty response",
-                            "header": dict(response.headers),
-                            "status": response.status_code,
-                        }
-                    ),
-                    200,
-                    {"ContentType": "application/json"},
-                )
+    result, status = crawl_endpoint(endpoint, headers, auth)
+    CrawlSamples.save_sample(application_id, endpoint, result)
+    return jsonify(result), status, {"ContentType": "application/json"}
 
-    else:
+
+@application_config.route("/api/application/endpoint/crawl/batch/<application_id>", methods=["POST"])
+def crawl_application_endpoints(application_id: str) -> Response:
+    """Returns the responses of many crawled API endpoints, as newline delimited JSON
+
+    This function crawls a list of endpoints concurrently over the shared crawl session. Every line of the streamed
+    response is the result of one endpoint, see crawl_endpoint(), with the index of the endpoint in the list and its
+    http status code. The lines are sent as soon as the crawls finish, so they are not in the order of the list.
+
+    :param application_id: id of application in string format
+    :return: a streamed NDJSON response with a line per endpoint
+    """
+    endpoints = request.get_json()
+    if not isinstance(endpoints, list):
         return (
-            jsonify({"success": False, "message": "Endpoint URL is invalid"}),
+            jsonify({"success": False, "message": "A list of endpoints is required"}),
             400,
             {"ContentType": "application/json"},
         )
+    workers = max(1, request.args.get("workers", default=crawl_workers, type=int))
+    headers, auth = get_auth(application_id)  # get authentication to crawl endpoints
+
+    def crawl(index: int, endpoint: dict) -> dict:
+        try:
+            result, status = crawl_endpoint(endpoint, headers, auth)
+            CrawlSamples.save_sample(application_id, endpoint, result)
+        except (KeyError, TypeError):
+            result = {"success": False, "message": "Endpoint definition is invalid"}
+            status = 400
+        return dict(result, index=index, code=status)
+
+    def generate() -> str:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = [
+                executor.submit(crawl, index, endpoint)
+                for index, endpoint in enumerate(endpoints)
+            ]
+            for future in as_completed(futures):
+                yield json.dumps(future.result(), default=str) + "\n"
+
+    return Response(stream_with_context(generate()), mimetype="application/x-ndjson")
 
 
 @application_config.route("/api/application/endpoint/spec/<application_id>", methods=["POST"])
@@ -605,7 +774,7 @@ def generate_sdk(application_id: str) -> tuple:
     :param application_id: id of application in string format
     :return: bool if generation of the sdk was successful
     """
-    config = get_application_config(application_id, internal=True)
+    config = ConfigStore.get_sdk_state(application_id)
 
     if "sdkGenerated" in config and config["sdkGenerated"]:
         if clientSDK.update_sdk(application_id):
@@ -0,0 +1,456 @@
+import hashlib
+import json
+import zlib
+from datetime import datetime
+
+from bson.binary import Binary
+from bson.errors import InvalidId
+from bson.objectid import ObjectId
+from flask import jsonify, request, Blueprint
+from pymongo import DESCENDING
+
+from backend import db
+from backend.application import ApplicationConfig, openAPI
+
+crawl_samples = Blueprint("CrawlSamples", __name__)
+collection = db["samples"]
+schemas = db["sample_schemas"]  # per endpoint the state of the schema that is merged from all its samples
+sample_retention = 10  # distinct samples that are kept per endpoint, the least recently seen are removed first
+
+
+def get_sample_hash(response: any, status: int) -> str:
+    """Returns the content address of a crawled response
+
+    The response is serialized with sorted keys, so the same body always gets the same hash.
+
+    :param response: the body of the crawled response
+    :param status: the http status code of the crawled response
+    :return: sha256 of the response as a hex string
+    """
+    canonical = json.dumps(
+        {"status": status, "response": response},
+        sort_keys=True,
+        separators=(",", ":"),
+        default=str,
+    )
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+def save_sample(application_id: str, endpoint: dict, result: dict) -> None:
+    """Saves the response of a crawled endpoint as a sample
+
+    Samples are content addressed per endpoint, crawling the same response again only updates when it was last seen.
+    The body is stored compressed and only the latest sample_retention distinct samples of an endpoint are kept.
+
+    :param application_id: id of application in string format
+    :param endpoint: the crawled endpoint, endpointUrl is the url without the parameter values the frontend filled in
+    :param result: the result of the crawl, see ApplicationConfig.crawl_endpoint()
+    """
+    if not result.get("success") or "response" not in result:
+        return
+    url = endpoint.get("endpointUrl", endpoint["url"])
+    sample_hash = get_sample_hash(result["response"], result["status"])
+    body = json.dumps(result["response"], default=str).encode("utf-8")
+    now = datetime.utcnow()
+    query = {
+        "applicationId": application_id,
+        "operation": endpoint["operation"],
+        "url": url,
+    }
+    saved = collection.update_one(
+        dict(query, hash=sample_hash),
+        {
+            "$set": {"header": result["header"], "lastSeen": now},
+            "$inc": {"seen": 1},
+            "$setOnInsert": {
+                "crawledUrl": endpoint["url"],
+                "status": result["status"],
+                "body": Binary(zlib.compress(body)),
+                "size": len(body),
+                "createdAt": now,
+            },
+        },
+        upsert=True,
+    )
+    if saved.upserted_id is not None:
+        update_schema(application_id, endpoint["operation"], url, [result["response"]])
+        expired = [
+            sample["_id"]
+            for sample in collection.find(query, {"_id": 1})
+            .sort("lastSeen", DESCENDING)
+            .skip(sample_retention)
+        ]
+        if expired:
+            collection.delete_many({"_id": {"$in": expired}})
+
+
+def load_sample(sample: dict) -> dict:
+    """Returns a sample with its body decompressed, in the format of a crawl result
+
+    :param sample: a sample document from the DB
+    :return: the sample with the response, header and status of the crawl
+    """
+    sample["_id"] = str(sample["_id"])
+    sample["response"] = json.loads(zlib.decompress(sample.pop("body")))
+    return sample
+
+
+def get_latest_sample(application_id: str, operation: str, url: str) -> dict | None:
+    """Returns the most recently seen sample of an endpoint
+
+    :param application_id: id of application in string format
+    :param operation: the http operation of the endpoint, for example get
+    :param url: the url of the endpoint
+    :return: the sample with its body decompressed, None if the endpoint has no samples
+    """
+    sample = collection.find_one(
+        {"applicationId": application_id, "operation": operation, "url": url},
+        sort=[("lastSeen", DESCENDING)],
+    )
+    if sample is None:
+        return None
+    return load_sample(sample)
+
+
+def refresh_endpoints(application_id: str, endpoints: list) -> tuple[list, int]:
+    """Returns the endpoints with the response, header and status of their latest sample
+
+    :param application_id: id of application in string format
+    :param endpoints: endpoint definitions, as saved in endpointsBackup
+    :return: the refreshed endpoints and the number of endpoints that had a sample
+    """
+    refreshed = []
+    found = 0
+    for endpoint in endpoints:
+        sample = get_latest_sample(
+            application_id, endpoint["operation"], endpoint["url"]
+        )
+        if sample is not None:
+            endpoint = dict(
+                endpoint,
+                response=sample["response"],
+                header=sample["header"],
+                status=sample["status"],
+            )
+            found += 1
+        refreshed.append(endpoint)
+    return refreshed, found
+
+
+def update_schema(application_id: str, operation: str, url: str, samples: iter) -> dict:
+    """Merges samples into the schema of an endpoint, the schema continues from its saved state
+
+    :param application_id: id of application in string format
+    :param operation: the http operation of the endpoint, for example get
+    :param url: the url of the endpoint
+    :param samples: iterable of bodies, they are merged one at a time
+    :return: the state of the schema, see openAPI.SchemaBuilder.get_state()
+    """
+    query = {"applicationId": application_id, "operation": operation, "url": url}
+    builder = load_schema(query)
+    for sample in samples:
+        builder.add_object(sample)
+    save_schema(query, builder)
+    return builder.get_state()
+
+
+def load_schema(query: dict) -> openAPI.SchemaBuilder:
+    """Returns a schema builder that continues with the saved schema of an endpoint
+
+    :param query: the applicationId, operation and url of the endpoint
+    :return: the schema builder, a new builder if the endpoint has no saved schema
+    """
+    saved = schemas.find_one(query, {"state": 1})
+    if saved is None:
+        return openAPI.load_schema_builder()
+    return openAPI.load_schema_builder(json.loads(zlib.decompress(saved["state"])))
+
+
+def save_schema(query: dict, builder: openAPI.SchemaBuilder) -> None:
+    """Saves the state of the schema of an endpoint, compressed because property names can be any string
+
+    :param query: the applicationId, operation and url of the endpoint
+    :param builder: the schema builder of the endpoint
+    """
+    state = json.dumps(builder.get_state()).encode("utf-8")
+    schemas.update_one(
+        query,
+        {
+            "$set": {
+                "state": Binary(zlib.compress(state)),
+                "samples": builder.samples,
+                "updatedAt": datetime.utcnow(),
+            }
+        },
+        upsert=True,
+    )
+
+
+def diff_schemas(old: dict, new: dict, path: str = "") -> list:
+    """Returns the differences between two JSON schemas
+
+    :param old: schema of the older sample, see openAPI.generate_schema()
+    :param new: schema of the newer sample
+    :param path: path of the schemas in the body, for example items.address
+    :return: list of differences, each with the path, the change and the old and new type
+    """
+    differences = []
+    if old.get("type") != new.get("type"):
+        differences.append(
+            {
+                "path": path,
+                "change": "type",
+                "old": old.get("type"),
+                "new": new.get("type"),
+            }
+        )
+    old_properties = old.get("properties", {})
+    new_properties = new.get("properties", {})
+    for key in sorted(old_properties.keys() | new_properties.keys()):
+        key_path = path + "." + key if path else key
+        if key not in new_properties:
+            differences.append(
+                {
+                    "path": key_path,
+                    "change": "removed",
+                    "old": old_properties[key].get("type"),
+                    "new": None,
+                }
+            )
+        elif key not in old_properties:
+            differences.append(
+                {
+                    "path": key_path,
+                    "change": "added",
+                    "old": None,
+                    "new": new_properties[key].get("type"),
+                }
+            )
+        else:
+            differences += diff_schemas(
+                old_properties[key], new_properties[key], key_path
+            )
+    if isinstance(old.get("items"), dict) and isinstance(new.get("items"), dict):
+        differences += diff_schemas(
+            old["items"], new["items"], path + "[]" if path else "[]"
+        )
+    return differences
+
+
+@crawl_samples.route("/api/application/samples/<application_id>", methods=["GET"])
+def get_samples(application_id: str) -> tuple:
+    """Returns the samples of an application without their bodies
+
+    The samples can be filtered on an endpoint with the url and operation arguments.
+
+    :param application_id: id of application in string format
+    :return: JSON object with the samples, the most recently seen first
+    """
+    query = {"applicationId": application_id}
+    if request.args.get("url", default=None, type=str) is not None:
+        query["url"] = request.args.get("url", type=str)
+    if request.args.get("operation", default=None, type=str) is not None:
+        query["operation"] = request.args.get("operation", type=str)
+    samples = []
+    for sample in collection.find(query, {"body": 0}).sort("lastSeen", DESCENDING):
+        sample["_id"] = str(sample["_id"])
+        samples.append(sample)
+    return (
+        jsonify({"success": True, "samples": samples}),
+        200,
+        {"ContentType": "application/json"},
+    )
+
+
+@crawl_samples.route("/api/application/sample/<application_id>/<sample_id>", methods=["GET"])
+def get_sample(application_id: str, sample_id: str) -> tuple:
+    """Returns a sample with its body
+
+    :param application_id: id of application in string format
+    :param sample_id: id of the sample in string format
+    :return: JSON object with the sample or an error message
+    """
+    try:
+        sample = collection.find_one(
+            {"_id": ObjectId(sample_id), "applicationId": application_id}
+        )
+    except InvalidId:
+        sample = None
+    if sample is None:
+        return (
+            jsonify({"success": False, "message": "Sample not found"}),
+            404,
+            {"ContentType": "application/json"},
+        )
+    return (
+        jsonify({"success": True, "sample": load_sample(sample)}),
+        200,
+        {"ContentType": "application/json"},
+    )
+
+
+@crawl_samples.route("/api/application/samples/regenerate/<application_id>", methods=["POST"])
+def regenerate_specs(application_id: str) -> tuple:
+    """Returns the OpenAPI specs that are regenerated from the stored samples
+
+    This function uses the latest sample of every saved endpoint as its response and example, so the schemas are
+    regenerated without calling the APIs again. With save the specs and endpoints are saved, like save_endpoints does,
+    otherwise they are only returned.
+
+    :param application_id: id of application in string format
+    :return: JSON object with the specs and the number of endpoints that had a sample, or an error message
+    """
+    config = ApplicationConfig.get_application_config(application_id, internal=True)
+    if not config.get("endpointsBackup"):
+        return (
+            jsonify({"success": False, "message": "The application has no saved endpoints"}),
+            400,
+            {"ContentType": "application/json"},
+        )
+    endpoints, found = refresh_endpoints(application_id, config["endpointsBackup"])
+    if not openAPI.generate_openapi(config, {"endpoints": endpoints}):
+        return (
+            jsonify(
+                {
+                    "success": False,
+                    "message": "There was an error during the parsing of endpoints",
+                }
+            ),
+            500,
+            {"ContentType": "application/json"},
+        )
+    if request.args.get("save", default=False, type=bool):
+        config["endpointsBackup"] = endpoints
+        updated, _, _ = ApplicationConfig.update_application_config(
+            application_id, config
+        )
+        if not updated.get_json()["success"]:
+            return (
+                jsonify(
+                    {
+                        "success": False,
+                        "message": "There was an error during the saving of the endpoints",
+                    }
+                ),
+                500,
+                {"ContentType": "application/json"},
+            )
+    return (
+        jsonify({"success": True, "specs": config["specs"], "sampled": found}),
+        200,
+        {"ContentType": "application/json"},
+    )
+
+
+@crawl_samples.route("/api/application/samples/diff/<application_id>", methods=["GET"])
+def diff_samples(application_id: str) -> tuple:
+    """Returns the schema differences between two samples of an endpoint
+
+    The samples are given with the from and to arguments, by default the two most recently seen samples of the endpoint
+    given with the url and operation arguments are compared.
+
+    :param application_id: id of application in string format
+    :return: JSON object with the differences, or an error message
+    """
+    args = request.args
+    try:
+        if args.get("from", default=None, type=str) and args.get(
+            "to", default=None, type=str
+        ):
+            samples = [
+                collection.find_one(
+                    {
+                        "_id": ObjectId(args.get(key, type=str)),
+                        "applicationId": application_id,
+                    }
+                )
+                for key in ["from", "to"]
+            ]
+        else:
+            samples = list(
+                collection.find(
+                    {
+                        "applicationId": application_id,
+                        "url": args.get("url", default=None, type=str),
+                        "operation": args.get("operation", default="get", type=str),
+                    }
+                )
+                .sort("lastSeen", DESCENDING)
+                .limit(2)
+            )[::-1]
+    except InvalidId:
+        samples = []
+    if len(samples) != 2 or None in samples:
+        return (
+            jsonify({"success": False, "message": "Two samples are needed to compare"}),
+            404,
+            {"ContentType": "application/json"},
+        )
+    old, new = [load_sample(sample) for sample in samples]
+    return (
+        jsonify(
+            {
+                "success": True,
+                "from": old["_id"],
+                "to": new["_id"],
+                "differences": diff_schemas(
+                    openAPI.generate_schema(old["response"]),
+                    openAPI.generate_schema(new["response"]),
+                ),
+            }
+        ),
+        200,
+        {"ContentType": "application/json"},
+    )
+
+
+@crawl_samples.route("/api/application/samples/schema/<application_id>", methods=["GET", "POST"])
+def merge_samples(application_id: str) -> tuple:
+    """Returns the schema that is merged from all samples of an endpoint
+
+    The endpoint is given with the url and operation arguments. A POST merges the newline delimited JSON of its body
+    into the schema first, the body is read and merged one line at a time so large dumps can be merged. With reset the
+    schema starts over instead of continuing from its saved state.
+
+    :param application_id: id of application in string format
+    :return: JSON object with the OpenAPI schema and the number of merged samples, or an error message
+    """
+    args = request.args
+    url = args.get("url", default=None, type=str)
+    operation = args.get("operation", default="get", type=str)
+    if url is None:
+        return (
+            jsonify({"success": False, "message": "The url of the endpoint is required"}),
+            400,
+            {"ContentType": "application/json"},
+        )
+    query = {"applicationId": application_id, "operation": operation, "url": url}
+    if args.get("reset", default=False, type=bool):
+        schemas.delete_one(query)
+    builder = load_schema(query)
+    if request.method == "POST":
+        try:
+            openAPI.add_ndjson(builder, request.stream)
+        except ValueError:
+            return (
+                jsonify({"success": False, "message": "Body needs to be valid NDJSON"}),
+                400,
+                {"ContentType": "application/json"},
+            )
+        save_schema(query, builder)
+    return (
+        jsonify(
+            {"success": True, "schema": builder.to_schema(), "samples": builder.samples}
+        ),
+        200,
+        {"ContentType": "application/json"},
+    )
+
+
+def delete_samples(application_id: str) -> None:
+    """Deletes all samples of an application
+
+    :param application_id: id of application in string format
+    """
+    collection.delete_many({"applicationId": application_id})
+    schemas.delete_many({"applicationId": application_id})
@@ -0,0 +1,185 @@
+import hashlib
+import json
+import zlib
+
+from bson.binary import Binary
+from pymongo import ASCENDING
+
+from backend import db
+from backend.application import openAPI
+
+# per application and specs version a root document, the specs without their operations, and a document per operation
+collection = db["specs"]
+operations = ["get", "put", "post", "delete", "options", "head", "patch", "trace"]
+
+
+def compress(data: any) -> Binary:
+    """Returns a part of the specs compressed, compressed JSON can hold any key and keeps the documents small
+
+    :param data: part of the specs
+    :return: zlib compressed JSON
+    """
+    return Binary(zlib.compress(json.dumps(data, default=str).encode("utf-8")))
+
+
+def decompress(data: bytes) -> any:
+    """Returns a part of the specs that is stored compressed
+
+    :param data: zlib compressed JSON, see compress()
+    :return: part of the specs
+    """
+    return json.loads(zlib.decompress(data))
+
+
+def get_specs_version(specs: dict) -> str:
+    """Returns the version hash of specs, equal specs have the same version
+
+    :param specs: the complete OpenAPI specification
+    :return: sha256 of the canonical JSON of the specs as a hex string
+    """
+    return hashlib.sha256(openAPI.get_spec_string(specs).encode("utf-8")).hexdigest()
+
+
+def save_specs(application_id: str, specs: dict) -> str:
+    """Saves the specs of an application as a root document and a document per operation
+
+    Specs that are already saved with the same version are not written again. The root document is written last, it
+    marks the version as complete, so operations left by an interrupted save are replaced. The documents of other
+    versions stay until prune_specs() is called, so readers of the previous version are not interrupted.
+
+    :param application_id: id of application in string format
+    :param specs: the complete OpenAPI specification
+    :return: the version of the specs, to save as specsVersion in the application config
+    """
+    specs_version = get_specs_version(specs)
+    query = {"applicationId": application_id, "specsVersion": specs_version}
+    if collection.find_one(dict(query, type="root"), {"_id": 1}) is not None:
+        return specs_version
+    root = dict(specs, paths={})
+    documents = []
+    for path, path_item in specs.get("paths", {}).items():
+        root["paths"][path] = {}
+        for key, value in path_item.items():
+            if key in operations:
+                documents.append(
+                    dict(
+                        query,
+                        type="operation",
+                        path=path,
+                        operation=key,
+                        servers=value.get("servers", []),
+                        data=compress(value),
+                    )
+                )
+            else:  # path level fields, for example parameters
+                root["paths"][path][key] = value
+    collection.delete_many(dict(query, type="operation"))  # left by an interrupted save
+    if documents:
+        collection.insert_many(documents)
+    collection.insert_one(dict(query, type="root", data=compress(root)))
+    return specs_version
+
+
+def prune_specs(application_id: str, specs_version: str) -> None:
+    """Deletes the documents of all other versions of the specs of an application
+
+    :param application_id: id of application in string format
+    :param specs_version: the version that is kept
+    """
+    collection.delete_many(
+        {"applicationId": application_id, "specsVersion": {"$ne": specs_version}}
+    )
+
+
+def delete_specs(application_id: str) -> None:
+    """Deletes all specs of an application
+
+    :param application_id: id of application in string format
+    """
+    collection.delete_many({"applicationId": application_id})
+
+
+def load_root(application_id: str, specs_version: str) -> dict:
+    """Returns the specs without their operations, the paths only contain their path level fields
+
+    :param application_id: id of application in string format
+    :param specs_version: the version of the specs
+    :return: the root of the specs, an empty dict if the specs are not found
+    """
+    root = collection.find_one(
+        {"applicationId": application_id, "specsVersion": specs_version, "type": "root"}
+    )
+    if root is None:
+        return {}
+    return decompress(root["data"])
+
+
+def load_specs(application_id: str, specs_version: str) -> dict:
+    """Returns the complete specs of an application
+
+    :param application_id: id of application in string format
+    :param specs_version: the version of the specs
+    :return: the complete OpenAPI specification, an empty dict if the specs are not found
+    """
+    specs = load_root(application_id, specs_version)
+    if not specs:
+        return {}
+    for document in collection.find(
+        {
+            "applicationId": application_id,
+            "specsVersion": specs_version,
+            "type": "operation",
+        },
+        {"path": 1, "operation": 1, "data": 1},
+    ).sort("_id", ASCENDING):
+        specs["paths"].setdefault(document["path"], {})[
+            document["operation"]
+        ] = decompress(document["data"])
+    return specs
+
+
+def load_operation(
+    application_id: str, specs_version: str, path: str, operation: str
+) -> dict:
+    """Returns a single operation of the specs of an application, without loading the other operations
+
+    :param application_id: id of application in string format
+    :param specs_version: the version of the specs
+    :param path: the path of the operation, for example /users/{id}
+    :param operation: the http operation, for example get
+    :return: the operation, a KeyError is raised if it does not exist
+    """
+    document = collection.find_one(
+        {
+            "applicationId": application_id,
+            "specsVersion": specs_version,
+            "type": "operation",
+            "path": path,
+            "operation": operation,
+        },
+        {"data": 1},
+    )
+    if document is None:
+        raise KeyError(path + " " + operation)
+    return decompress(document["data"])
+
+
+def load_paths(application_id: str, specs_version: str) -> dict:
+    """Returns the paths of the specs of an application with only the servers of their operations
+
+    :param application_id: id of application in string format
+    :param specs_version: the version of the specs
+    :return: the paths section of the specs, every operation only has its servers
+    """
+    paths = {}
+    for document in collection.find(
+        {
+            "applicationId": application_id,
+            "specsVersion": specs_version,
+            "type": "operation",
+        },
+        {"path": 1, "operation": 1, "servers": 1},
+    ).sort("_id", ASCENDING):
+        operation = {"servers": document["servers"]} if document["servers"] else {}
+        paths.setdefault(document["path"], {})[document["operation"]] = operation
+    return paths
@@ -1,6 +1,8 @@
 from flask import Blueprint
 
 from backend.application.ApplicationConfig import application_config
+from backend.application.CrawlSamples import crawl_samples
 
 application = Blueprint("Application", __name__)
-application.register_blueprint(application_config)
\ No newline at end of file
+application.register_blueprint(application_config)
+application.register_blueprint(crawl_samples)
\ No newline at end of file
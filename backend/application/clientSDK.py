@@ -8,6 +8,7 @@ import zipfile
 
 import requests
 
+from backend import ConfigStore
 from backend.application import ApplicationConfig
 
 
@@ -61,12 +62,10 @@ def generate_sdk(application_id: str) -> bool:
         finally:
             sdk_client.close()
             tmp.close()
-            config["sdkGenerated"] = True
-            config["sdkId"] = sdk_id
-            config.pop("automaticImportURL", None)
-            config.pop("automaticImportFile", None)
             updated, _, _ = ApplicationConfig.update_application_config(
-                application_id, config, check_sdk=False
+                application_id,
+                {"sdkGenerated": True, "sdkId": sdk_id},
+                check_sdk=False,
             )
             if updated.get_json()["success"]:
                 return True
@@ -86,15 +85,14 @@ def delete_sdk(application_id: str) -> bool:
     :param application_id: unique identifier fo an application
     :return: bool if deletion of the sdk was successful
     """
-    config = ApplicationConfig.get_application_config(application_id, internal=True)
+    config = ConfigStore.get_sdk_state(application_id)
     sdk_path = "backend/generated_clients/" + config["sdkId"]
     if "sdkGenerated" in config and config["sdkGenerated"]:
         try:
             shutil.rmtree(sdk_path)
             # os.remove(sdk_path + "_README.md")
-            config["sdkGenerated"] = False
             updated, _, _ = ApplicationConfig.update_application_config(
-                application_id, config, check_sdk=False
+                application_id, {"sdkGenerated": False}, check_sdk=False
             )
             if updated.get_json()["success"]:
                 return True
@@ -115,7 +113,7 @@ def update_sdk(application_id: str) -> bool:
     :param application_id: unique identifier fo an application
     :return: bool if update of the sdk was successful
     """
-    config = ApplicationConfig.get_application_config(application_id, internal=True)
+    config = ConfigStore.get_sdk_state(application_id)
     if "sdkGenerated" in config:
         if config["sdkGenerated"]:
             if not delete_sdk(application_id):
@@ -137,7 +135,7 @@ def double_check_sdk(application_id: str) -> bool:
     :param application_id: unique identifier fo an application
     :return: bool if deletion of the sdk was successful
     """
-    config = ApplicationConfig.get_application_config(application_id, internal=True)
+    config = ConfigStore.get_sdk_state(application_id)
     if "sdkGenerated" in config:
         if config["sdkGenerated"]:
             sdk_path = "backend/generated_clients/" + config["sdkId"]
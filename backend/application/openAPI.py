@@ -1,16 +1,73 @@
+import hashlib
 import json
+import os
 import uuid
+import zlib
+from collections import OrderedDict
+from copy import deepcopy
+from threading import Lock
+from urllib.parse import unquote
 
 import genson
+import genson.schema.strategies
 import prance.util.formats
 import requests
 import requests.structures
+from bson.binary import Binary
 from prance import BaseParser, ResolvingParser, ValidationError, convert
+from prance.util.resolver import RESOLVE_FILES, RESOLVE_HTTP
+from pymongo.errors import PyMongoError
+
+from backend import db
 
 
 # OpenAPI generation
 # main function: generate_openapi()
 
+# bytes of a crawled response body that are read at most, after decompression
+max_response_size = int(os.environ.get("MAX_CRAWL_RESPONSE_SIZE", 50 * 1024 * 1024))
+spec_cache = db["spec_cache"]  # parsed, validated and converted specs by the hash of the spec they were parsed from
+parsed_specs = OrderedDict()  # the most recently used entries of the spec cache, in this process
+parsed_specs_size = 32
+parsed_specs_lock = Lock()
+uuid_pattern = "^[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12}$"
+
+
+class ResponseTooLargeError(requests.exceptions.RequestException):
+    """The body of a crawled response is larger than the maximum response size"""
+
+
+def read_response(response: requests.Response, max_size: int = None) -> requests.Response:
+    """Returns the response after reading its body, for a request that is sent with stream=True
+
+    The body is read in chunks and decompressed on the fly, so a huge body is rejected without buffering it. requests
+    negotiates gzip and deflate, and brotli if it is installed, and decodes the chunks transparently.
+
+    :param response: streamed response of a called API
+    :param max_size: maximum size of the body in bytes, None for max_response_size and 0 for no limit
+    :return: the response, with its body read
+    """
+    if max_size is None:
+        max_size = max_response_size
+    content_length = response.headers.get("Content-Length", "")
+    try:
+        if max_size and content_length.isdigit() and int(content_length) > max_size:
+            raise ResponseTooLargeError(
+                "Response is larger than " + str(max_size) + " bytes", response=response
+            )
+        body = bytearray()
+        for chunk in response.iter_content(chunk_size=64 * 1024):
+            body += chunk
+            if max_size and len(body) > max_size:
+                raise ResponseTooLargeError(
+                    "Response is larger than " + str(max_size) + " bytes",
+                    response=response,
+                )
+        response._content = bytes(body)  # response.text and response.json() use the read body
+    finally:
+        response.close()
+    return response
+
 
 def find_api_type_without_header(response: requests.Response):
     """Returns False if API type is not found, true and the type if type is found
@@ -80,17 +137,31 @@ def find_api_type_with_header(
         return find_api_type_without_header(response)
 
 
-def find_api_type(url: str) -> tuple[bool, str]:
+def find_api_type(url: str, max_size: int = None) -> tuple[bool, str]:
     """Returns if API type is found and if found it returns either XML or JSON
 
     This function tries to find the type of API that is given it in the url. It decides to try to find the type by
     looking at the header. If the header is not set correctly it will switch to a body based type finder.
 
     :param url: string of the url of API endpoint
+    :param max_size: maximum size of the body in bytes, see read_response()
+    :return: boolean if type is found and type if found
+    """
+    return find_api_type_of_response(
+        read_response(requests.get(url, stream=True), max_size)
+    )
+
+
+def find_api_type_of_response(response: requests.Response) -> tuple[bool, str]:
+    """Returns if API type is found and if found it returns either XML or JSON
+
+    This function finds the type of API of a response that is already received, so a crawled endpoint does not have
+    to be called a second time to find its type.
+
+    :param response: response of a called API, with its body read
     :return: boolean if type is found and type if found
     """
-    response = requests.get(url)
-    if 200 <= response.status_code < 300:
+    if 200 <= response.status_code < 300 and response.text != "":
         header = response.headers
         if "Content-Type" in header or "content-type" in header:
             return find_api_type_with_header(header, response)
@@ -106,7 +177,8 @@ def parse_openapi(
     """Returns if the given OpenAPI specification is valid and could be parsed, if parsable it returns the parsed specs
 
     This function tries to parse the given OpenAPI document. The document can be delivered either as an url or as a
-    dict.
+    dict. Without deref the $refs to components within the document are kept, see dereference(), only the $refs to
+    other files are resolved so the specs are complete.
 
     :param deref: bool to dereference the parsed openapi specs
     :param url: url to download the spec file from
@@ -118,15 +190,21 @@ def parse_openapi(
             if deref:
                 return True, ResolvingParser(url, backend="openapi-spec-validator")
             else:
-                return True, BaseParser(url, backend="openapi-spec-validator")
+                return True, ResolvingParser(
+                    url,
+                    backend="openapi-spec-validator",
+                    resolve_types=RESOLVE_HTTP | RESOLVE_FILES,
+                )
         elif specs is not None:
             if deref:
                 return True, ResolvingParser(
-                    spec_string=str(specs), backend="openapi-spec-validator"
+                    spec_string=get_spec_string(specs),
+                    backend="openapi-spec-validator",
                 )
             else:
                 return True, BaseParser(
-                    spec_string=str(specs), backend="openapi-spec-validator"
+                    spec_string=get_spec_string(specs),
+                    backend="openapi-spec-validator",
                 )
         else:
             return False, ""
@@ -141,14 +219,104 @@ def parse_openapi(
         return False, ""
 
 
-def get_openapi(config: dict, url: str = None, specs: dict = None, deref: bool = True):
+def get_spec_string(specs: dict | str) -> str:
+    """Returns the specs as a string for prance
+
+    A dict is serialized as JSON with sorted keys, which prance parses directly and which is the same for equal specs.
+    A string is the content of a spec file, JSON or YAML, and is returned as it is.
+
+    :param specs: specs as a local dict or the content of a spec file
+    :return: the specs as a string
+    """
+    if isinstance(specs, str):
+        return specs
+    return json.dumps(specs, sort_keys=True, separators=(",", ":"), default=str)
+
+
+def parse_specs(specs: dict | str, deref: bool = True) -> tuple[bool, bool, dict]:
+    """Returns if the given specs are valid, if they were converted from OpenAPI 2.0 and the parsed specs
+
+    This function caches the result of parse_openapi() and convert_spec() by the sha256 of the spec string, so parsing
+    and validating the same specs again is almost free. The cache is kept in this process for the most recently used
+    specs and compressed in the spec_cache collection for all valid specs. Invalid specs are only cached in this process,
+    the error can also be caused by an external $ref that could not be downloaded.
+
+    :param specs: specs as a local dict or the content of a spec file
+    :param deref: bool to dereference the parsed openapi specs
+    :return: boolean if the specs are valid, boolean if they were converted and the parsed specs
+    """
+    spec_string = get_spec_string(specs)
+    spec_hash = hashlib.sha256(
+        (("deref:" if deref else "raw:") + spec_string).encode("utf-8")
+    ).hexdigest()
+    with parsed_specs_lock:
+        result = parsed_specs.get(spec_hash)
+        if result is not None:
+            parsed_specs.move_to_end(spec_hash)
+    if result is not None:
+        return result[0], result[1], deepcopy(result[2])
+    try:
+        cached = spec_cache.find_one({"_id": spec_hash})
+    except PyMongoError:
+        cached = None
+    if cached is not None:
+        result = (
+            True,
+            cached["converted"],
+            json.loads(zlib.decompress(cached["specification"])),
+        )
+    else:
+        result = parse_uncached_specs(spec_string, deref)
+        if result[0]:
+            try:
+                spec_cache.replace_one(
+                    {"_id": spec_hash},
+                    {
+                        "converted": result[1],
+                        "specification": Binary(
+                            zlib.compress(
+                                json.dumps(result[2], default=str).encode("utf-8")
+                            )
+                        ),
+                    },
+                    upsert=True,
+                )
+            except PyMongoError as e:  # for example a spec that is too large for a document
+                print("Spec cache error:", e)
+    with parsed_specs_lock:
+        parsed_specs[spec_hash] = result
+        if len(parsed_specs) > parsed_specs_size:
+            parsed_specs.popitem(last=False)
+    return result[0], result[1], deepcopy(result[2])
+
+
+def parse_uncached_specs(spec_string: str, deref: bool) -> tuple[bool, bool, dict]:
+    """Returns if the given specs are valid, if they were converted from OpenAPI 2.0 and the parsed specs
+
+    :param spec_string: the specs as a string, see get_spec_string()
+    :param deref: bool to dereference the parsed openapi specs
+    :return: boolean if the specs are valid, boolean if they were converted and the parsed specs
+    """
+    state, parser = parse_openapi(specs=spec_string, deref=deref)
+    if not state:
+        return False, False, {}
+    if "swagger" in parser.specification:
+        try:
+            return True, True, convert.convert_spec(parser).specification
+        except convert.ConversionError as e:
+            print("Conversion Error:", e)
+            return False, False, {}
+    return True, False, parser.specification
+
+
+def get_openapi(config: dict, url: str = None, specs: dict = None, deref: bool = False):
     """Returns OpenAPI specs that are downloaded
 
         This function downloads the OpenAPI file and converts it from OpenAPI 2.0 to 3.0 (3.1) if necessary.
         The specs are put in tn the config dict.
     .
 
-        :param deref: bool to dereference the openapi specs
+        :param deref: bool to dereference the openapi specs, by default the specs are kept compact with their $refs
         :param specs: openapi specs that need parsing
         :param url: url of the specs to be downloaded
         :param config: the complete configuration for the API in question
@@ -157,7 +325,13 @@ def get_openapi(config: dict, url: str = None, specs: dict = None, deref: bool =
     if url is not None:
         state, parser = parse_openapi(url=url, deref=deref)
     elif specs is not None:
-        state, parser = parse_openapi(specs=specs, deref=deref)
+        state, converted, specification = parse_specs(specs, deref)
+        if state:
+            config["converted"] = converted
+            config["specs"] = specification
+            return True
+        print("There was an error generating the openapi document")
+        return False
     else:
         return False
     if state:
@@ -179,6 +353,74 @@ def get_openapi(config: dict, url: str = None, specs: dict = None, deref: bool =
         return False
 
 
+def resolve_ref(specs: dict, ref: str) -> any:
+    """Returns the part of the specs a local $ref points to, for example #/components/schemas/User
+
+    :param specs: the complete OpenAPI specification
+    :param ref: the value of the $ref
+    :return: the referenced part of the specs, not dereferenced itself
+    """
+    node = specs
+    for token in unquote(ref[2:]).split("/"):
+        token = token.replace("~1", "/").replace("~0", "~")
+        node = node[int(token)] if isinstance(node, list) else node[token]
+    return node
+
+
+def dereference(
+    specs: dict, node: any, resolved: dict = None, stack: tuple = ()
+) -> any:
+    """Returns a part of the specs with its $refs replaced by what they point to
+
+    Specs are stored with their $refs, dereferencing the whole specs copies every shared component to every place it is
+    used. This function only dereferences the part that is needed, for example one operation. Every component is
+    dereferenced once, the result is memoized in resolved and shared by every place that uses it, so pass the same dict
+    to dereference several parts of the same specs. A component that refers to itself is replaced by an object schema
+    the second time.
+
+    :param specs: the complete OpenAPI specification
+    :param node: the part of the specs to dereference
+    :param resolved: memo of dereferenced components by their $ref
+    :param stack: the $refs that are being dereferenced, to detect recursion
+    :return: the dereferenced part of the specs
+    """
+    if resolved is None:
+        resolved = {}
+    if isinstance(node, list):
+        return [dereference(specs, item, resolved, stack) for item in node]
+    if not isinstance(node, dict):
+        return node
+    ref = node.get("$ref")
+    if isinstance(ref, str) and ref.startswith("#/"):
+        if ref in resolved:
+            return resolved[ref]
+        if ref in stack:
+            return {"type": "object", "description": "Recursive reference to " + ref}
+        try:
+            target = resolve_ref(specs, ref)
+        except (KeyError, IndexError, ValueError, TypeError):
+            return node  # a broken $ref is kept as it is
+        resolved[ref] = dereference(specs, target, resolved, stack + (ref,))
+        return resolved[ref]
+    return {
+        key: dereference(specs, value, resolved, stack) for key, value in node.items()
+    }
+
+
+def get_operation(
+    specs: dict, path: str, operation: str, resolved: dict = None
+) -> dict:
+    """Returns an operation of the specs with its $refs dereferenced
+
+    :param specs: the complete OpenAPI specification
+    :param path: the path of the operation, for example /users/{id}
+    :param operation: the http operation, for example get
+    :param resolved: memo of dereferenced components, see dereference()
+    :return: the dereferenced operation, a KeyError is raised if it does not exist
+    """
+    return dereference(specs, specs["paths"][path][operation], resolved)
+
+
 def get_endpoint_url(base_url: str, url: str) -> str:
     """Returns endpoint without base url
 
@@ -394,24 +636,6 @@ def detect_array_of_uuids(keys: list) -> bool:
     return True
 
 
-def detect_nested_dict_uuid(data: dict, detected: list) -> None:
-    """Returns a list of keys that have a UUID as key dict as its child
-
-    This function uses detect_array_of_uuids in a recursive way to detect teh use of dicts with the keys being UUIDS.
-    When such a datatype is found it's added to the detected list which will be used to build the seed upon.
-
-    :param detected: list of detected uuids
-    :param data: the data where a schema needs to be build for
-    "param detected: a 'call by reference' list of keys that have a UUID dict
-    """
-    if isinstance(data, dict):
-        for key in data.keys():
-            if isinstance(data[key], dict):
-                detect_nested_dict_uuid(data[key], detected)
-                if detect_array_of_uuids(data[key].keys()):
-                    detected.append(key)
-
-
 def detect_null_value(data: dict) -> None:
     """Postprocessor to change type:"null"
 
@@ -436,33 +660,91 @@ def detect_null_value(data: dict) -> None:
         data["type"] = data["type"][0]
 
 
-def build_seed(data: dict) -> dict:
-    """Returns a seed for the Genson package
-
-    This function preprocesses the data for which a schema needs to be build for. It preprocesses it because the used
-    schema generator Genson cannot generate schemas for certain datatype on its own.
-    The Genson package cannot handle dicts that use UUIDs as string format as their key. Genson and sort of JSON schema,
-    do not expect variables as the key of dicts. This is mostly fine because normally keys are values that one knows.
-    Integer keys cannot be used but UUID keys can be used. Therefor a seed is build to detect these dicts and push
-    Genson in the right direction.
-    :param data: the data where a schema needs to be build for
-    :return: a simple schema that serves as a seed for Genson
-    """
-    detected_dicts = []
-    detect_nested_dict_uuid(data, detected_dicts)
-    seed = {}
-    if detected_dicts:
-        uuid_regex = {
-            "^[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12}$": {}
-        }
-        seed["type"] = "object"
-        seed["properties"] = {}
-        for elements in detected_dicts:
-            seed["properties"][elements] = {
-                "type": "object",
-                "patternProperties": uuid_regex,
-            }
-    return seed
+class UUIDKeyObject(genson.schema.strategies.Object):
+    """Genson strategy for objects that detects dicts with UUIDs as keys while the data is added
+
+    Genson and JSON schema do not expect variables as the keys of a dict, every UUID would become a property of its
+    own. When all keys of a dict are UUIDs a UUID patternProperty is added to its schema before the dict is added, so
+    its values are merged into the schema of that patternProperty. This works at any depth and in the same pass that
+    builds the schema.
+    """
+
+    def add_object(self, obj: dict) -> None:
+        """Adds a dict to the schema of the object
+
+        :param obj: the dict
+        """
+        if obj and detect_array_of_uuids(list(obj.keys())):
+            self._pattern_properties[uuid_pattern]  # the node of the pattern is created on first use
+        super().add_object(obj)
+
+
+class SchemaBuilder(genson.SchemaBuilder):
+    """Genson schema builder for OpenAPI schemas
+
+    Samples can be added one at a time with add_object(), the schema is merged incrementally. The state of the builder
+    is serialisable with get_state(), so it can be saved and continued later with load_schema_builder().
+    """
+
+    EXTRA_STRATEGIES = (UUIDKeyObject,)
+
+    def __init__(self) -> None:
+        super().__init__(schema_uri=False)
+        self.samples = 0
+
+    def add_object(self, obj: any) -> None:
+        """Merges a sample into the schema
+
+        :param obj: a body that is sent or received from an API
+        """
+        super().add_object(obj)
+        self.samples += 1
+
+    def get_state(self) -> dict:
+        """Returns the state of the builder as a JSON serialisable dict
+
+        :return: the merged JSON schema, still with null types, and the number of samples
+        """
+        return {"schema": super().to_schema(), "samples": self.samples}
+
+    def to_schema(self) -> dict:
+        """Returns the merged schema as an OpenAPI schema
+
+        :return: a JSON schema as a dict, see detect_null_value()
+        """
+        schema = super().to_schema()
+        detect_null_value(schema)
+        return schema
+
+
+def load_schema_builder(state: dict = None) -> SchemaBuilder:
+    """Returns a schema builder that continues with the given state
+
+    :param state: state of a builder, see SchemaBuilder.get_state(), None for a new builder
+    :return: the schema builder
+    """
+    builder = SchemaBuilder()
+    if state is not None:
+        builder.add_schema(state["schema"])
+        builder.samples = state["samples"]
+    return builder
+
+
+def add_ndjson(builder: SchemaBuilder, lines: iter) -> int:
+    """Adds newline delimited JSON samples to a schema builder, one line at a time
+
+    The lines are read from the iterable as they are needed, so a large dump is never held in memory as a whole.
+
+    :param builder: the schema builder
+    :param lines: iterable of lines, for example a file or a request stream
+    :return: the number of samples that were added
+    """
+    added = 0
+    for line in lines:
+        if line.strip():
+            builder.add_object(json.loads(line))
+            added += 1
+    return added
 
 
 def generate_schema(data: any, use_seed: bool = True) -> dict:
@@ -470,8 +752,8 @@ def generate_schema(data: any, use_seed: bool = True) -> dict:
 
     This function takes the received or send data from an PAI and creates a schema describing the fields and types of
     data that are sent or received. It is modified to work as an OpenAPI schema, removing the schema definition
-    from the returned dict. It also adds a seed to enable the generation of schema's that are not supported
-    out-of-the-box.
+    from the returned dict. It also detects dicts with UUIDs as keys, which are not supported out-of-the-box, see
+    UUIDKeyObject.
     Example of data:
     {
         "id": 2203,
@@ -501,16 +783,18 @@ def generate_schema(data: any, use_seed: bool = True) -> dict:
         }
       }
     }
-    :param use_seed: boolean to make a seed schema
+    :param use_seed: boolean to detect dicts with UUIDs as keys
     :param data: a body that is sent or received from an API
     :return: a JSON schema as a dict
     """
-    builder = genson.SchemaBuilder(schema_uri=False)
     if use_seed:
-        builder.add_schema(build_seed(data))
+        builder = SchemaBuilder()
+    else:
+        builder = genson.SchemaBuilder(schema_uri=False)
     builder.add_object(data)
     schema = builder.to_schema()
-    detect_null_value(schema)
+    if not use_seed:
+        detect_null_value(schema)
     return schema
 
 
@@ -587,19 +871,12 @@ def generate_openapi(config: dict, endpoints: dict) -> bool:
 def resolve_refs(specs: str) -> tuple[bool, str]:
     """Returns specs without $refs
 
-    This function uses the Prance ResolvingParser to (temporarily) resolve the $refs for schema's in the OpenAPI specs.
+    This function uses the Prance ResolvingParser to (temporarily) resolve the $refs for schema's in the OpenAPI specs,
+    through the spec cache, see parse_specs().
     :param specs: the complete OpenAPI specification
     :return: a parsed OpenAPI specification as a dict without $refs
     """
-    try:
-        resolved_refs_specs = ResolvingParser(
-            spec_string=specs,
-            backend="openapi-spec-validator",
-        )
-        return True, resolved_refs_specs.specification
-    except ValidationError as e:
-        print("Validation Error:", e)
-        return False, ""
-    except prance.util.formats.ParseError as e:
-        print("Parse Error:", e)
+    valid, _, specification = parse_specs(specs, deref=True)
+    if not valid:
         return False, ""
+    return True, specification
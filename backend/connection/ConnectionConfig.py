@@ -1,11 +1,20 @@
+from collections import OrderedDict
+from threading import Lock
+
 from bson import ObjectId
 from flask import jsonify, request, Blueprint
+from pymongo import ASCENDING
 
-from backend import db
-from backend.application import ApplicationConfig
+from backend import db, ConfigCache, ConfigStore
+from backend.application import ApplicationConfig, SpecStore, openAPI
 
 collection = db["connections"]
 connection_config = Blueprint("ConnectionConfig", __name__)
+# per application id and specsVersion the root of its specs, its dereferenced components and the lock that guards them,
+# the most recently used entries, see openAPI.dereference()
+resolved_components = OrderedDict()
+resolved_components_size = 16
+resolved_components_lock = Lock()
 
 def set_state_helper(connection_id: ObjectId, state: str) -> bool:
     """
@@ -14,7 +23,10 @@ def set_state_helper(connection_id: ObjectId, state: str) -> bool:
     :param state: state to set the connection to
     :return: boolean if saving was successful
     """
-    update = collection.update_one({"_id": connection_id}, {"$set": {"state": state}})
+    update = collection.update_one(
+        {"_id": connection_id}, {"$set": {"state": state}, "$inc": {"configVersion": 1}}
+    )
+    ConfigCache.invalidate("connections", connection_id)
     return update.acknowledged
 
 
@@ -60,11 +72,7 @@ def get_application_name(application_id: str) -> str:
     application given as a string
     :return: application name as a string
     """
-    config = ApplicationConfig.get_application_config(application_id, internal=True)
-    if config:
-        return config["name"]
-    else:
-        return ""
+    return ConfigStore.get_application_name(application_id)
 
 
 def get_application_specs(application_id: str) -> dict:
@@ -74,36 +82,114 @@ def get_application_specs(application_id: str) -> dict:
     :param application_id: Mongodb id of application given as a string
     :return: application config as an object
     """
-    config = ApplicationConfig.get_application_config(application_id, internal=True)
-    return config["specs"]
+    specs_version = ApplicationConfig.get_specs_version(application_id)
+    if specs_version is None:
+        return {}
+    return SpecStore.load_specs(application_id, specs_version)
+
+
+def get_application_operation(application_id: str, path: str, operation: str) -> dict:
+    """Returns an operation of the OpenAPI specs of application given its id, with its $refs dereferenced
+
+    Only the operation and the root of the specs, which holds the components, are loaded. The root and the
+    dereferenced components are kept for the version of the specs, so they are resolved once for all operations that
+    use them. Specs without a version or a saved root are not kept.
+    :param application_id: Mongodb id of application given as a string
+    :param path: the path of the operation, for example /users/{id}
+    :param operation: the http operation, for example get
+    :return: the operation, a KeyError is raised if it does not exist
+    """
+    specs_version = ApplicationConfig.get_specs_version(application_id)
+    operation_specs = SpecStore.load_operation(
+        application_id, specs_version, path, operation
+    )
+    key = (application_id, specs_version)
+    with resolved_components_lock:
+        cached = resolved_components.get(key)
+        if cached is not None:
+            resolved_components.move_to_end(key)
+    if cached is None:
+        root = SpecStore.load_root(application_id, specs_version)
+        if specs_version is None or not root:
+            return openAPI.dereference(root, operation_specs)
+        with resolved_components_lock:
+            cached = resolved_components.setdefault(key, (root, {}, Lock()))
+            resolved_components.move_to_end(key)
+            if len(resolved_components) > resolved_components_size:
+                resolved_components.popitem(last=False)
+    root, resolved, resolved_lock = cached
+    with resolved_lock:  # the memo is filled while dereferencing
+        return openAPI.dereference(root, operation_specs, resolved)
+
+
+def get_application_paths(application_id: str) -> dict:
+    """Returns the paths of the OpenAPI specs of application given its id, every operation only has its servers
+
+    :param application_id: Mongodb id of application given as a string
+    :return: the paths section of the specs
+    """
+    specs_version = ApplicationConfig.get_specs_version(application_id)
+    if specs_version is None:
+        return {}
+    return SpecStore.load_paths(application_id, specs_version)
 
 
 @connection_config.route("/api/connection/", methods=["GET"])
-def get_connection_configs(internal: bool = False) -> list | tuple:
+def get_connection_configs(internal: bool = False, query: dict = None) -> list | tuple:
     """Returns a list of all the connections
 
-    This function generates a list of all the connections made between applications
+    This function generates a list of all the connections made between applications. The names of all the
+    applications in the list are read with a single query. A request can page and sort the list with the skip, limit,
+    sort (description, version, state or static) and order (asc or desc) arguments, the total number of connections
+    is returned with the page.
+    :param internal: boolean to determine the return type
+    :param query: MongoDB query to filter the connections, all connections by default
     :return: JSON list of dictionaries containing, application names, description, version and state
     """
+    if query is None:
+        query = {}
+    fields = ["description", "version", "state", "static"]
+    if internal:
+        skip, limit, sort = 0, 0, [("_id", ASCENDING)]
+    else:
+        skip, limit, sort = ConfigStore.get_page_arguments(fields, "_id")
+    items = list(
+        collection.find(query, fields + ["applicationIds"])
+        .sort(sort)
+        .skip(skip)
+        .limit(limit)
+    )
+    names = ConfigStore.get_application_names(
+        [
+            application_id
+            for item in items
+            for application_id in item["applicationIds"][:2]
+        ]
+    )
     configs = []
-    if collection.find({}):
-        for item in collection.find().sort("name"):
-            configs.append(
-                {
-                    "id": str(item["_id"]),
-                    "application1": get_application_name(item["applicationIds"][0]),
-                    "application2": get_application_name(item["applicationIds"][1]),
-                    "description": item["description"] if "description" in item else "",
-                    "version": item["version"] if "version" in item else "",
-                    "state": item["state"],
-                    "static": item["static"] if "static" in item else True,
-                }
-            )
+    for item in items:
+        configs.append(
+            {
+                "id": str(item["_id"]),
+                "application1": names.get(item["applicationIds"][0], ""),
+                "application2": names.get(item["applicationIds"][1], ""),
+                "description": item["description"] if "description" in item else "",
+                "version": item["version"] if "version" in item else "",
+                "state": item["state"],
+                "static": item["static"] if "static" in item else True,
+            }
+        )
     if internal:
         return configs
     else:
         return (
-            jsonify({"success": True, "connections": configs}),
+            jsonify(
+                {
+                    "success": True,
+                    "connections": configs,
+                    "total": collection.count_documents(query),
+                }
+            ),
             200,
             {"ContentType": "application/json"},
         )
@@ -113,18 +199,16 @@ def get_connection_configs(internal: bool = False) -> list | tuple:
 def get_complete_connection_configs() -> tuple:
     """Returns a list of all the connections that are marked as complete
 
-    This helper function uses get_connection_configs and filters out all the incomplete connections
+    This helper function uses get_connection_configs and only lists the complete connections
     :return: a JSON list of the complete connections
     """
     return (
         jsonify(
             {
                 "success": True,
-                "configs": [
-                    item
-                    for item in get_connection_configs(internal=True)
-                    if item["state"] == "Complete"
-                ],
+                "configs": get_connection_configs(
+                    internal=True, query={"state": "Complete"}
+                ),
             }
         ),
         200,
@@ -143,12 +227,12 @@ def get_connection_config(
     :param internal: boolean to determine the return type
     :return: either the connection config as a dict or a Flask response containing the config
     """
-    connection_id = ObjectId(connection_id)
-    config = collection.find_one({"_id": connection_id})
+    config = ConfigCache.get_config("connections", connection_id)
     config["id"] = str(config["_id"])
     if flow:
+        names = ConfigStore.get_application_names(config["applicationIds"])
         for application_id in config["applicationIds"]:
-            config[application_id] = get_application_name(application_id)
+            config[application_id] = names.get(application_id, "")
     config.pop("_id")
     if internal:
         return config
@@ -192,10 +276,15 @@ def generate_connection_id(application_id1: str, application_id2: str) -> tuple:
 
 @connection_config.route("/api/connection/<connection_id>", methods=["PUT"])
 def update_connection_config(
-    connection_id: str, config: dict = None, internal: bool = False
+    connection_id: str,
+    config: dict = None,
+    internal: bool = False,
 ) -> None | tuple | ObjectId:
     """
 
+    Every update increments the configVersion of the connection, which a running sync server uses to reload the
+    mappings that changed
+
     :param connection_id: a unique identifier of a connection between applications
     :param config: New connection configuration to overwrite the save done with
     :param internal: boolean to determine the return type
@@ -206,7 +295,11 @@ def update_connection_config(
         config = request.get_json()
     if "id" in config:
         config.pop("id")
-    updated = collection.update_one({"_id": connection_id}, {"$set": config})
+    config.pop("configVersion", None)
+    updated = collection.update_one(
+        {"_id": connection_id}, {"$set": config, "$inc": {"configVersion": 1}}
+    )
+    ConfigCache.invalidate("connections", connection_id)
     if updated.acknowledged:
         if "state" not in config:
             set_state(connection_id)
@@ -253,6 +346,7 @@ def delete_connection_config(connection_id: str) -> tuple:
     else:
         connection_id = ObjectId(connection_id)
         deleted = collection.delete_one({"_id": connection_id})
+        ConfigCache.invalidate("connections", connection_id)
         if deleted.acknowledged:
             return jsonify({"success": True}), 200, {"ContentType": "application/json"}
         else:
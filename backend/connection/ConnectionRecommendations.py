@@ -20,7 +20,7 @@ from scipy import stats
 from sentence_transformers import SentenceTransformer, util
 from sklearn import model_selection, feature_selection, linear_model, ensemble, metrics
 
-from backend.application import ApplicationConfig
+from backend.application import ApplicationConfig, openAPI
 from backend.connection import JsonGlue, ConnectionConfig
 
 abbreviations = {
@@ -257,7 +257,9 @@ def create_data_set(application_ids=None, training=False):
         applications = ApplicationConfig.get_application_configs(internal=True)
     elif application_ids:
         applications = [
-            ApplicationConfig.get_application_config(application_id, internal=True)
+            ApplicationConfig.get_application_config(
+                application_id, internal=True, with_specs=False
+            )
             for application_id in application_ids
         ]
     else:
@@ -272,11 +274,12 @@ def create_data_set(application_ids=None, training=False):
     apis = []
     for application in applications:
         specs = ConnectionConfig.get_application_specs(application["id"])
+        resolved = {}  # dereferenced components, shared by the operations of the application
         if not training:
             endpoint_id = 1
         for path in specs["paths"]:
             for operation in specs["paths"][path]:
-                temp_spec = specs["paths"][path][operation]
+                temp_spec = openAPI.get_operation(specs, path, operation, resolved)
                 api_data = {
                     "name": application["name"],
                     "path": string_preprocessing(path),
@@ -3,6 +3,7 @@ import ast
 from bson import objectid
 from flask import jsonify, request, Blueprint
 
+from backend import ConfigStore
 from backend.connection import ConnectionConfig, DataTypeUtils
 
 connection_variable = Blueprint("ConnectionVariable", __name__)
@@ -20,11 +21,8 @@ def get_variables(connection_id: str, internal: bool = False) -> list | tuple:
     :param connection_id: Mongodb id of connection given as a string
     :return: an JSON object containing the variables
     """
-    connection_config = ConnectionConfig.get_connection_config(
-        connection_id, internal=True, flow=False
-    )
-    if "variables" in connection_config:
-        variables = connection_config["variables"]
+    variables = ConfigStore.get_variables(connection_id)
+    if variables is not None:
         for variable in variables:
             variable["type"] = DataTypeUtils.convert_python_to_json(
                 type(variable["value"]).__name__
@@ -157,7 +155,9 @@ def delete_variable(connection_id: str, variable_id: str) -> tuple:
 
 @connection_variable.route("/api/connection/variable/<connection_id>", methods=["PUT"])
 def update_variable(
-    connection_id: str, variable: dict = None, internal: bool = False
+    connection_id: str,
+    variable: dict = None,
+    internal: bool = False,
 ) -> bool | tuple:
     """Returns state after updating a variable
 
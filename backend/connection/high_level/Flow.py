@@ -28,7 +28,10 @@ def get_connection_config_flow(connection_id: str, internal: bool = False) -> tu
     edges = []
     specs = {}
     for application_id in config["applicationIds"]:
-        specs[application_id] = ConnectionConfig.get_application_specs(application_id)
+        # the listing only needs the paths, operations and their servers
+        specs[application_id] = {
+            "paths": ConnectionConfig.get_application_paths(application_id)
+        }
     nodes.append(
         {
             "id": "0",  # Add set variable node, shown in the editor as node in the middle
@@ -162,9 +165,10 @@ def get_node(
     if not node_data:
         node_data = request.get_json()
     output = {}
-    specs = ConnectionConfig.get_application_specs(application_id)
     try:
-        node_details = specs["paths"][node_data["path"]][node_data["operation"]]
+        node_details = ConnectionConfig.get_application_operation(
+            application_id, node_data["path"], node_data["operation"]
+        )
     except KeyError:
         if internal:
             return
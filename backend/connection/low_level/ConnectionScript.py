@@ -110,6 +110,10 @@ def add_script(connection_id: str, mapping_id: str, script_id: str) -> tuple:
             with open(
                 "backend/connection_scripts/" + script_id + ".py", encoding="utf-8", mode="a"
             ) as file:
+                file.write(
+                    "# Optionally add main_batch(records, **variables), returning a list of converted records, to "
+                    "convert list responses in batches\n"
+                )
                 file.write(
                     "def main("
                     + generate_script_function_arguments(
@@ -3,6 +3,7 @@ from copy import copy
 from bson import objectid
 from flask import jsonify, Blueprint
 
+from backend import ConfigStore
 from backend.connection import ConnectionConfig, ConnectionVariable, DataTypeUtils
 from backend.connection.high_level import Flow as HighLevelFlow
 
@@ -231,12 +232,9 @@ def get_endpoint_mapping(connection_id: str, mapping_id: str) -> dict | None:
     :param mapping_id: Unique identifier for the connection between data schema items
     :return: dictionary containing the mapping
     """
-    connection_config = ConnectionConfig.get_connection_config(
-        connection_id, internal=True, flow=False
-    )
-    mapping_index = find_mapping_index(connection_config, mapping_id)
-    if mapping_index is not None:
-        return connection_config["endpointMapping"][mapping_index]
+    mapping = ConfigStore.get_endpoint_mapping(connection_id, mapping_id)
+    if mapping is not None:
+        return mapping
     else:
         print("Schema could not be found")
         return
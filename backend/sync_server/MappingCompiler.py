@@ -0,0 +1,124 @@
+import hashlib
+import linecache
+
+import jsonpickle
+from glom import glom
+
+from backend.sync_server import SyncServer
+
+compiled_mappings = {}
+
+
+def split_glom_path(spec: any) -> list | None:
+    """ Function to split a Glom path into its keys, if the path can be compiled to direct key lookups
+
+    Paths with special Glom syntax (stars, escapes, empty segments) and non string specs are not compiled, these are
+    handed back to Glom itself
+
+    :param spec: a leaf of a Glom mapping
+    :return: a list of keys or None if the leaf needs Glom
+    """
+    if not isinstance(spec, str) or spec == "":
+        return None
+    segments = spec.split(".")
+    for segment in segments:
+        if segment == "" or "*" in segment or "\\" in segment:
+            return None
+    return segments
+
+
+def generate_expression(spec: any, glom_specs: list) -> str:
+    """ Function to recursively generate a Python expression that builds the same data as Glom would for a spec
+
+    Dicts become dict literals, paths become chained key lookups on the source response and everything else becomes
+    a call to Glom with that part of the spec
+
+    :param spec: (part of) a Glom mapping
+    :param glom_specs: a 'call by reference' list of specs that are left to Glom
+    :return: a Python expression as a string
+    """
+    if type(spec) is dict and all(isinstance(key, str) for key in spec.keys()):
+        items = [
+            repr(key) + ": " + generate_expression(value, glom_specs)
+            for key, value in spec.items()
+        ]
+        return "{" + ", ".join(items) + "}"
+    segments = split_glom_path(spec)
+    if segments is not None:
+        return "source" + "".join("[" + repr(segment) + "]" for segment in segments)
+    glom_specs.append(spec)
+    return "glom(source, glom_specs[" + str(len(glom_specs) - 1) + "])"
+
+
+def compile_glom_mapping(glom_mapping: any, mapping_hash: str) -> callable:
+    """ Function to generate and compile a specialised Python function for a Glom mapping
+
+    The generated function builds the target data with direct key lookups. Glom only resolves dicts with getitem, so
+    whenever a lookup fails (a list or another type in the path, or a missing key) the whole mapping is handed to Glom,
+    which either resolves it or raises the same error as before.
+
+    :param glom_mapping: a decoded Glom mapping as generated by MappingGenerator.generate_glom_mapping()
+    :param mapping_hash: hash of the encoded mapping, used to name the generated source
+    :return: the compiled function, which takes the source response as its only argument
+    """
+    glom_specs = []
+    function_name = "transform_" + mapping_hash[:12]
+    source = (
+        "def " + function_name + "(source):\n"
+        "    try:\n"
+        "        return " + generate_expression(glom_mapping, glom_specs) + "\n"
+        "    except (KeyError, IndexError, TypeError):\n"
+        "        return glom(source, glom_mapping)\n"
+    )
+    file_name = "<glom mapping " + mapping_hash + ">"
+    linecache.cache[file_name] = (
+        len(source),
+        None,
+        source.splitlines(True),
+        file_name,
+    )  # makes tracebacks of the generated code readable
+    namespace = {"glom": glom, "glom_specs": glom_specs, "glom_mapping": glom_mapping}
+    exec(compile(source, file_name, "exec"), namespace)
+    compiled = namespace[function_name]
+    compiled.glom_mapping = glom_mapping
+    compiled.source = source
+    return compiled
+
+
+def get_compiled_mapping(encoded_mapping: str) -> callable:
+    """ Function to get the compiled version of an encoded Glom mapping, it is compiled once and cached by its hash
+
+    :param encoded_mapping: Glom mapping as saved in the endpoint mapping, encoded by jsonpickle
+    :return: the compiled function of the mapping
+    """
+    mapping_hash = hashlib.sha256(encoded_mapping.encode("utf-8")).hexdigest()
+    compiled = compiled_mappings.get(mapping_hash)
+    if compiled is None:
+        compiled = compile_glom_mapping(jsonpickle.decode(encoded_mapping), mapping_hash)
+        compiled_mappings[mapping_hash] = compiled
+    return compiled
+
+
+def transform(encoded_mapping: str, source_response: any, verify: bool = False) -> any:
+    """ Function to generate the target data for a source response with the compiled version of a Glom mapping
+
+    Glom stays the reference implementation, in verify mode both are executed and the output of Glom is used and
+    logged if the two differ
+
+    :param encoded_mapping: Glom mapping as saved in the endpoint mapping, encoded by jsonpickle
+    :param source_response: response data from a source
+    :param verify: bool to compare the compiled output with the output of Glom
+    :return: the target data
+    """
+    compiled = get_compiled_mapping(encoded_mapping)
+    target_data = compiled(source_response)
+    if verify:
+        reference_data = glom(source_response, compiled.glom_mapping)
+        if reference_data != target_data:
+            SyncServer.sync_server_log.error(
+                "Compiled mapping differs from Glom, compiled: %s, Glom: %s",
+                SyncServer.format_payload(target_data),
+                SyncServer.format_payload(reference_data),
+            )
+            return reference_data
+    return target_data
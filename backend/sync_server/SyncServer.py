@@ -1,27 +1,142 @@
+import atexit
 import logging
+import os
+import queue
+import reprlib
+import socket
+import sys
 import time
 import traceback
-from threading import Thread
+from datetime import datetime
+from logging.handlers import QueueHandler, QueueListener
+from threading import Lock, Thread
 
+from bson import ObjectId
+from bson.errors import InvalidId
 from flask import jsonify, request, Blueprint
 
-from backend.sync_server import SyncServerHelpers
+from backend import db
+from backend.sync_server import (
+    SyncServerControl,
+    SyncServerHelpers,
+    SyncServerScripts,
+    SyncServerState,
+    SyncServerStatistics,
+    SyncServerTracing,
+)
+
+log_collection = db["sync_log"]
+# seconds after which log records are removed by Mongo, see Indexes.get_indexes()
+log_ttl = int(os.environ.get("SYNC_LOG_TTL", 24 * 60 * 60))
+log_batch_size = 100  # log records written to the sync_log collection at once
+log_lines_limit = 1000  # log lines returned by the log API at once
+# the connection and sync session the log records of this process belong to, see start_log_session()
+log_connection_id = None
+log_session_id = None
+
+
+class LogStoreHandler(logging.Handler):
+    """Writes the log records of the sync server to the sync_log collection, which every process that syncs (API
+    workers and sync workers) shares, so the log API shows the same log whichever process serves it
+
+    The records are written in batches by the listener thread: a batch is written when it is full or when the queue
+    has no more records, so a burst of records costs one round trip and a single record is written right away
+    """
+
+    def __init__(self, log_queue: queue.SimpleQueue) -> None:
+        super().__init__()
+        self.log_queue = log_queue
+        self.buffer = []
+
+    def emit(self, record: logging.LogRecord) -> None:
+        try:
+            self.buffer.append(
+                {
+                    "createdAt": datetime.utcfromtimestamp(record.created),
+                    "source": socket.gethostname() + ":" + str(os.getpid()),
+                    "connectionId": getattr(record, "connection_id", None),
+                    "sessionId": getattr(record, "session_id", None),
+                    "message": self.format(record) + "\n",
+                }
+            )
+        except Exception:
+            self.handleError(record)
+        if len(self.buffer) >= log_batch_size or self.log_queue.empty():
+            self.flush()
+
+    def flush(self) -> None:
+        self.acquire()
+        try:
+            documents, self.buffer = self.buffer, []
+        finally:
+            self.release()
+        if documents:
+            try:
+                log_collection.insert_many(documents, ordered=False)
+            except Exception as e:
+                sys.stderr.write(
+                    "Error while storing the sync server log: " + str(e) + "\n"
+                )
+
+    def close(self) -> None:
+        self.flush()
+        super().close()
+
+
+def stamp_session(record: logging.LogRecord) -> bool:
+    """ Function to add the connection and sync session to a log record when it is logged, see start_log_session()
+
+    :param record: the log record
+    :return: True, all records are logged
+    """
+    record.connection_id = log_connection_id
+    record.session_id = log_session_id
+    return True
+
 
 sync_server_log = logging.getLogger("sync_server")
 sync_server_log_handler = logging.StreamHandler()
-sync_server_log_file = logging.FileHandler("backend/sync_server.log", mode="w")
+# a file per process in append mode, so processes do not truncate or interleave each others log. Delayed, so
+# processes that import this module without logging (script workers) do not create a file
+sync_server_log_file = logging.FileHandler(
+    "backend/sync_server." + str(os.getpid()) + ".log", mode="a", delay=True
+)
+sync_server_log_queue = queue.SimpleQueue()
+sync_server_log_store = LogStoreHandler(sync_server_log_queue)
 sync_server_log_format = logging.Formatter(
     fmt=str("[Sync Server] ") + "%(asctime)s %(levelname)s: %(message)s",
     datefmt="%H:%M:%S",
 )
 sync_server_log_file.setFormatter(sync_server_log_format)
-sync_server_log.addHandler(sync_server_log_handler)
-sync_server_log.addHandler(sync_server_log_file)
+sync_server_log_store.setFormatter(sync_server_log_format)
+# the QueueHandler merges the arguments into the message in the logging thread (QueueHandler.prepare()), a listener
+# thread does the final formatting and the writing to the handlers, so the sync thread never waits for I/O. The
+# listener runs for the life of the process, see start_log_listener()
+sync_server_log_listener = QueueListener(
+    sync_server_log_queue,
+    sync_server_log_handler,
+    sync_server_log_file,
+    sync_server_log_store,
+    respect_handler_level=True,
+)
+sync_server_log.addHandler(QueueHandler(sync_server_log_queue))
+sync_server_log.addFilter(stamp_session)
 sync_server_log.setLevel(logging.INFO)
+log_listener_running = False
+log_listener_lock = Lock()
+
+payload_repr = reprlib.Repr()
+payload_repr.maxlevel = 4
+payload_repr.maxdict = 20
+payload_repr.maxlist = 20
+payload_repr.maxstring = 200
+payload_repr.maxother = 200
 
 background_thread = None
 stop_thread = False
 clear_cache = True
+log_payload_limit = 1000  # characters of a response that are logged
+unchanged_log_interval = 60  # seconds between the summaries of polls without changes
 
 sync_server = Blueprint("SyncServer", __name__)
 
@@ -33,75 +148,105 @@ def start_sync_server() -> tuple:
 
     :return: Flask responses with errors if they occur in the initialisation phase
     """
-    sync_server_log.info(
-        "=================== Initializing Sync Server ==================="
-    )
     args = request.args
     connection_id = args.get("id", default=None, type=str)
-    polling_interval = args.get("interval", default=5, type=int)
-    global clear_cache
-    clear_cache = args.get("cache", default=True, type=bool)
-    connection_config, application_configs = SyncServerHelpers.format_configs(
-        connection_id
-    )
-    if connection_config["state"] != "Complete":
+    settings = {
+        "interval": args.get("interval", default=5, type=int),
+        "cache": args.get("cache", default=True, type=bool),
+        "raw": args.get("raw", default=False, type=bool),
+        "verify": args.get("verify", default=False, type=bool),
+        "batchSize": args.get("batchSize", default=1000, type=int),
+        "scriptWorkers": args.get("scriptWorkers", default=2, type=int),
+        "scriptTimeout": args.get("scriptTimeout", default=30, type=int),
+        "scriptMemory": args.get("scriptMemory", default=0, type=int),
+        "tracing": args.get("tracing", default=None, type=str),
+        "tracingTarget": args.get("tracingTarget", default=None, type=str),
+        "logPayload": args.get("logPayload", default=1000, type=int),
+        "logInterval": args.get("logInterval", default=60, type=int),
+        "poolSize": args.get("poolSize", default=32, type=int),
+        "timeout": args.get("timeout", default=60, type=int),
+        "compression": args.get("compression", default=True, type=bool),
+        "maxResponseSize": args.get("maxResponseSize", default=0, type=int),
+    }
+    if settings["batchSize"] < 0:
         return (
-            jsonify(
-                {"success": False, "reason": "Mapped connection config is incomplete"}
-            ),
+            jsonify({"success": False, "reason": "Batch size can not be negative"}),
             400,
             {"ContentType": "application/json"},
         )
-    if connection_id is None:
-        return (
-            jsonify({"success": False, "reason": "Connection ID is not valid"}),
-            500,
-            {"ContentType": "application/json"},
-        )
-    refresh_sdk, emergency_stop = SyncServerHelpers.handle_sdk_state(connection_config, application_configs)
-    if emergency_stop:
+    if SyncServerControl.remote_sync:
         return (
             jsonify(
-                {"success": False, "reason": "An error occurred during the SDK handling"}
+                {
+                    "success": True,
+                    "commandId": SyncServerControl.send_command(
+                        "start", connection_id, settings
+                    ),
+                }
             ),
-            500,
+            200,
             {"ContentType": "application/json"},
         )
-    if refresh_sdk:
-        # if true configs need to be refreshed because sdks are generated and that changes the configs
-        connection_config, application_configs = SyncServerHelpers.format_configs(
-            connection_id
-        )
-    connection_config["id"] = connection_id
-    mapping_config = SyncServerHelpers.get_mapping_config(
-        connection_config, application_configs
-    )
-    if not mapping_config:
+    success, reason, status = start(connection_id, settings)
+    if not success:
         return (
-            jsonify(
-                {
-                    "success": False,
-                    "reason": "The connection does not contain any GET requests, making it impossible to sync the "
-                              "applications",
-                }
-            ),
-            500,
+            jsonify({"success": False, "reason": reason}),
+            status,
             {"ContentType": "application/json"},
         )
+    return jsonify({"success": True}), 200, {"ContentType": "application/json"}
 
-    sync_server_log.info("Syncing the following applications: ")
-    for application_id in connection_config["applicationIds"]:
-        sync_server_log.info(application_configs[application_id]["name"])
 
-    state, sdks = SyncServerHelpers.get_sdks_as_import(
-        connection_config, application_configs
+def start(
+    connection_id: str, settings: dict, restored_state: dict = None
+) -> tuple[bool, str | None, int]:
+    """ Function that initialises and starts the sync server, used by the start API and to resume the sync server
+    after a restart
+
+    :param connection_id: a unique identifier of a connection between applications
+    :param settings: the settings of the sync session, see start_sync_server() for the keys
+    :param restored_state: runtime state of a previous sync session to resume, see SyncServerState.save_state()
+    :return: a tuple with a bool if the sync server is started, the reason if it is not and a http status code
+    """
+    start_log_listener()
+    if not get_state_sync_server():
+        start_log_session(connection_id)
+    sync_server_log.info(
+        "=================== Initializing Sync Server ==================="
     )
-    if not state:
-        return (
-            jsonify({"success": False, "reason": "There was an error importing SDKs"}),
-            500,
-            {"ContentType": "application/json"},
-        )
+    polling_interval = settings["interval"]
+    global clear_cache, log_payload_limit, unchanged_log_interval
+    clear_cache = settings["cache"]
+    log_payload_limit = settings["logPayload"]
+    unchanged_log_interval = settings["logInterval"]
+    tracing_configured, reason = SyncServerTracing.configure_tracing(
+        settings["tracing"], settings["tracingTarget"]
+    )
+    if not tracing_configured:
+        return False, reason, 400
+    if connection_id is None:
+        return False, "Connection ID is not valid", 500
+    if settings["batchSize"] < 0:
+        return False, "Batch size can not be negative", 400
+    options = {
+        "session": SyncServerScripts.default_session,
+        "rawResponse": settings["raw"],
+        "verifyTransform": settings["verify"],
+        "batchSize": settings["batchSize"],
+        # a restored state of an older version has no connection pool settings
+        "poolSize": settings.get("poolSize", 32),
+        "requestTimeout": settings.get("timeout", 60) or None,
+        "compression": settings.get("compression", True),
+        "maxResponseSize": settings.get("maxResponseSize", 0),
+    }
+    if not get_state_sync_server():
+        # new ApiClients for the settings of this session
+        SyncServerHelpers.close_api_clients(SyncServerScripts.default_session)
+    reason, status, connection_config, sdks, mapping_config = (
+        SyncServerHelpers.prepare_connection(connection_id, options)
+    )
+    if reason is not None:
+        return False, reason, status
     global background_thread
     global stop_thread
     stop_thread = False
@@ -109,19 +254,34 @@ def start_sync_server() -> tuple:
         sync_server_log.info(
             "=================== Started Sync Server ==================="
         )
+        SyncServerScripts.start_script_pool(
+            settings["scriptWorkers"],
+            settings["scriptTimeout"],
+            settings["scriptMemory"],
+            SyncServerScripts.default_session,
+        )
+        SyncServerHelpers.unchanged_polls.clear()
+        position, delay = SyncServerState.start_state(
+            connection_id, settings, mapping_config, restored_state
+        )
+        versions = SyncServerHelpers.get_config_versions(connection_config)
         background_thread = Thread(
             target=background_process,
-            args=[connection_config, polling_interval, sdks, mapping_config],
+            args=[
+                connection_config,
+                polling_interval,
+                sdks,
+                mapping_config,
+                position,
+                delay,
+                versions,
+            ],
         )
         background_thread.start()
-        return jsonify({"success": True}), 200, {"ContentType": "application/json"}
+        return True, None, 200
     else:
         sync_server_log.error("Sync Server is already running")
-        return (
-            jsonify({"success": False, "reason": "server is already running"}),
-            500,
-            {"ContentType": "application/json"},
-        )
+        return False, "server is already running", 500
 
 
 @sync_server.route("/api/server/stop/", methods=["GET"])
@@ -134,19 +294,24 @@ def stop_sync_server(emergency_stop: bool = False) -> tuple | None:
     """
     global stop_thread
     global clear_cache
+    if SyncServerControl.remote_sync and not emergency_stop:
+        return stop_remote_sync_server()
     if get_state_sync_server() and not stop_thread:
         sync_server_log.info(
             "=================== Stopping Sync Server ==================="
         )
         stop_thread = True
+        mapping_ids = list(SyncServerState.runtime_state.get("cacheIds", {}))
+        SyncServerState.finish_state()
         sync_server_log.info("Clearing cache...")
         time.sleep(5)  # To make sure the thread and background process are stopped
+        SyncServerScripts.stop_script_pool(SyncServerScripts.default_session)
         if clear_cache:
-            SyncServerHelpers.empty_cache()
+            SyncServerHelpers.empty_cache(mapping_ids)
+        SyncServerHelpers.close_api_clients(SyncServerScripts.default_session)
         sync_server_log.info(
             "=================== Stopped Sync Server ==================="
         )
-        sync_server_log_file.close()
         if not emergency_stop:
             return jsonify({"success": True}), 200, {"ContentType": "application/json"}
         else:
@@ -163,23 +328,151 @@ def stop_sync_server(emergency_stop: bool = False) -> tuple | None:
             return
 
 
+def abandon_sync_server() -> None:
+    """ Function to stop the background process without saving its state or clearing its cache, used by a process
+    that lost its connection to another process, a worker that lost its lease or a process whose sync state was
+    claimed, which continues with that state and cache
+    """
+    global stop_thread
+    stop_thread = True
+    SyncServerState.abandon_state()
+    SyncServerScripts.stop_script_pool(SyncServerScripts.default_session)
+    sync_server_log.info("Another process continues the sync")
+
+
+def stop_remote_sync_server() -> tuple:
+    """ Function to send stop commands to the sync workers, for the given connection or else for all running
+    connections
+
+    :return: Flask response containing the ids of the commands
+    """
+    connection_id = request.args.get("id", default=None, type=str)
+    running_connections = SyncServerControl.get_running_connections()
+    if connection_id is not None:
+        running_connections = [
+            running for running in running_connections if running == connection_id
+        ]
+    if not running_connections:
+        return (
+            jsonify({"success": False, "reason": "server not running"}),
+            500,
+            {"ContentType": "application/json"},
+        )
+    command_ids = [
+        SyncServerControl.stop_connection(running) for running in running_connections
+    ]
+    return (
+        jsonify({"success": True, "commandIds": command_ids}),
+        200,
+        {"ContentType": "application/json"},
+    )
+
+
+def start_log_session(connection_id: str | None) -> None:
+    """ Function to start a new log session, the log API shows the log of the latest session like the log file used to
+    be truncated when the sync server started
+
+    :param connection_id: a unique identifier of a connection between applications
+    """
+    global log_connection_id, log_session_id
+    log_connection_id = connection_id
+    log_session_id = str(ObjectId())
+
+
+def start_log_listener() -> None:
+    """ Function to start the thread that writes the queued log records of the sync server, if it is not running. It
+    keeps running until the process exits, so records that are logged between sync sessions are written right away
+    """
+    global log_listener_running
+    with log_listener_lock:
+        if not log_listener_running:
+            sync_server_log_listener.start()
+            log_listener_running = True
+
+
+def stop_log_listener() -> None:
+    """ Function to write all queued log records, stop the thread that writes them and close the log file, when the
+    process exits
+    """
+    global log_listener_running
+    with log_listener_lock:
+        if log_listener_running:
+            sync_server_log_listener.stop()
+            log_listener_running = False
+    sync_server_log_store.close()
+    sync_server_log_file.close()
+
+
+atexit.register(stop_log_listener)
+
+
+def format_payload(payload: any) -> str:
+    """ Function to shorten a payload, such as a response, for the log
+
+    Dicts and lists are shortened while they are converted, so large responses are never turned into a string as a
+    whole
+
+    :param payload: the data to log
+    :return: a string of at most log_payload_limit characters
+    """
+    if hasattr(payload, "to_dict"):  # models of a generated SDK
+        payload = payload.to_dict()
+    if isinstance(payload, (dict, list, tuple, str)):
+        text = payload_repr.repr(payload)
+    else:
+        text = str(payload)
+    if len(text) > log_payload_limit:
+        return text[:log_payload_limit] + "... (" + str(len(text)) + " characters)"
+    return text
+
+
 @sync_server.route("/api/server/log")
 def get_sync_server_log() -> tuple:
-    """ Function to get the latest server logs
+    """ Function to get the log of the latest sync session, of the given connection or else of any connection, written
+    by any process that syncs, see LogStoreHandler
+
+    Without the after argument the latest log_lines_limit lines of the session are returned, with it the lines after
+    that line. The id of the last line is returned as last, to be given as after by the next request
 
     :return: Flask response containing the server logs
     """
     args = request.args
-    previous_messages = args.get("messages", default=0, type=int)
-    with open("backend/sync_server.log") as f:
-        messages = f.readlines()
-    if len(messages) > previous_messages:
+    connection_id = args.get("id", default=None, type=str)
+    query = {} if connection_id is None else {"connectionId": connection_id}
+    latest = log_collection.find_one(query, {"sessionId": 1}, sort=[("_id", -1)])
+    if latest is None:
+        return (
+            jsonify({"success": True, "syncServer": get_state_sync_server()}),
+            200,
+            {"ContentType": "application/json"},
+        )
+    query = {"sessionId": latest.get("sessionId")}
+    try:
+        after = ObjectId(args.get("after", default=None, type=str))
+    except (InvalidId, TypeError):
+        after = None
+    if after is not None:
+        query["_id"] = {"$gt": after}
+        records = list(
+            log_collection.find(query, {"message": 1})
+            .sort("_id", 1)
+            .limit(log_lines_limit)
+        )
+    else:
+        records = list(
+            log_collection.find(query, {"message": 1})
+            .sort("_id", -1)
+            .limit(log_lines_limit)
+        )[::-1]
+    if records:
         return (
             jsonify(
                 {
                     "success": True,
                     "syncServer": get_state_sync_server(),
-                    "data": messages[previous_messages:],
+                    "session": latest.get("sessionId"),
+                    "data": [record["message"] for record in records],
+                    "last": str(records[-1]["_id"]),
                 }
             ),
             200,
@@ -199,6 +492,8 @@ def get_state_sync_server() -> bool:
 
     :return: bool if sync server is running
     """
+    if SyncServerControl.remote_sync:
+        return bool(SyncServerControl.get_running_connections())
     if background_thread is not None:
         if background_thread.is_alive():
             return True
@@ -206,7 +501,13 @@ def get_state_sync_server() -> bool:
 
 
 def background_process(
-        connection_config: dict, polling_interval: int, sdks: dict, mapping_config: dict
+    connection_config: dict,
+    polling_interval: int,
+    sdks: dict,
+    mapping_config: dict,
+    position: int = 0,
+    delay: float = 0,
+    versions: dict = None,
 ) -> None:
     """ Function that does the actual syncing of APIs by calling the function to sync a specific connection between APIs
 
@@ -214,16 +515,44 @@ def background_process(
     :param polling_interval: integer of interval to wait between sync runs
     :param sdks: a dict containing the imported SDKs of the applications
     :param mapping_config: list of connections of APIs that need syncing
+    :param position: index of the endpoint to start the first cycle with, set when an interrupted cycle is resumed
+    :param delay: seconds to wait before the first cycle, set when the sync server is resumed within an interval
+    :param versions: the versions the configs were loaded with, see SyncServerHelpers.get_config_versions()
     """
+    time.sleep(delay)
     while not stop_thread:
-        for endpoint in mapping_config:
+        if versions is not None and position == 0:
             try:
-                SyncServerHelpers.find_call_type(
-                    connection_config, sdks, endpoint, polling_interval
+                versions = SyncServerHelpers.reload_configs(
+                    connection_config, sdks, mapping_config, versions
                 )
             except Exception as e:
-                sync_server_log.error("Unknown error: " + str(e))
-                sync_server_log.error(traceback.format_exc())
-                stop_sync_server(emergency_stop=True)
-                break
+                sync_server_log.error("Error while reloading the configs: %s", e)
+        cycle = SyncServerStatistics.start_cycle(connection_config)
+        with SyncServerTracing.span("sync_cycle", connection=connection_config["id"]):
+            for index in range(position, len(mapping_config)):
+                if stop_thread:
+                    break
+                endpoint = mapping_config[index]
+                run = SyncServerStatistics.start_run(connection_config, endpoint)
+                try:
+                    with SyncServerTracing.span(
+                        "find_call_type", mapping=endpoint["id"]
+                    ):
+                        SyncServerHelpers.find_call_type(
+                            connection_config, sdks, endpoint, polling_interval, run
+                        )
+                    SyncServerStatistics.finish_run(cycle, run)
+                    SyncServerState.update_state(mapping_config, index + 1)
+                except Exception as e:
+                    run["error"] = type(e).__name__
+                    SyncServerStatistics.finish_run(cycle, run)
+                    sync_server_log.error("Unknown error: %s", e)
+                    sync_server_log.error("%s", traceback.format_exc())
+                    stop_sync_server(emergency_stop=True)
+                    break
+        SyncServerStatistics.finish_cycle(cycle)
+        position = 0
+        if not stop_thread:
+            SyncServerState.update_state(mapping_config, 0, time.time())
         time.sleep(polling_interval)
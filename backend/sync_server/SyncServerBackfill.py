@@ -0,0 +1,525 @@
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import datetime
+from threading import Thread
+
+from bson import ObjectId
+from flask import jsonify, request, Blueprint
+from pymongo import DESCENDING
+
+from backend import db
+from backend.sync_server import (
+    SyncServer,
+    SyncServerHelpers,
+    SyncServerScripts,
+    SyncServerStatistics,
+    SyncServerTracing,
+)
+
+sync_server_backfill = Blueprint("SyncServerBackfill", __name__)
+collection = db["backfills"]
+
+backfill_threads = {}  # per connection id: the thread running its backfill
+stop_backfills = set()  # connection ids of backfills that should stop
+checkpoint_interval = 1  # seconds between checkpoint writes
+
+
+def get_session(connection_id: str) -> str:
+    """ Function to get the session of the backfill of a connection, it has its own script pool and ApiClients so the
+    backfill and the sync server do not stop or close those of each other
+
+    :param connection_id: a unique identifier of a connection between applications
+    :return: the session, see SyncServerScripts.default_session
+    """
+    return "backfill:" + connection_id
+
+
+def stop_session(connection_id: str) -> None:
+    """ Function to stop the script pool and close the ApiClients of the backfill of a connection
+
+    :param connection_id: a unique identifier of a connection between applications
+    """
+    SyncServerScripts.stop_script_pool(get_session(connection_id))
+    SyncServerHelpers.close_api_clients(get_session(connection_id))
+
+
+def is_backfilled(endpoint: dict) -> bool:
+    """ Function to check if an endpoint mapping is backfilled, only mappings from an API to an API are, variables
+    have no history to copy
+
+    :param endpoint: row of the list of connections that need to be synced
+    :return: bool if the endpoint is backfilled
+    """
+    return (
+        endpoint["source"]["type"] == "function"
+        and endpoint["target"]["type"] != "variables"
+    )
+
+
+def get_backfill_id(connection_id: str, resume: bool, mapping_config: list) -> str:
+    """ Function to get the id of the latest backfill of a connection if it did not copy all endpoints, or a new id
+
+    A backfill that was stopped or failed is continued, also when it stopped between two endpoints, so the endpoints
+    it already copied are not copied again
+
+    :param connection_id: a unique identifier of a connection between applications
+    :param resume: bool to continue an unfinished backfill, if there is one
+    :param mapping_config: list of endpoint mappings, see SyncServerHelpers.get_mapping_config()
+    :return: the id of the backfill
+    """
+    if resume:
+        latest = collection.find_one(
+            {"connectionId": connection_id},
+            {"backfillId": 1},
+            sort=[("startedAt", DESCENDING)],
+        )
+        if latest is not None:
+            complete = {
+                checkpoint["mappingId"]
+                for checkpoint in collection.find(
+                    {"backfillId": latest["backfillId"], "state": "complete"},
+                    {"mappingId": 1},
+                )
+            }
+            if any(
+                endpoint["id"] not in complete
+                for endpoint in mapping_config
+                if is_backfilled(endpoint)
+            ):
+                return latest["backfillId"]
+    return str(ObjectId())
+
+
+def get_records(response: any, records_path: str | None) -> list | None:
+    """ Function to get the list of records of a page, either the page itself or the list at the records path of a
+    wrapped page, for example "data" in {"data": [...], "next": null}
+
+    :param response: response data from a source
+    :param records_path: dotted path of the list of records in the response, None if the response is the list
+    :return: the records, None if there is no list at the records path
+    """
+    if records_path:
+        for key in records_path.split("."):
+            if not isinstance(response, dict) or key not in response:
+                return None
+            response = response[key]
+    return response if isinstance(response, list) else None
+
+
+def get_checkpoint(connection_id: str, endpoint: dict, settings: dict) -> dict:
+    """ Function to get the checkpoint of an endpoint within a backfill, or to create it
+
+    :param connection_id: a unique identifier of a connection between applications
+    :param endpoint: row of the list of connections that need to be synced
+    :param settings: the paging settings of the backfill
+    :return: the checkpoint
+    """
+    checkpoint = collection.find_one(
+        {"backfillId": settings["backfillId"], "mappingId": endpoint["id"]}
+    )
+    if checkpoint is not None:
+        if checkpoint["state"] != "complete":
+            checkpoint["state"] = "running"
+            checkpoint["error"] = None
+        return checkpoint
+    checkpoint = {
+        "backfillId": settings["backfillId"],
+        "connectionId": connection_id,
+        "mappingId": endpoint["id"],
+        "url": endpoint["source"]["url"],
+        "state": "running",
+        "pageParameter": settings["pageParameter"],
+        "firstPage": settings["firstPage"],
+        "nextPage": settings["firstPage"],
+        "pages": settings["pages"],
+        "pagesDone": 0,
+        "records": 0,
+        "error": None,
+        "elapsed": 0.0,
+        "startedAt": datetime.utcnow(),
+        "updatedAt": datetime.utcnow(),
+    }
+    checkpoint["_id"] = collection.insert_one(checkpoint).inserted_id
+    return checkpoint
+
+
+def save_checkpoint(checkpoint: dict) -> None:
+    """ Function to save the progress of a backfill
+
+    :param checkpoint: the checkpoint, see get_checkpoint()
+    """
+    checkpoint["updatedAt"] = datetime.utcnow()
+    collection.update_one(
+        {"_id": checkpoint["_id"]},
+        {
+            "$set": {
+                key: value for key, value in checkpoint.items() if key != "_id"
+            }
+        },
+    )
+
+
+def backfill_page(
+    connection_config: dict,
+    sdks: dict,
+    endpoint: dict,
+    page_kwargs: dict,
+    settings: dict,
+) -> int | None:
+    """ Function to copy a single page of source data to the target
+
+    The whole page is transformed at once and written to the target with one call, so scripts with main_batch get
+    the page as their batch. A page without records is the end of the data. When the records of a wrapped page can
+    not be found, see get_records(), the end can only be known from the number of pages in the settings
+
+    :param connection_config: configuration of the connection between applications
+    :param sdks: dict with the imported SDKs for both applications
+    :param endpoint: row of the list of connections that need to be synced
+    :param page_kwargs: the paging kwargs of the source call
+    :param settings: the paging settings of the backfill
+    :return: the number of records of the page, 0 if the page was empty and None if an error occurred
+    """
+    run = {}
+    with SyncServerTracing.span("backfill_page", url=endpoint["source"]["url"]):
+        source_response = SyncServerHelpers.call_endpoint(
+            connection_config,
+            sdks,
+            endpoint,
+            "source",
+            run=run,
+            extra_kwargs=page_kwargs,
+            stop_on_error=False,
+        )
+        if run.get("error"):
+            return None
+        if source_response is None:
+            return 0
+        page_records = get_records(source_response, settings["recordsPath"])
+        if page_records is not None:
+            records = len(page_records)
+        elif settings["pages"]:
+            records = SyncServerStatistics.count_records(source_response)
+        else:
+            SyncServer.sync_server_log.error(
+                "No list of records in the response of %s, give the recordsPath or the number of pages",
+                endpoint["source"]["url"],
+            )
+            return None
+        if not records:
+            return 0
+        SyncServerHelpers.call_endpoint(
+            connection_config,
+            sdks,
+            endpoint,
+            "target",
+            source_response,
+            run,
+            stop_on_error=False,
+        )
+        if run.get("error"):
+            return None
+    return records
+
+
+def backfill_endpoint(
+    connection_config: dict, sdks: dict, endpoint: dict, settings: dict
+) -> dict:
+    """ Function to copy all pages of a source endpoint to the target, with settings["workers"] pages in flight
+
+    The checkpoint holds the first page that is not copied yet, all pages before it are copied. After a crash or a
+    stop the backfill continues from there, pages after it that were already copied are copied again.
+
+    :param connection_config: configuration of the connection between applications
+    :param sdks: dict with the imported SDKs for both applications
+    :param endpoint: row of the list of connections that need to be synced
+    :param settings: the paging settings of the backfill
+    :return: the final checkpoint
+    """
+    checkpoint = get_checkpoint(connection_config["id"], endpoint, settings)
+    if checkpoint["state"] == "complete":  # copied before the backfill was resumed
+        return checkpoint
+    page_parameter = SyncServerHelpers.convert_camelcase_to_snakecase(
+        checkpoint["pageParameter"]
+    )
+    page_kwargs = {}
+    if settings["pageSizeParameter"]:
+        page_kwargs[
+            SyncServerHelpers.convert_camelcase_to_snakecase(
+                settings["pageSizeParameter"]
+            )
+        ] = settings["pageSize"]
+    last_page = None
+    if checkpoint["pages"]:
+        last_page = checkpoint["firstPage"] + checkpoint["pages"]
+    next_submit = checkpoint["nextPage"]
+    in_flight = {}
+    copied = set()
+    timer = time.perf_counter()
+    saved = timer
+    with ThreadPoolExecutor(max_workers=settings["workers"]) as executor:
+        while True:
+            while (
+                connection_config["id"] not in stop_backfills
+                and checkpoint["error"] is None
+                and len(in_flight) < settings["workers"]
+                and (last_page is None or next_submit < last_page)
+            ):
+                future = executor.submit(
+                    backfill_page,
+                    connection_config,
+                    sdks,
+                    endpoint,
+                    dict(page_kwargs, **{page_parameter: next_submit}),
+                    settings,
+                )
+                in_flight[future] = next_submit
+                next_submit += 1
+            if not in_flight:
+                break
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                page = in_flight.pop(future)
+                records = future.result()
+                if records is None:
+                    checkpoint["error"] = "Copying page " + str(page) + " failed"
+                elif records == 0:
+                    # the first empty page is the end of the source data
+                    if last_page is None or page < last_page:
+                        last_page = page
+                else:
+                    copied.add(page)
+                    checkpoint["pagesDone"] += 1
+                    checkpoint["records"] += records
+            while checkpoint["nextPage"] in copied:
+                copied.remove(checkpoint["nextPage"])
+                checkpoint["nextPage"] += 1
+            if time.perf_counter() - saved >= checkpoint_interval:
+                checkpoint["elapsed"] += time.perf_counter() - timer
+                timer = saved = time.perf_counter()
+                save_checkpoint(checkpoint)
+    checkpoint["elapsed"] += time.perf_counter() - timer
+    if checkpoint["error"] is not None:
+        checkpoint["state"] = "failed"
+    elif connection_config["id"] in stop_backfills:
+        checkpoint["state"] = "stopped"
+    else:
+        checkpoint["state"] = "complete"
+        checkpoint["nextPage"] = last_page
+    save_checkpoint(checkpoint)
+    return checkpoint
+
+
+def seed_cache(connection_config: dict, sdks: dict, endpoint: dict) -> None:
+    """ Function to save the current response of a source in the cache, so the sync server starts with the state after
+    the backfill instead of copying the latest data again
+
+    :param connection_config: configuration of the connection between applications
+    :param sdks: dict with the imported SDKs for both applications
+    :param endpoint: row of the list of connections that need to be synced
+    """
+    run = {}
+    source_response = SyncServerHelpers.call_endpoint(
+        connection_config, sdks, endpoint, "source", run=run, stop_on_error=False
+    )
+    if not run.get("error") and source_response is not None:
+        SyncServerHelpers.save_cache(endpoint, source_response)
+
+
+def backfill_process(
+    connection_config: dict, sdks: dict, mapping_config: list, settings: dict
+) -> None:
+    """ Function that runs in a separate thread and backfills the endpoints of a connection one after the other
+
+    Only endpoint mappings from an API to an API are backfilled, see is_backfilled()
+
+    :param connection_config: configuration of the connection between applications
+    :param sdks: dict with the imported SDKs for both applications
+    :param mapping_config: list of endpoint mappings, see SyncServerHelpers.get_mapping_config()
+    :param settings: the paging settings of the backfill
+    """
+    connection_id = connection_config["id"]
+    try:
+        for endpoint in mapping_config:
+            if connection_id in stop_backfills:
+                break
+            if not is_backfilled(endpoint):
+                continue
+            SyncServer.sync_server_log.info(
+                "Backfilling endpoint: %s", endpoint["source"]["url"]
+            )
+            checkpoint = backfill_endpoint(connection_config, sdks, endpoint, settings)
+            SyncServer.sync_server_log.info(
+                "Backfill of endpoint: %s %s, %s records in %s pages",
+                endpoint["source"]["url"],
+                checkpoint["state"],
+                checkpoint["records"],
+                checkpoint["pagesDone"],
+            )
+            if checkpoint["state"] != "complete":
+                break
+            seed_cache(connection_config, sdks, endpoint)
+    finally:
+        stop_session(connection_id)
+        stop_backfills.discard(connection_id)
+        backfill_threads.pop(connection_id, None)
+
+
+def add_progress(checkpoint: dict) -> dict:
+    """ Function to add the progress and the estimated remaining time to a checkpoint
+
+    The remaining time can only be estimated when the number of pages is given at the start of the backfill
+
+    :param checkpoint: the checkpoint, see get_checkpoint()
+    :return: the checkpoint with progress (0 to 1 or None) and eta (in seconds or None)
+    """
+    checkpoint["_id"] = str(checkpoint["_id"])
+    checkpoint["recordsPerSecond"] = (
+        round(checkpoint["records"] / checkpoint["elapsed"], 2)
+        if checkpoint["elapsed"]
+        else None
+    )
+    checkpoint["progress"] = None
+    checkpoint["eta"] = None
+    if checkpoint["state"] == "complete":
+        checkpoint["progress"] = 1
+        checkpoint["eta"] = 0
+    elif checkpoint["pages"]:
+        checkpoint["progress"] = round(
+            min(1, checkpoint["pagesDone"] / checkpoint["pages"]), 4
+        )
+        if checkpoint["pagesDone"] and checkpoint["elapsed"]:
+            pages_left = max(0, checkpoint["pages"] - checkpoint["pagesDone"])
+            checkpoint["eta"] = round(
+                pages_left * checkpoint["elapsed"] / checkpoint["pagesDone"]
+            )
+    return checkpoint
+
+
+@sync_server_backfill.route("/api/server/backfill/start/", methods=["GET"])
+def start_backfill() -> tuple:
+    """ Function to start a one time copy of all source data of a connection to its targets
+
+    The source endpoints are read page by page with many pages in parallel, every page is transformed and written to
+    the target as a whole. The progress is checkpointed, so a backfill that crashed or was stopped can be resumed.
+
+    :return: Flask response with errors if they occur in the initialisation phase
+    """
+    args = request.args
+    connection_id = args.get("id", default=None, type=str)
+    settings = {
+        "pageParameter": args.get("pageParameter", default=None, type=str),
+        "firstPage": args.get("firstPage", default=1, type=int),
+        "pageSizeParameter": args.get("pageSizeParameter", default=None, type=str),
+        "pageSize": args.get("pageSize", default=100, type=int),
+        "pages": args.get("pages", default=None, type=int),
+        "recordsPath": args.get("recordsPath", default=None, type=str),
+        "workers": max(1, args.get("workers", default=8, type=int)),
+    }
+    options = {
+        "session": get_session(connection_id),
+        "rawResponse": args.get("raw", default=False, type=bool),
+        "verifyTransform": args.get("verify", default=False, type=bool),
+        "batchSize": args.get("batchSize", default=1000, type=int),
+        "poolSize": args.get("poolSize", default=32, type=int),
+        "requestTimeout": args.get("timeout", default=60, type=int) or None,
+        "compression": args.get("compression", default=True, type=bool),
+        "maxResponseSize": args.get("maxResponseSize", default=0, type=int),
+    }
+    if connection_id is None or settings["pageParameter"] is None:
+        return (
+            jsonify(
+                {"success": False, "reason": "Connection ID and page parameter are required"}
+            ),
+            400,
+            {"ContentType": "application/json"},
+        )
+    if options["batchSize"] < 0:
+        return (
+            jsonify({"success": False, "reason": "Batch size can not be negative"}),
+            400,
+            {"ContentType": "application/json"},
+        )
+    if connection_id in backfill_threads:
+        return (
+            jsonify({"success": False, "reason": "backfill is already running"}),
+            500,
+            {"ContentType": "application/json"},
+        )
+    SyncServer.start_log_listener()
+    if not SyncServer.get_state_sync_server():
+        SyncServer.start_log_session(connection_id)
+    SyncServerScripts.start_script_pool(
+        args.get("scriptWorkers", default=2, type=int),
+        args.get("scriptTimeout", default=30, type=int),
+        args.get("scriptMemory", default=0, type=int),
+        options["session"],
+    )
+    reason, status, connection_config, sdks, mapping_config = (
+        SyncServerHelpers.prepare_connection(
+            connection_id, options, stop_on_error=False
+        )
+    )
+    if reason is not None:
+        stop_session(connection_id)
+        return (
+            jsonify({"success": False, "reason": reason}),
+            status,
+            {"ContentType": "application/json"},
+        )
+    settings["backfillId"] = get_backfill_id(
+        connection_id, args.get("resume", default=True, type=bool), mapping_config
+    )
+    backfill_threads[connection_id] = Thread(
+        target=backfill_process,
+        args=[connection_config, sdks, mapping_config, settings],
+    )
+    backfill_threads[connection_id].start()
+    return jsonify({"success": True}), 200, {"ContentType": "application/json"}
+
+
+@sync_server_backfill.route("/api/server/backfill/stop/", methods=["GET"])
+def stop_backfill() -> tuple:
+    """ Function to stop a running backfill, the pages that are in flight are finished first
+
+    :return: Flask response
+    """
+    connection_id = request.args.get("id", default=None, type=str)
+    if connection_id not in backfill_threads:
+        return (
+            jsonify({"success": False, "reason": "backfill not running"}),
+            500,
+            {"ContentType": "application/json"},
+        )
+    stop_backfills.add(connection_id)
+    return jsonify({"success": True}), 200, {"ContentType": "application/json"}
+
+
+@sync_server_backfill.route("/api/server/backfill/", methods=["GET"])
+def get_backfill_progress() -> tuple:
+    """ Function to get the progress of the latest backfill of a connection
+
+    :return: Flask response containing a checkpoint with progress and ETA per endpoint
+    """
+    connection_id = request.args.get("id", default=None, type=str)
+    latest = collection.find_one(
+        {"connectionId": connection_id},
+        {"backfillId": 1},
+        sort=[("startedAt", DESCENDING)],
+    )
+    checkpoints = []
+    if latest is not None:
+        for checkpoint in collection.find({"backfillId": latest["backfillId"]}).sort(
+            "startedAt", DESCENDING
+        ):
+            checkpoints.append(add_progress(checkpoint))
+    return (
+        jsonify(
+            {
+                "success": True,
+                "running": connection_id in backfill_threads,
+                "data": checkpoints,
+            }
+        ),
+        200,
+        {"ContentType": "application/json"},
+    )
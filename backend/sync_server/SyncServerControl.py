@@ -0,0 +1,293 @@
+import os
+from datetime import datetime, timedelta
+
+from bson import ObjectId
+from bson.errors import InvalidId
+from flask import jsonify, request, Blueprint
+from pymongo import ASCENDING, ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+from backend import db
+
+sync_server_control = Blueprint("SyncServerControl", __name__)
+collection = db["sync_control"]
+leases = db["sync_leases"]  # one lease per connection that should be synced, with the connection id as _id
+
+# SYNC_SERVER_MODE=worker runs the sync server in separate worker processes (python -m backend.sync_server.SyncWorker),
+# the API then only sends commands to the workers and reads their status, the workers set remote_sync to False
+remote_sync = os.environ.get("SYNC_SERVER_MODE", "embedded") == "worker"
+status_timeout = 15  # seconds without a heartbeat after which a worker is considered dead
+command_timeout = 60  # seconds a command waits for a worker, older pending commands are never handled
+# seconds after which Mongo removes commands and the statuses of dead workers, see Indexes.get_indexes()
+control_ttl = 24 * 60 * 60
+lease_duration = 30  # seconds a lease stays valid without a renewal
+
+
+def send_command(command: str, connection_id: str | None, settings: dict = None) -> str:
+    """ Function to queue a command for the sync workers
+
+    :param command: either start or stop
+    :param connection_id: a unique identifier of a connection between applications
+    :param settings: the settings of the sync session for a start command, see SyncServer.start_sync_server()
+    :return: the id of the command
+    """
+    insert = collection.insert_one(
+        {
+            "type": "command",
+            "command": command,
+            "connectionId": connection_id,
+            "settings": settings,
+            "state": "pending",
+            "reason": None,
+            "worker": None,
+            "createdAt": datetime.utcnow(),
+            "handledAt": None,
+        }
+    )
+    return str(insert.inserted_id)
+
+
+def claim_command(worker_id: str, running_connection_id: str | None) -> dict | None:
+    """ Function for a worker to take the oldest command it can handle. An idle worker takes start commands, a worker
+    that runs a connection takes the stop commands of that connection. Commands that waited longer than
+    command_timeout are skipped, so a start that no worker picked up does not run when a worker comes up much later
+
+    :param worker_id: unique identifier of the worker
+    :param running_connection_id: the connection the worker runs, None if it is idle
+    :return: the command, None if there is no command for the worker
+    """
+    query = {
+        "type": "command",
+        "state": "pending",
+        "createdAt": {"$gt": datetime.utcnow() - timedelta(seconds=command_timeout)},
+    }
+    if running_connection_id is None:
+        query["command"] = "start"
+    else:
+        query["command"] = "stop"
+        query["connectionId"] = running_connection_id
+    return collection.find_one_and_update(
+        query,
+        {"$set": {"state": "handling", "worker": worker_id}},
+        sort=[("createdAt", ASCENDING)],
+        return_document=ReturnDocument.AFTER,
+    )
+
+
+def finish_command(command: dict, success: bool, reason: str = None) -> None:
+    """ Function to save the result of a command
+
+    :param command: the command, see claim_command()
+    :param success: bool if the command succeeded
+    :param reason: the reason if it failed
+    """
+    collection.update_one(
+        {"_id": command["_id"]},
+        {
+            "$set": {
+                "state": "done" if success else "failed",
+                "reason": reason,
+                "handledAt": datetime.utcnow(),
+            }
+        },
+    )
+
+
+def publish_status(
+    worker_id: str, connection_id: str | None, running: bool, metrics: dict = None
+) -> None:
+    """ Function for a worker to publish its status, this is also its heartbeat
+
+    :param worker_id: unique identifier of the worker
+    :param connection_id: the connection the worker runs, None if it is idle
+    :param running: bool if the sync server of the worker is running
+    :param metrics: the metrics of the worker, see SyncServerMetrics.get_snapshot()
+    """
+    collection.update_one(
+        {"_id": worker_id},
+        {
+            "$set": {
+                "type": "status",
+                "connectionId": connection_id,
+                "running": running,
+                "metrics": metrics,
+                "heartbeat": datetime.utcnow(),
+            }
+        },
+        upsert=True,
+    )
+
+
+def remove_status(worker_id: str) -> None:
+    """ Function to remove the status of a worker that stops
+
+    :param worker_id: unique identifier of the worker
+    """
+    collection.delete_one({"_id": worker_id})
+
+
+def get_workers() -> list:
+    """ Function to get the status of the workers that are alive
+
+    :return: list of worker statuses
+    """
+    workers = []
+    for worker in collection.find(
+        {
+            "type": "status",
+            "heartbeat": {"$gt": datetime.utcnow() - timedelta(seconds=status_timeout)},
+        }
+    ):
+        workers.append(worker)
+    return workers
+
+
+def get_running_connections() -> list:
+    """ Function to get the connections that are synced, these are the connections with a lease
+
+    :return: list of connection ids
+    """
+    return [lease["_id"] for lease in leases.find({}, {"_id": 1})]
+
+
+def stop_connection(connection_id: str) -> str | None:
+    """ Function to stop the sync of a connection. A stop command is sent to the worker that owns its lease, or when
+    that worker died the lease is removed right away
+
+    :param connection_id: a unique identifier of a connection between applications
+    :return: the id of the stop command, None if the lease was removed
+    """
+    removed = leases.delete_one(
+        {"_id": connection_id, "expiresAt": {"$lt": datetime.utcnow()}}
+    )
+    if removed.deleted_count:
+        return None
+    return send_command("stop", connection_id)
+
+
+def create_lease(connection_id: str, settings: dict, worker_id: str) -> bool:
+    """ Function to take the lease of a connection that is started, a connection is synced by the worker that owns its
+    lease. The lease stays until the connection is stopped, when its owner dies another worker takes it over
+
+    :param connection_id: a unique identifier of a connection between applications
+    :param settings: the settings of the sync session, see SyncServer.start_sync_server()
+    :param worker_id: unique identifier of the worker
+    :return: bool if the lease is created, False if the connection is already synced
+    """
+    try:
+        leases.insert_one(
+            {
+                "_id": connection_id,
+                "owner": worker_id,
+                "settings": settings,
+                "expiresAt": datetime.utcnow() + timedelta(seconds=lease_duration),
+            }
+        )
+    except DuplicateKeyError:
+        return False
+    return True
+
+
+def acquire_lease(worker_id: str) -> dict | None:
+    """ Function for an idle worker to take over the expired lease of a connection, whose worker died
+
+    :param worker_id: unique identifier of the worker
+    :return: the lease, None if no lease expired
+    """
+    now = datetime.utcnow()
+    return leases.find_one_and_update(
+        {"expiresAt": {"$lt": now}},
+        {
+            "$set": {
+                "owner": worker_id,
+                "expiresAt": now + timedelta(seconds=lease_duration),
+            }
+        },
+        sort=[("expiresAt", ASCENDING)],
+        return_document=ReturnDocument.AFTER,
+    )
+
+
+def renew_lease(connection_id: str, worker_id: str) -> bool:
+    """ Function for a worker to extend its lease, this is done every heartbeat
+
+    :param connection_id: a unique identifier of a connection between applications
+    :param worker_id: unique identifier of the worker
+    :return: bool if the worker still owns the lease
+    """
+    updated = leases.update_one(
+        {"_id": connection_id, "owner": worker_id},
+        {"$set": {"expiresAt": datetime.utcnow() + timedelta(seconds=lease_duration)}},
+    )
+    return updated.matched_count == 1
+
+
+def expire_lease(connection_id: str, worker_id: str, delay: float = 0) -> None:
+    """ Function for a worker that shuts down, or that could not start the connection, to hand its lease over to
+    another worker
+
+    :param connection_id: a unique identifier of a connection between applications
+    :param worker_id: unique identifier of the worker
+    :param delay: seconds before another worker can take the lease over
+    """
+    leases.update_one(
+        {"_id": connection_id, "owner": worker_id},
+        {"$set": {"expiresAt": datetime.utcnow() + timedelta(seconds=delay)}},
+    )
+
+
+def release_lease(connection_id: str, worker_id: str) -> None:
+    """ Function to remove the lease of a connection that is stopped
+
+    :param connection_id: a unique identifier of a connection between applications
+    :param worker_id: unique identifier of the worker
+    """
+    leases.delete_one({"_id": connection_id, "owner": worker_id})
+
+
+@sync_server_control.route("/api/server/command", methods=["GET"])
+def get_command() -> tuple:
+    """ Function to get the state of a command that was sent to the sync workers
+
+    :return: Flask response containing the command
+    """
+    try:
+        command_id = ObjectId(request.args.get("id", default=None, type=str))
+    except (InvalidId, TypeError):
+        return (
+            jsonify({"success": False, "reason": "Command ID is not valid"}),
+            400,
+            {"ContentType": "application/json"},
+        )
+    command = collection.find_one({"_id": command_id, "type": "command"})
+    if command is None:
+        return (
+            jsonify({"success": False, "reason": "Command not found"}),
+            404,
+            {"ContentType": "application/json"},
+        )
+    command["_id"] = str(command["_id"])
+    expired = datetime.utcnow() - timedelta(seconds=command_timeout)
+    if command["state"] == "pending" and command["createdAt"] < expired:
+        command["state"] = "expired"  # no worker picked it up in time, see claim_command()
+    return (
+        jsonify({"success": True, "data": command}),
+        200,
+        {"ContentType": "application/json"},
+    )
+
+
+@sync_server_control.route("/api/server/workers", methods=["GET"])
+def get_worker_status() -> tuple:
+    """ Function to get the status of the sync workers that are alive
+
+    :return: Flask response containing the worker statuses, without their metrics
+    """
+    workers = get_workers()
+    for worker in workers:
+        worker.pop("metrics", None)
+    return (
+        jsonify({"success": True, "data": workers}),
+        200,
+        {"ContentType": "application/json"},
+    )
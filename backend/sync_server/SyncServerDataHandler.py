@@ -1,16 +1,34 @@
-import importlib
 import io
-import sys
+import json
+import logging
 import traceback
 from datetime import date, datetime
 from types import ModuleType
 
-import jsonpickle
-from glom import glom
-
 from backend.connection import ConnectionVariable
 from backend.connection.low_level import MappingGenerator
-from backend.sync_server import SyncServer
+from backend.sync_server import (
+    MappingCompiler,
+    SyncServer,
+    SyncServerScripts,
+    SyncServerTracing,
+)
+
+try:
+    import orjson
+except ImportError:  # orjson is optional, the standard json module is used as a fallback
+    orjson = None
+
+
+def load_json(data: bytes | str) -> any:
+    """ Function to parse a raw JSON body into plain Python objects, using orjson when it is installed
+
+    :param data: raw body of a response as bytes or string
+    :return: the parsed body as dicts, lists and primitives
+    """
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
 
 
 def get_url_with_parameters(url: str, packed_parameters: dict) -> str:
@@ -78,8 +96,8 @@ def get_parameter_value(
             return element["value"]
         else:
             SyncServer.sync_server_log.error(
-                "Not able to get variable value to satisfy the parameter, parameter id:"
-                + data_target_id
+                "Not able to get variable value to satisfy the parameter, parameter id:%s",
+                data_target_id,
             )
             return
     else:
@@ -128,8 +146,10 @@ def generate_target_data(
     connection_config: dict,
 ) -> dict:
     """ Function to pack the main payload, the request body, and the parameters to be used when the API gets called.
-    It can generate data through Glom with a one-on-one mapping of data elements between the source and target.
-    It can also call the connection script that the user added in the Low Level mapping interface
+    It can generate data through Glom with a one-on-one mapping of data elements between the source and target, the
+    mapping is compiled to a specialised Python function by MappingCompiler.
+    It can also call the connection script that the user added in the Low Level mapping interface, see
+    SyncServerScripts.run_script() for the main and main_batch contract of a script
 
     :param api_instance:
     :param endpoint: current row of the list of connections that need to be synced
@@ -139,9 +159,13 @@ def generate_target_data(
     """
     packed_target_data = {}
     if endpoint["type"] == "glom":
-        glom_mapping = jsonpickle.decode(endpoint["glomMapping"])
         try:
-            target_data = glom(source_response, glom_mapping)
+            with SyncServerTracing.span("glom"):
+                target_data = MappingCompiler.transform(
+                    endpoint["glomMapping"],
+                    source_response,
+                    verify=connection_config.get("verifyTransform", False),
+                )
             packed_target_data[
                 api_instance.users_post_endpoint.params_map["all"][0]
             ] = target_data
@@ -149,10 +173,9 @@ def generate_target_data(
 
         except Exception as e:
             SyncServer.sync_server_log.error(
-                "Error while generating target data: endpoint id:"
-                + endpoint["id"]
-                + "error encountered: "
-                + str(e)
+                "Error while generating target data: endpoint id:%s error encountered: %s",
+                endpoint["id"],
+                e,
             )
     elif endpoint["type"] == "script":
         schema_mapping_id = endpoint["target"]["schemaItems"][0]["id"]
@@ -161,32 +184,34 @@ def generate_target_data(
             script_id = schema_mapping["id"]
             kwargs = generate_variables_as_kwargs(connection_config["id"])
             try:
-                sys.path.append("../connection_scripts")
-                script = importlib.import_module(script_id)
-                try:
-                    SyncServer.sync_server_log.info(
-                        "Converting response with custom script"
-                    )
-                    target_data = script.main(source_response, **kwargs)
-                    body_param_name = get_body_param_name(api_instance, endpoint)
-                    if body_param_name:
-                        packed_target_data[body_param_name[0]] = target_data
-                        return packed_target_data
-                except Exception as e:
-                    SyncServer.sync_server_log.error(
-                        "Error in added script, script id: "
-                        + script_id
-                        + ", error: "
-                        + str(e)
+                SyncServer.sync_server_log.info("Converting response with custom script")
+                with SyncServerTracing.span("script", script=script_id):
+                    target_data = SyncServerScripts.execute_script(
+                        script_id,
+                        source_response,
+                        kwargs,
+                        connection_config.get(
+                            "batchSize", SyncServerScripts.default_batch_size
+                        ),
+                        connection_config.get(
+                            "session", SyncServerScripts.default_session
+                        ),
                     )
-                    SyncServer.sync_server_log.error(traceback.format_exc())
+                body_param_name = get_body_param_name(api_instance, endpoint)
+                if body_param_name:
+                    packed_target_data[body_param_name[0]] = target_data
+                    return packed_target_data
             except ImportError as e:
                 SyncServer.sync_server_log.error(
-                    "Error while generating target data with script id:"
-                    + script_id
-                    + "error encountered: "
-                    + str(e)
+                    "Error while generating target data with script id:%s error encountered: %s",
+                    script_id,
+                    e,
                 )
+            except Exception as e:
+                SyncServer.sync_server_log.error(
+                    "Error in added script, script id: %s, error: %s", script_id, e
+                )
+                SyncServer.sync_server_log.error("%s", traceback.format_exc())
     else:
         raise ValueError(
             "Connection type is not supported, either glom or script is supported, given type:"
@@ -210,9 +235,10 @@ def generate_calling_kwargs(
     :param source_response: response data from a source
     :return: dict of kwargs as payload for the API
     """
-    packed_path_parameters = generate_packed_path_parameters(
-        connection_config, endpoint, endpoint_end
-    )
+    with SyncServerTracing.span("generate_packed_path_parameters"):
+        packed_path_parameters = generate_packed_path_parameters(
+            connection_config, endpoint, endpoint_end
+        )
     if source_response is not None:
         target_data = generate_target_data(
             api_instance, endpoint, source_response, connection_config
@@ -271,14 +297,15 @@ def set_variables(
                     # found_path = convert_camelcase_to_snakecase(found_path)
                     target_paths = found_path.split(".")
                     value = MappingGenerator.get_by_path(source_response, target_paths)
-                    SyncServer.sync_server_log.info(
-                        "Setting variable: "
-                        + ConnectionVariable.get_variable(
-                            connection_config["id"], schema_mapping["target"]
-                        )["name"]
-                        + " with the following value: "
-                        + str(value)
-                    )
+                    if SyncServer.sync_server_log.isEnabledFor(logging.INFO):
+                        # the name of the variable is only looked up when it is logged
+                        SyncServer.sync_server_log.info(
+                            "Setting variable: %s with the following value: %s",
+                            ConnectionVariable.get_variable(
+                                connection_config["id"], schema_mapping["target"]
+                            )["name"],
+                            SyncServer.format_payload(value),
+                        )
                     if not ConnectionVariable.set_variable(
                         connection_config["id"], schema_mapping["target"], value
                     ):
@@ -294,50 +321,53 @@ def set_variables(
                 script_id = schema_mapping["id"]
                 kwargs = generate_variables_as_kwargs(connection_config["id"])
                 try:
-                    sys.path.append("../connection_scripts")
-                    script = importlib.import_module(script_id)
-                    try:
-                        SyncServer.sync_server_log.info(
-                            "Converting response with custom script"
-                        )
-                        value = script.main(source_response, **kwargs)
-                        SyncServer.sync_server_log.info(
-                            "Setting variable: "
-                            + ConnectionVariable.get_variable(
-                                connection_config["id"], schema_mapping["target"]
-                            )["name"]
-                            + " with the following value: "
-                            + str(value)
-                        )
-                        if not ConnectionVariable.set_variable(
-                            connection_config["id"], schema_mapping["target"], value
-                        ):
-                            SyncServer.sync_server_log.error(
-                                "Error while trying to set value for a variable, variable: "
-                                + ConnectionVariable.get_variable(
-                                    connection_config["id"], schema_mapping["target"]
-                                )["name"]
-                                + ", value: "
-                                + str(value)
-                            )
-                            SyncServer.stop_sync_server(emergency_stop=True)
-                            return
-                    except Exception as e:
-                        SyncServer.sync_server_log.error(
-                            "Error in added script, script id: "
-                            + script_id
-                            + ", error: "
-                            + str(e)
+                    SyncServer.sync_server_log.info(
+                        "Converting response with custom script"
+                    )
+                    with SyncServerTracing.span("script", script=script_id):
+                        value = SyncServerScripts.execute_script(
+                            script_id,
+                            source_response,
+                            kwargs,
+                            batch_size=0,
+                            session=connection_config.get(
+                                "session", SyncServerScripts.default_session
+                            ),
                         )
-                        SyncServer.sync_server_log.error(traceback.format_exc())
-                        return
                 except ImportError as e:
                     SyncServer.sync_server_log.error(
-                        "Error while generating target data with script id:"
-                        + script_id
-                        + "error encountered: "
-                        + str(e)
+                        "Error while generating target data with script id:%s error encountered: %s",
+                        script_id,
+                        e,
+                    )
+                    return
+                except Exception as e:
+                    SyncServer.sync_server_log.error(
+                        "Error in added script, script id: %s, error: %s", script_id, e
+                    )
+                    SyncServer.sync_server_log.error("%s", traceback.format_exc())
+                    return
+                if SyncServer.sync_server_log.isEnabledFor(logging.INFO):
+                    # the name of the variable is only looked up when it is logged
+                    SyncServer.sync_server_log.info(
+                        "Setting variable: %s with the following value: %s",
+                        ConnectionVariable.get_variable(
+                            connection_config["id"], schema_mapping["target"]
+                        )["name"],
+                        SyncServer.format_payload(value),
+                    )
+                if not ConnectionVariable.set_variable(
+                    connection_config["id"], schema_mapping["target"], value
+                ):
+                    SyncServer.sync_server_log.error(
+                        "Error while trying to set value for a variable, variable: "
+                        + ConnectionVariable.get_variable(
+                            connection_config["id"], schema_mapping["target"]
+                        )["name"]
+                        + ", value: "
+                        + str(value)
                     )
+                    SyncServer.stop_sync_server(emergency_stop=True)
                     return
 
             else:
@@ -1,18 +1,51 @@
 import importlib
+import logging
+import os
 import re
+import socket
 import sys
+import time
 import traceback
 from copy import deepcopy
+from datetime import datetime, timedelta
 from types import ModuleType
 
 from bson import ObjectId
+from pymongo import ReturnDocument
+from urllib3.connection import HTTPConnection
+from urllib3.util import make_headers
 
 from backend import db
 from backend.application import ApplicationConfig, clientSDK
 from backend.connection import ConnectionConfig, ConnectionVariable
-from backend.sync_server import SyncServer, SyncServerDataHandler
+from backend.sync_server import (
+    SyncServer,
+    SyncServerDataHandler,
+    SyncServerScripts,
+    SyncServerStatistics,
+    SyncServerTracing,
+)
 
 collection = db["cache"]
+# seconds after their last update that cache entries are removed by Mongo, see Indexes.ensure_indexes()
+cache_ttl = int(os.environ.get("SYNC_CACHE_TTL", 7 * 24 * 60 * 60))
+# options of the sync session that are kept in the connection config, see SyncServer.start()
+session_options = [
+    "id",
+    "session",
+    "rawResponse",
+    "verifyTransform",
+    "batchSize",
+    "poolSize",
+    "requestTimeout",
+    "compression",
+    "maxResponseSize",
+]
+default_pool_size = 32  # connections per application, urllib3 keeps 10 without it
+api_clients = {}  # per (session, application id): the ApiClient that all endpoint mappings of the session share
+# gzip and deflate, and br when brotli is installed, urllib3 decodes these transparently
+accept_encoding = make_headers(accept_encoding=True)["accept-encoding"]
+unchanged_polls = {}  # per endpoint mapping id: [polls without changes, time of the last log message]
 
 
 def format_configs(connection_id: str) -> tuple[dict, dict]:
@@ -91,14 +124,17 @@ def convert_parameters(parameter_items: list) -> list:
     return converted_parameters
 
 
-def get_mapping_config(connection_config: dict, application_configs: dict) -> list:
+def get_mapping_config(
+    connection_config: dict, application_configs: dict, stop_on_error: bool = True
+) -> list:
     """ Function to extract needed information from the connection config and the application configs.
     This is needed to convert the configs to an easily loop-able list of connection with all needed information,
     instead of a config with the details and connections separately.
 
     :param connection_config: configuration of the connection between applications
     :param application_configs: a dict with application configs with their id as key
-    :return: list of connections with details per list item
+    :param stop_on_error: bool to stop the sync server on an error, a backfill only reports the error
+    :return: list of connections with details per list item, empty if an error occurred
     """
     mapping_config = []
     for connection in connection_config["endpointMapping"]:
@@ -135,7 +171,9 @@ def get_mapping_config(connection_config: dict, application_configs: dict) -> li
                             SyncServer.sync_server_log.error(
                                 "No server url defined in the OpenAPI servers section"
                             )
-                            SyncServer.stop_sync_server()
+                            if stop_on_error:
+                                SyncServer.stop_sync_server(emergency_stop=True)
+                            return []
                     if connection[connection_end]["parameterItems"]:
                         connection_copy[connection_end][
                             "parameterItems"
@@ -155,7 +193,10 @@ def get_mapping_config(connection_config: dict, application_configs: dict) -> li
                     connection_copy[connection_end][
                         "apiInstanceConfig"
                     ] = generate_sdk_instance_configurations(
-                        application_configs[connection[connection_end]["applicationId"]]
+                        application_configs[connection[connection_end]["applicationId"]],
+                        connection[connection_end]["applicationId"],
+                        connection_config,
+                        stop_on_error,
                     )
                 elif connection[connection_end]["label"] == "Variables":
                     connection_copy[connection_end]["type"] = "variables"
@@ -171,6 +212,180 @@ def get_mapping_config(connection_config: dict, application_configs: dict) -> li
     return mapping_config
 
 
+def prepare_connection(
+    connection_id: str, options: dict, stop_on_error: bool = True
+) -> tuple[str | None, int, dict, dict, list]:
+    """ Function to gather the configs and SDKs of a connection, used by the sync server on start and by a backfill
+
+    :param connection_id: a unique identifier of a connection between applications
+    :param options: options of the session that are added to the connection config, see session_options
+    :param stop_on_error: bool to stop the sync server on an error, a backfill only reports the error
+    :return: a tuple with the reason if the connection can not be synced (None otherwise) and a http status code,
+    the connection config, the imported SDKs and the list of endpoint mappings
+    """
+    with SyncServerTracing.span("format_configs", connection=connection_id):
+        connection_config, application_configs = format_configs(connection_id)
+    if connection_config["state"] != "Complete":
+        return "Mapped connection config is incomplete", 400, {}, {}, []
+    refresh_sdk, emergency_stop = handle_sdk_state(
+        connection_config, application_configs
+    )
+    if emergency_stop:
+        return "An error occurred during the SDK handling", 500, {}, {}, []
+    if refresh_sdk:
+        # if true configs need to be refreshed because sdks are generated and that changes the configs
+        connection_config, application_configs = format_configs(connection_id)
+    connection_config["id"] = connection_id
+    connection_config.update(options)
+    mapping_config = get_mapping_config(
+        connection_config, application_configs, stop_on_error
+    )
+    if not mapping_config:
+        return (
+            "The connection does not contain any GET requests, making it impossible to sync the applications",
+            500,
+            {},
+            {},
+            [],
+        )
+    SyncServer.sync_server_log.info("Syncing the following applications: ")
+    for application_id in connection_config["applicationIds"]:
+        SyncServer.sync_server_log.info(
+            "%s", application_configs[application_id]["name"]
+        )
+    state, sdks = get_sdks_as_import(
+        connection_config, application_configs, stop_on_error
+    )
+    if not state:
+        return "There was an error importing SDKs", 500, {}, {}, []
+    return None, 200, connection_config, sdks, mapping_config
+
+
+def get_config_versions(connection_config: dict) -> dict:
+    """ Function to get the configVersion of the connection and its applications, with two small projected reads
+
+    :param connection_config: configuration of the connection between applications
+    :return: a dict with the configVersion per connection or application id
+    """
+    connection = ConnectionConfig.collection.find_one(
+        {"_id": ObjectId(connection_config["id"])}, {"configVersion": 1}
+    )
+    versions = {
+        connection_config["id"]: connection.get("configVersion", 0) if connection else 0
+    }
+    for application in ApplicationConfig.collection.find(
+        {
+            "_id": {
+                "$in": [
+                    ObjectId(application_id)
+                    for application_id in connection_config["applicationIds"]
+                ]
+            }
+        },
+        {"configVersion": 1},
+    ):
+        versions[str(application["_id"])] = application.get("configVersion", 0)
+    return versions
+
+
+def reload_configs(
+    connection_config: dict, sdks: dict, mapping_config: list, versions: dict
+) -> dict:
+    """ Function to reload the configs of a running sync when the connection or one of its applications changed
+
+    Only the endpoint mappings that changed, or that use an application that changed, are rebuilt and their cache is
+    emptied so they are synced again with the new mapping. The other endpoint mappings are kept as they are, together
+    with their cache. The connection config, SDKs and mapping config are updated in place.
+
+    :param connection_config: configuration of the connection between applications
+    :param sdks: dict with the imported SDKs for both applications
+    :param mapping_config: list of endpoint mappings, see get_mapping_config()
+    :param versions: the versions the current configs were loaded with, see get_config_versions()
+    :return: the versions of the configs after the reload
+    """
+    current_versions = get_config_versions(connection_config)
+    if current_versions == versions:
+        return versions
+    SyncServer.sync_server_log.info("Configuration changed, reloading the mappings")
+    new_connection_config, application_configs = format_configs(connection_config["id"])
+    if new_connection_config["state"] != "Complete":
+        SyncServer.sync_server_log.error(
+            "Mapped connection config is incomplete, continuing with the previous mappings"
+        )
+        return current_versions
+    changed_applications = {
+        application_id
+        for application_id in current_versions
+        if application_id != connection_config["id"]
+        and current_versions[application_id] != versions.get(application_id)
+    }
+    if changed_applications:
+        refresh_sdk, emergency_stop = handle_sdk_state(
+            new_connection_config, application_configs
+        )
+        if emergency_stop:
+            return current_versions
+        if refresh_sdk:
+            # generating an SDK bumps the configVersion of its application, the versions are read again before the
+            # configs so the next cycle does not reload for this change
+            current_versions = get_config_versions(connection_config)
+            new_connection_config, application_configs = format_configs(
+                connection_config["id"]
+            )
+        state, new_sdks = get_sdks_as_import(new_connection_config, application_configs)
+        if not state:
+            return current_versions
+        sdks.update(new_sdks)
+    for key in session_options:
+        if key in connection_config:
+            new_connection_config[key] = connection_config[key]
+    for application_id in changed_applications:
+        close_api_client(
+            application_id,
+            connection_config.get("session", SyncServerScripts.default_session),
+        )
+    new_mapping_config = get_mapping_config(new_connection_config, application_configs)
+    previous_definitions = {
+        definition["id"]: definition
+        for definition in connection_config["endpointMapping"]
+    }
+    definitions = {
+        definition["id"]: definition
+        for definition in new_connection_config["endpointMapping"]
+    }
+    previous_endpoints = {endpoint["id"]: endpoint for endpoint in mapping_config}
+    reloaded_mapping_config = []
+    rebuilt = []
+    for endpoint in new_mapping_config:
+        previous = previous_endpoints.pop(endpoint["id"], None)
+        application_ids = {
+            endpoint["source"].get("applicationId"),
+            endpoint["target"].get("applicationId"),
+        }
+        if (
+            previous is not None
+            and previous_definitions.get(endpoint["id"]) == definitions[endpoint["id"]]
+            and not application_ids & changed_applications
+        ):
+            reloaded_mapping_config.append(previous)
+        else:
+            reloaded_mapping_config.append(endpoint)
+            rebuilt.append(endpoint["id"])
+    removed = list(previous_endpoints)
+    if rebuilt or removed:
+        empty_cache(rebuilt + removed)
+    mapping_config[:] = reloaded_mapping_config
+    connection_config.clear()
+    connection_config.update(new_connection_config)
+    SyncServer.sync_server_log.info(
+        "Reloaded the mappings, %s rebuilt, %s removed, %s unchanged",
+        len(rebuilt),
+        len(removed),
+        len(reloaded_mapping_config) - len(rebuilt),
+    )
+    return current_versions
+
+
 def get_endpoint_function_name(endpoint_path: str, endpoint_operation: str) -> str:
     """ Function to generate the function name of an API in the generated SDK, this is based on the path and operation
     of that API.
@@ -201,12 +416,13 @@ def get_endpoint_function_name(endpoint_path: str, endpoint_operation: str) -> s
 
 
 def get_sdks_as_import(
-    connection_config: dict, application_configs: dict
+    connection_config: dict, application_configs: dict, stop_on_error: bool = True
 ) -> tuple[bool, dict]:
     """ Function to import the SDKs and save them in easily passable variable
 
     :param connection_config: configuration of the connection between applications
     :param application_configs: a dict with application configs with their id as key
+    :param stop_on_error: bool to stop the sync server on an error, a backfill only reports the error
     :return: tuple, with a boolean if import was sucessful and a dict with the SDKs of the application with their id
     as keys
     """
@@ -235,7 +451,8 @@ def get_sdks_as_import(
                     + application_configs[application_id]["name"]
                 )
                 SyncServer.sync_server_log.error(err)
-                SyncServer.stop_sync_server(emergency_stop=True)
+                if stop_on_error:
+                    SyncServer.stop_sync_server(emergency_stop=True)
                 return False, {}
         else:
             SyncServer.sync_server_log.error(
@@ -243,7 +460,8 @@ def get_sdks_as_import(
                 + application_configs[application_id]["name"]
             )
             SyncServer.sync_server_log.error("Please restart the sync server")
-            SyncServer.stop_sync_server(emergency_stop=True)
+            if stop_on_error:
+                SyncServer.stop_sync_server(emergency_stop=True)
             return False, {}
     return True, sdk
 
@@ -270,12 +488,33 @@ def generate_auth(
     return config_object
 
 
-def generate_sdk_instance_configurations(application_config: dict) -> ModuleType | None:
+def generate_sdk_instance_configurations(
+    application_config: dict,
+    application_id: str = None,
+    connection_config: dict = None,
+    stop_on_error: bool = True,
+) -> ModuleType | None:
     """ Function to import the SDKs configuration object
 
+    The ApiClient is created once per application and session, so all endpoint mappings (and the threads of a
+    backfill) that call the same application share its pool of keep-alive connections. The sync server and a backfill
+    each have their own ApiClients, so stopping one does not close the connections of the other
+
     :param application_config: a dict containing the config of the application
+    :param application_id: id of the application, used to share its ApiClient
+    :param connection_config: configuration of the connection between applications, it holds the session and the
+    pool size and compression options of the session
+    :param stop_on_error: bool to stop the sync server on an error, a backfill only reports the error
     :return: config object for an SDK
     """
+    if connection_config is None:
+        connection_config = {}
+    key = (
+        connection_config.get("session", SyncServerScripts.default_session),
+        application_id,
+    )
+    if application_id is not None and key in api_clients:
+        return api_clients[key]
     if (
         "sdkGenerated" in application_config
         and application_config["sdkGenerated"]
@@ -292,21 +531,61 @@ def generate_sdk_instance_configurations(application_config: dict) -> ModuleType
                 + application_config["name"]
             )
             SyncServer.sync_server_log.error(e)
-            SyncServer.stop_sync_server(emergency_stop=True)
+            if stop_on_error:
+                SyncServer.stop_sync_server(emergency_stop=True)
             return
         config_object = generate_auth(application_config, sdk_object, config_object)
-        return sdk_object.ApiClient(config_object)
+        config_object.connection_pool_maxsize = connection_config.get(
+            "poolSize", default_pool_size
+        )
+        if hasattr(config_object, "socket_options"):
+            # TCP keep-alive, so idle pooled connections are not silently dropped between polls
+            config_object.socket_options = HTTPConnection.default_socket_options + [
+                (socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+            ]
+        api_client = sdk_object.ApiClient(config_object)
+        api_client.set_default_header("Connection", "keep-alive")
+        if connection_config.get("compression", True):
+            api_client.set_default_header("Accept-Encoding", accept_encoding)
+        if application_id is not None:
+            api_clients[key] = api_client
+        return api_client
+
+
+def close_api_client(
+    application_id: str, session: str = SyncServerScripts.default_session
+) -> None:
+    """ Function to close the shared ApiClient of an application, a new one is created the next time it is needed
+
+    :param application_id: id of the application
+    :param session: the sync server or a backfill, see SyncServerScripts.default_session
+    """
+    api_client = api_clients.pop((session, application_id), None)
+    if api_client is not None and hasattr(api_client, "close"):
+        api_client.close()
+
+
+def close_api_clients(session: str = SyncServerScripts.default_session) -> None:
+    """ Function to close the shared ApiClients of all applications at the end of a session, the ApiClients of other
+    sessions are left open
+
+    :param session: the sync server or a backfill, see SyncServerScripts.default_session
+    """
+    for client_session, application_id in list(api_clients):
+        if client_session == session:
+            close_api_client(application_id, session)
 
 
 def get_api_instance(
-    current_sdk: ModuleType, endpoint: dict, endpoint_end: str
+    current_sdk: ModuleType, endpoint: dict, endpoint_end: str, stop_on_error: bool = True
 ) -> ModuleType | None:
     """ Function to get a specific API within the imported SDKs
 
     :param current_sdk: a single SDK out of dict with the imported SDKs for both applications
     :param endpoint: current row of the list of connections that need to be synced
     :param endpoint_end: side of the connection the API instance is required of, target or source
-    :return: return the SDK API as a function
+    :param stop_on_error: bool to stop the sync server on an error, a backfill only reports the error
+    :return: return the SDK API as a function, None if an error occurred
     """
     try:
         return current_sdk.DefaultApi(endpoint[endpoint_end]["apiInstanceConfig"])
@@ -317,12 +596,17 @@ def get_api_instance(
             + ", error:"
             + str(e)
         )
-    SyncServer.stop_sync_server(emergency_stop=True)
+    if stop_on_error:
+        SyncServer.stop_sync_server(emergency_stop=True)
     return
 
 
 def find_call_type(
-    connection_config: dict, sdks: dict, endpoint: dict, polling_interval: int
+    connection_config: dict,
+    sdks: dict,
+    endpoint: dict,
+    polling_interval: int,
+    run: dict = None,
 ) -> None:
     """ Function to determine the type of connection bot target and source can be of type: function, variable or script.
     Each different type requires a different handling
@@ -331,10 +615,19 @@ def find_call_type(
     :param sdks: dict with the imported SDKs for both applications
     :param endpoint: current row of the list of connections that need to be synced
     :param polling_interval: integer of the interval between sync runs
+    :param run: record of this endpoint execution for the run history, see SyncServerStatistics.start_run()
     :return: None
     """
+    if run is None:
+        run = {}
+    timer = time.perf_counter()
     if endpoint["source"]["type"] == "function":
-        source_response = call_endpoint(connection_config, sdks, endpoint, "source")
+        with SyncServerTracing.span(
+            "call_endpoint", side="source", url=endpoint["source"]["url"]
+        ):
+            source_response = call_endpoint(
+                connection_config, sdks, endpoint, "source", run=run
+            )
     elif endpoint["source"]["type"] == "variables":
         source_response = ConnectionVariable.get_variables_for_glom(
             connection_config["id"]
@@ -344,28 +637,46 @@ def find_call_type(
         return
     else:
         SyncServer.sync_server_log.error(
-            "Unknown type: either function or variable is allowed, given type:"
-            + endpoint["source"]["type"]
+            "Unknown type: either function or variable is allowed, given type:%s",
+            endpoint["source"]["type"],
         )
         SyncServer.stop_sync_server(emergency_stop=True)
         return
-    if check_for_changes(source_response, endpoint, polling_interval):
+    run["source"] = SyncServerStatistics.elapsed(timer)
+    if run.get("error"):
+        return  # the source call failed or its response was rejected, there is nothing to compare
+    run["records"] = SyncServerStatistics.count_records(source_response)
+    with SyncServerTracing.span("check_for_changes") as stage_span:
+        run["changed"] = bool(
+            check_for_changes(source_response, endpoint, polling_interval)
+        )
+        SyncServerTracing.set_attribute(stage_span, "changed", run["changed"])
+    if run["changed"]:
         if (
             endpoint["target"]["type"] == "function"
             or endpoint["target"]["type"] == "script"
         ):
-            target_response = call_endpoint(
-                connection_config, sdks, endpoint, "target", source_response
-            )
-            SyncServer.sync_server_log.info(target_response)
+            with SyncServerTracing.span(
+                "call_endpoint", side="target", url=endpoint["target"]["url"]
+            ):
+                target_response = call_endpoint(
+                    connection_config, sdks, endpoint, "target", source_response, run
+                )
+            if SyncServer.sync_server_log.isEnabledFor(logging.INFO):
+                SyncServer.sync_server_log.info(
+                    "Response of target: %s", SyncServer.format_payload(target_response)
+                )
         elif endpoint["target"]["type"] == "variables":
-            SyncServerDataHandler.set_variables(
-                connection_config, endpoint, source_response
-            )
+            timer = time.perf_counter()
+            with SyncServerTracing.span("set_variables"):
+                SyncServerDataHandler.set_variables(
+                    connection_config, endpoint, source_response
+                )
+            run["transform"] = SyncServerStatistics.elapsed(timer)
         else:
             SyncServer.sync_server_log.error(
-                "Unknown type: either function or variable is allowed, given type:"
-                + endpoint["target"]["type"]
+                "Unknown type: either function or variable is allowed, given type:%s",
+                endpoint["target"]["type"],
             )
             return
 
@@ -376,6 +687,9 @@ def call_endpoint(
     endpoint: dict,
     endpoint_end: str,
     source_response: any = None,
+    run: dict = None,
+    extra_kwargs: dict = None,
+    stop_on_error: bool = True,
 ) -> any:
     """ Function to call a function that represents an API in the SDK
 
@@ -387,90 +701,221 @@ def call_endpoint(
     :param endpoint: current row of the list of connections that need to be synced
     :param endpoint_end: side of the connection the API instance is required of, target or source
     :param source_response: response data from a source
+    :param run: record of this endpoint execution for the run history, see SyncServerStatistics.start_run()
+    :param extra_kwargs: kwargs that are added to the generated kwargs, for example the page of a backfill
+    :param stop_on_error: bool to stop the sync server on an error, a backfill only records the error in run
     :return: a handled version of the response from the API
     """
+    if run is None:
+        run = {}
     current_sdk = sdks[endpoint[endpoint_end]["sdkId"]]
     if endpoint_end == "source" or (
         endpoint_end == "target" and source_response is not None
     ):
         try:
-            api_instance = get_api_instance(current_sdk, endpoint, endpoint_end)
-            kwargs = SyncServerDataHandler.generate_calling_kwargs(
-                api_instance, connection_config, endpoint, endpoint_end, source_response
+            api_instance = get_api_instance(
+                current_sdk, endpoint, endpoint_end, stop_on_error
             )
-            if endpoint_end == "source":
-                SyncServer.sync_server_log.info(
-                    "Calling: "
-                    + SyncServerDataHandler.get_url_with_parameters(
-                        endpoint[endpoint_end]["url"], kwargs
-                    )
+            if api_instance is None:
+                run["error"] = "ApiInstanceError"
+                return
+            timer = time.perf_counter()
+            with SyncServerTracing.span("generate_calling_kwargs"):
+                kwargs = SyncServerDataHandler.generate_calling_kwargs(
+                    api_instance,
+                    connection_config,
+                    endpoint,
+                    endpoint_end,
+                    source_response,
                 )
-            else:
+            if endpoint_end == "target":
+                run["transform"] = SyncServerStatistics.elapsed(timer)
+            if extra_kwargs:
+                kwargs.update(extra_kwargs)
+            if connection_config.get("requestTimeout"):
+                kwargs["_request_timeout"] = connection_config["requestTimeout"]
+            if SyncServer.sync_server_log.isEnabledFor(logging.INFO):
+                # the url is only built when it is logged
                 SyncServer.sync_server_log.info(
-                    "Sending data to: "
-                    + SyncServerDataHandler.get_url_with_parameters(
-                        endpoint["target"]["url"], kwargs
-                    )
+                    "Calling: %s" if endpoint_end == "source" else "Sending data to: %s",
+                    SyncServerDataHandler.get_url_with_parameters(
+                        endpoint[endpoint_end]["url"], kwargs
+                    ),
                 )
+            # an endpoint mapping can have its own limit, otherwise the limit of the session applies
+            max_response_size = endpoint.get(
+                "maxResponseSize", connection_config.get("maxResponseSize", 0)
+            )
+            raw_response = endpoint_end == "source" and bool(
+                connection_config.get("rawResponse", False) or max_response_size
+            )
+            if raw_response:
+                # skip the deserialisation into SDK models, the body is read streamed and parsed once as plain JSON
+                kwargs["_preload_content"] = False
             target_api = getattr(api_instance, endpoint[endpoint_end]["function"])
-            if kwargs:
-                try:
-                    response = target_api(**kwargs)
-                except Exception as e:
+            timer = time.perf_counter()
+            with SyncServerTracing.span(
+                "sdk_call", url=endpoint[endpoint_end]["url"]
+            ) as stage_span:
+                if kwargs:
+                    try:
+                        response = target_api(**kwargs)
+                    except Exception as e:
+                        run["error"] = type(e).__name__
+                        SyncServer.sync_server_log.error(
+                            "Error while calling the following API endpoint: %s",
+                            endpoint[endpoint_end]["url"],
+                        )
+                        SyncServer.sync_server_log.error("%s", e)
+                        if stop_on_error:
+                            SyncServer.stop_sync_server(emergency_stop=True)
+                        return
+                else:
+                    try:
+                        response = target_api()
+                    except Exception as e:
+                        run["error"] = type(e).__name__
+                        SyncServer.sync_server_log.error(
+                            "Error while calling the following API endpoint: %s",
+                            endpoint[endpoint_end]["url"],
+                        )
+                        SyncServer.sync_server_log.error("%s", e)
+                        if stop_on_error:
+                            SyncServer.stop_sync_server()
+                        return
+            if endpoint_end == "target":
+                run["target"] = SyncServerStatistics.elapsed(timer)
+            elif raw_response:
+                response = read_body(response, max_response_size)
+                if response is None:
+                    run["error"] = "ResponseTooLarge"
                     SyncServer.sync_server_log.error(
-                        "Error while calling the following API endpoint: "
-                        + endpoint[endpoint_end]["url"]
+                        "Response of %s is larger than %s bytes, skipping this poll",
+                        endpoint[endpoint_end]["url"],
+                        max_response_size,
                     )
-                    SyncServer.sync_server_log.error(e)
-                    SyncServer.stop_sync_server(emergency_stop=True)
                     return
+                run["bytes"] = len(response)
+                SyncServerTracing.set_attribute(stage_span, "bytes", run["bytes"])
             else:
+                run["bytes"] = get_response_size(api_instance)
+                SyncServerTracing.set_attribute(stage_span, "bytes", run["bytes"])
+            with SyncServerTracing.span(
+                "handle_response", raw=raw_response
+            ) as stage_span:
                 try:
-                    response = target_api()
-                except Exception as e:
+                    if raw_response:
+                        handled_response = handle_raw_response(response)
+                    else:
+                        handled_response = handle_response(response)
+                except ValueError as e:
+                    run["error"] = "InvalidResponse"
                     SyncServer.sync_server_log.error(
-                        "Error while calling the following API endpoint: "
-                        + endpoint[endpoint_end]["url"]
+                        "%s, from: %s", e, endpoint[endpoint_end]["url"]
                     )
-                    SyncServer.sync_server_log.error(e)
-                    SyncServer.stop_sync_server()
+                    if stop_on_error:
+                        SyncServer.stop_sync_server(emergency_stop=True)
                     return
-            return handle_response(response)
+                SyncServerTracing.set_attribute(
+                    stage_span,
+                    "records",
+                    SyncServerStatistics.count_records(handled_response),
+                )
+            return handled_response
 
         except Exception as e:
+            run["error"] = type(e).__name__
             SyncServer.sync_server_log.error(
-                "Unknown error: " + endpoint[endpoint_end]["url"] + ", error:" + str(e)
+                "Unknown error: %s, error:%s", endpoint[endpoint_end]["url"], e
             )
-            SyncServer.sync_server_log.error(traceback.format_exc())
-            SyncServer.stop_sync_server(emergency_stop=True)
+            SyncServer.sync_server_log.error("%s", traceback.format_exc())
+            if stop_on_error:
+                SyncServer.stop_sync_server(emergency_stop=True)
             return
     else:
         SyncServer.sync_server_log.error(
-            "Error while calling the following API endpoint: "
-            + endpoint[endpoint_end]["url"]
+            "Error while calling the following API endpoint: %s",
+            endpoint[endpoint_end]["url"],
         )
         SyncServer.sync_server_log.error(
             "Source response was not given but is required"
         )
-        SyncServer.stop_sync_server(emergency_stop=True)
+        if stop_on_error:
+            SyncServer.stop_sync_server(emergency_stop=True)
         return
 
 
+def read_body(response: any, max_size: int) -> bytes | None:
+    """ Function to read the body of a response from the SDK that is called with _preload_content=False
+
+    The body is read in chunks and decompressed on the fly, so a body that is larger than the limit is rejected without
+    buffering it. The connection goes back to the pool of the ApiClient afterwards
+
+    :param response: raw HTTP response from a source
+    :param max_size: maximum size of the decompressed body in bytes, 0 for no limit
+    :return: the body, None if it is larger than the limit
+    """
+    content_length = response.headers.get("Content-Length", "")
+    if max_size and content_length.isdigit() and int(content_length) > max_size:
+        response.close()
+        response.release_conn()
+        return None
+    body = bytearray()
+    for chunk in response.stream(64 * 1024, decode_content=True):
+        body += chunk
+        if max_size and len(body) > max_size:
+            response.close()  # the rest of the body is not read, so the connection can not be reused
+            response.release_conn()
+            return None
+    response.release_conn()
+    return bytes(body)
+
+
+def get_response_size(api_instance: ModuleType) -> int | None:
+    """ Function to get the size of the body of a response in bytes, for the run history
+
+    :param api_instance: function of the generated SDK, this function represents an API
+    :return: the size of the body, None if the SDK did not keep the body
+    """
+    last_response = getattr(api_instance.api_client, "last_response", None)
+    if last_response is not None and last_response.data is not None:
+        return len(last_response.data)
+    return None
+
+
 def handle_response(response: any) -> any:
     """ Function to format the response from the SDK
 
-    Depending on the type the response needs to be processed in a different manner
+    Depending on the type the response needs to be processed in a different manner. A response that can not be
+    parsed raises a ValueError, the caller decides if that stops the sync server, see call_endpoint()
 
     :param response: response data from a source
-    :return:
+    :return: the response as dicts and lists
     """
     if hasattr(response, "__dict__"):
         return SyncServerDataHandler.model_to_dict(response)
     if isinstance(response, list):
         return [SyncServerDataHandler.model_to_dict(item) for item in response]
     else:
-        SyncServer.sync_server_log.error("Error while trying to parse the response")
-        SyncServer.stop_sync_server(emergency_stop=True)
+        raise ValueError("Error while trying to parse the response")
+
+
+def handle_raw_response(data: bytes) -> any:
+    """ Function to format a response from the SDK that is called with _preload_content=False
+
+    The SDK returns the undecoded HTTP response in that case, its body is parsed directly into dicts and lists, which
+    skips both the model validation of the SDK and model_to_dict(). A body that is not valid JSON raises a ValueError,
+    like handle_response()
+
+    :param data: body of a raw HTTP response from a source, see read_body()
+    :return: the parsed body of the response
+    """
+    if not data:
+        return None
+    try:
+        return SyncServerDataHandler.load_json(data)
+    except ValueError:
+        raise ValueError("Error while trying to parse the raw response")
 
 
 def check_for_changes(response: any, endpoint: dict, polling_interval: int) -> bool:
@@ -482,51 +927,125 @@ def check_for_changes(response: any, endpoint: dict, polling_interval: int) -> b
     :param polling_interval: integer of time between sync runs
     :return: bool if changes were detected
     """
+    if "cacheId" not in endpoint:
+        # a cache entry can already exist for this mapping, for example one seeded by a backfill
+        cached_result = collection.find_one({"mappingId": endpoint["id"]}, {"_id": 1})
+        if cached_result is not None:
+            endpoint["cacheId"] = cached_result["_id"]
     if "cacheId" in endpoint:
         cache_id = ObjectId(endpoint["cacheId"])
         cached_result = collection.find_one({"_id": cache_id})
-        cached_result.pop("_id")
-        if cached_result["response"] == response:
-            if endpoint["source"]["type"] == "function":
-                SyncServer.sync_server_log.info(
-                    "Nothing changed on endpoint: "
-                    + endpoint["source"]["url"]
-                    + ", waiting "
-                    + str(polling_interval)
-                    + " seconds to check again"
-                )
-            elif endpoint["source"]["type"] == "variables":
-                SyncServer.sync_server_log.info(
-                    "Values of variables did not change, waiting "
-                    + str(polling_interval)
-                    + " seconds to check again"
-                )
+        if cached_result is not None and cached_result["response"] == response:
+            touch_cache(cached_result)
+            log_unchanged(endpoint, polling_interval)
             return False
 
         else:
-            if endpoint["source"]["type"] == "function":
-                SyncServer.sync_server_log.info(
-                    "Changes found on endpoint: " + endpoint["source"]["url"]
-                )
-            elif endpoint["source"]["type"] == "variables":
-                SyncServer.sync_server_log.info("Values of variables changed")
-            updated = collection.update_one(
-                {"_id": cache_id}, {"$set": {"data": response}}
-            )
-            if updated.acknowledged:
-                return True
+            log_changed(endpoint)
+            endpoint["cacheId"] = save_cache(endpoint, response)
+            return endpoint["cacheId"] is not None
     else:
         if response is not None:
-            insert = collection.insert_one({"response": response})
-            if insert.acknowledged:
-                endpoint["cacheId"] = insert.inserted_id
-                return True
+            endpoint["cacheId"] = save_cache(endpoint, response)
+            return endpoint["cacheId"] is not None
         else:
             return False
 
 
-def empty_cache() -> None:
-    """ Function to empty the entire cache document in the DB"""
-    state = collection.delete_many({})
+def save_cache(endpoint: dict, response: any) -> ObjectId | None:
+    """ Function to save the latest response of a source in the cache, there is one cache entry per endpoint mapping
+
+    :param endpoint: row of the list of connections that need to be synced
+    :param response: response data from a source
+    :return: the id of the cache entry, None if saving failed
+    """
+    cached_result = collection.find_one_and_update(
+        {"mappingId": endpoint["id"]},
+        {"$set": {"response": response, "updatedAt": datetime.utcnow()}},
+        projection={"_id": 1},
+        upsert=True,
+        return_document=ReturnDocument.AFTER,
+    )
+    if cached_result is None:
+        return None
+    return cached_result["_id"]
+
+
+def touch_cache(cached_result: dict) -> None:
+    """ Function to keep a cache entry whose source did not change, before the TTL index removes it. The entry is only
+    written once per half TTL, not on every poll
+
+    :param cached_result: the cache entry
+    """
+    updated_at = cached_result.get("updatedAt")
+    if updated_at is None or datetime.utcnow() - updated_at > timedelta(
+        seconds=cache_ttl / 2
+    ):
+        collection.update_one(
+            {"_id": cached_result["_id"]}, {"$set": {"updatedAt": datetime.utcnow()}}
+        )
+
+
+def log_unchanged(endpoint: dict, polling_interval: int) -> None:
+    """ Function to log that a poll found no changes. Only the first poll without changes is logged right away, the
+    following ones are counted and summarised once every SyncServer.unchanged_log_interval seconds
+
+    :param endpoint: row of the list of connections that need to be synced
+    :param polling_interval: integer of time between sync runs
+    """
+    now = time.monotonic()
+    polls = unchanged_polls.get(endpoint["id"])
+    if polls is None:
+        unchanged_polls[endpoint["id"]] = [0, now]
+        if endpoint["source"]["type"] == "function":
+            SyncServer.sync_server_log.info(
+                "Nothing changed on endpoint: %s, waiting %s seconds to check again",
+                endpoint["source"]["url"],
+                polling_interval,
+            )
+        elif endpoint["source"]["type"] == "variables":
+            SyncServer.sync_server_log.info(
+                "Values of variables did not change, waiting %s seconds to check again",
+                polling_interval,
+            )
+        return
+    polls[0] += 1
+    if now - polls[1] >= SyncServer.unchanged_log_interval:
+        SyncServer.sync_server_log.info(
+            "Nothing changed on endpoint: %s in the last %s polls",
+            endpoint["source"].get("url", "Variables"),
+            polls[0],
+        )
+        polls[0] = 0
+        polls[1] = now
+
+
+def log_changed(endpoint: dict) -> None:
+    """ Function to log that a poll found changes, together with the number of polls without changes before it
+
+    :param endpoint: row of the list of connections that need to be synced
+    """
+    polls = unchanged_polls.pop(endpoint["id"], None)
+    unchanged = polls[0] if polls else 0
+    if endpoint["source"]["type"] == "function":
+        SyncServer.sync_server_log.info(
+            "Changes found on endpoint: %s, after %s polls without changes",
+            endpoint["source"]["url"],
+            unchanged,
+        )
+    elif endpoint["source"]["type"] == "variables":
+        SyncServer.sync_server_log.info(
+            "Values of variables changed, after %s polls without changes", unchanged
+        )
+
+
+def empty_cache(mapping_ids: list = None) -> None:
+    """ Function to empty the cache in the DB
+
+    :param mapping_ids: ids of the endpoint mappings whose cache is emptied, None to empty the entire cache
+    """
+    state = collection.delete_many(
+        {} if mapping_ids is None else {"mappingId": {"$in": mapping_ids}}
+    )
     if not state.acknowledged:
         SyncServer.sync_server_log.error("Emptying cache failed")
@@ -0,0 +1,242 @@
+from bisect import bisect_left
+from threading import Lock
+
+from flask import Blueprint
+
+from backend.sync_server import SyncServerControl
+
+sync_server_metrics = Blueprint("SyncServerMetrics", __name__)
+
+latency_buckets = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+metric_descriptions = {
+    "sync_server_polls_total": ("counter", "Number of polls of a data source"),
+    "sync_server_changes_total": ("counter", "Number of polls that detected changes"),
+    "sync_server_target_writes_total": ("counter", "Number of calls to a target API"),
+    "sync_server_errors_total": ("counter", "Number of errors by error class"),
+    "sync_server_cache_requests_total": (
+        "counter",
+        "Number of change detection lookups, a hit means the source did not change",
+    ),
+    "sync_server_stage_duration_seconds": (
+        "histogram",
+        "Duration of the source, transform and target stage of an endpoint",
+    ),
+    "sync_server_cycle_duration_seconds": (
+        "histogram",
+        "Duration of a sync cycle over all endpoints of a connection",
+    ),
+    "sync_server_script_duration_seconds": (
+        "histogram",
+        "Duration of a connection script call",
+    ),
+}
+
+metrics_lock = Lock()
+counters = {}
+histograms = {}
+
+
+def increment(name: str, labels: tuple, value: float = 1) -> None:
+    """ Function to increment a counter
+
+    :param name: name of the metric
+    :param labels: tuple of (label name, label value) pairs
+    :param value: amount to increment with
+    """
+    key = (name, labels)
+    with metrics_lock:
+        counters[key] = counters.get(key, 0) + value
+
+
+def observe(name: str, labels: tuple, value: float) -> None:
+    """ Function to add an observation to a histogram
+
+    :param name: name of the metric
+    :param labels: tuple of (label name, label value) pairs
+    :param value: the observed value in seconds
+    """
+    key = (name, labels)
+    index = bisect_left(latency_buckets, value)
+    with metrics_lock:
+        histogram = histograms.get(key)
+        if histogram is None:
+            histogram = histograms[key] = [[0] * (len(latency_buckets) + 1), 0.0, 0]
+        histogram[0][index] += 1
+        histogram[1] += value
+        histogram[2] += 1
+
+
+def observe_run(run: dict) -> None:
+    """ Function to update the metrics with a finished endpoint run, see SyncServerStatistics.start_run()
+
+    :param run: the run record
+    """
+    labels = (("connection", run["connectionId"]), ("mapping", run["mappingId"]))
+    increment("sync_server_polls_total", labels)
+    if run["source"] is not None:
+        increment(
+            "sync_server_cache_requests_total",
+            labels + (("result", "miss" if run["changed"] else "hit"),),
+        )
+    if run["changed"]:
+        increment("sync_server_changes_total", labels)
+    if run["target"] is not None:
+        increment("sync_server_target_writes_total", labels)
+    if run["error"]:
+        increment("sync_server_errors_total", labels + (("type", run["error"]),))
+    for stage in ["source", "transform", "target"]:
+        if run[stage] is not None:
+            observe(
+                "sync_server_stage_duration_seconds",
+                labels + (("stage", stage),),
+                run[stage] / 1000,
+            )
+
+
+def observe_cycle(cycle: dict) -> None:
+    """ Function to update the metrics with a finished sync cycle, see SyncServerStatistics.start_cycle()
+
+    :param cycle: the cycle record
+    """
+    observe(
+        "sync_server_cycle_duration_seconds",
+        (("connection", cycle["connectionId"]),),
+        cycle["duration"] / 1000,
+    )
+
+
+def format_labels(labels: tuple) -> str:
+    """ Function to format labels in the Prometheus text format
+
+    :param labels: tuple of (label name, label value) pairs
+    :return: the labels between braces, or an empty string without labels
+    """
+    if not labels:
+        return ""
+    formatted = []
+    for name, value in labels:
+        value = str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        formatted.append(name + '="' + value + '"')
+    return "{" + ",".join(formatted) + "}"
+
+
+def get_snapshot() -> dict:
+    """ Function to get a copy of all metrics that can be saved in Mongo, a sync worker publishes it with its status so
+    the API can expose the metrics of all workers, see generate_worker_metrics()
+
+    :return: dict with the counters as [name, labels, value] and the histograms as [name, labels, buckets, sum, count]
+    """
+    with metrics_lock:
+        return {
+            "counters": [
+                [name, [list(label) for label in labels], value]
+                for (name, labels), value in counters.items()
+            ],
+            "histograms": [
+                [
+                    name,
+                    [list(label) for label in labels],
+                    list(value[0]),
+                    value[1],
+                    value[2],
+                ]
+                for (name, labels), value in histograms.items()
+            ],
+        }
+
+
+def generate_metrics() -> str:
+    """ Function to render all metrics of this process in the Prometheus text exposition format
+
+    :return: the metrics as text
+    """
+    with metrics_lock:
+        counter_items = list(counters.items())
+        histogram_items = [
+            (key, (list(value[0]), value[1], value[2]))
+            for key, value in histograms.items()
+        ]
+    return format_metrics(counter_items, histogram_items)
+
+
+def generate_worker_metrics(workers: list) -> str:
+    """ Function to render the metrics the sync workers published with their status, every series gets the worker as
+    label, see get_snapshot()
+
+    :param workers: the statuses of the workers that are alive, see SyncServerControl.get_workers()
+    :return: the metrics as text
+    """
+    counter_items = []
+    histogram_items = []
+    for worker in workers:
+        snapshot = worker.get("metrics") or {}
+        worker_label = (("worker", worker["_id"]),)
+        for name, labels, value in snapshot.get("counters", []):
+            labels = worker_label + tuple(tuple(label) for label in labels)
+            counter_items.append(((name, labels), value))
+        for name, labels, buckets, total, count in snapshot.get("histograms", []):
+            labels = worker_label + tuple(tuple(label) for label in labels)
+            histogram_items.append(((name, labels), (buckets, total, count)))
+    return format_metrics(counter_items, histogram_items)
+
+
+def format_metrics(counter_items: list, histogram_items: list) -> str:
+    """ Function to render metrics in the Prometheus text exposition format
+
+    :param counter_items: list of ((name, labels), value)
+    :param histogram_items: list of ((name, labels), (buckets, sum, count))
+    :return: the metrics as text
+    """
+    lines = []
+    for name, (metric_type, description) in metric_descriptions.items():
+        lines.append("# HELP " + name + " " + description)
+        lines.append("# TYPE " + name + " " + metric_type)
+        if metric_type == "counter":
+            for (metric_name, labels), value in counter_items:
+                if metric_name == name:
+                    lines.append(name + format_labels(labels) + " " + str(value))
+        else:
+            for (metric_name, labels), (buckets, total, count) in histogram_items:
+                if metric_name == name:
+                    cumulative = 0
+                    for bound, bucket_count in zip(latency_buckets, buckets):
+                        cumulative += bucket_count
+                        lines.append(
+                            name
+                            + "_bucket"
+                            + format_labels(labels + (("le", str(bound)),))
+                            + " "
+                            + str(cumulative)
+                        )
+                    lines.append(
+                        name
+                        + "_bucket"
+                        + format_labels(labels + (("le", "+Inf"),))
+                        + " "
+                        + str(count)
+                    )
+                    lines.append(name + "_sum" + format_labels(labels) + " " + str(total))
+                    lines.append(
+                        name + "_count" + format_labels(labels) + " " + str(count)
+                    )
+    return "\n".join(lines) + "\n"
+
+
+@sync_server_metrics.route("/api/server/metrics", methods=["GET"])
+def get_metrics() -> tuple:
+    """ Function to expose the metrics of the sync server to Prometheus
+
+    In worker mode the metrics are kept by the sync workers, which publish them with their heartbeat, the metrics of
+    the workers that are alive are exposed with the worker as label
+
+    :return: Flask response containing the metrics in the Prometheus text format
+    """
+    if SyncServerControl.remote_sync:
+        metrics = generate_worker_metrics(SyncServerControl.get_workers())
+    else:
+        metrics = generate_metrics()
+    return (
+        metrics,
+        200,
+        {"Content-Type": "text/plain; version=0.0.4; charset=utf-8"},
+    )
@@ -0,0 +1,228 @@
+import importlib
+import multiprocessing
+import sys
+import time
+from threading import Lock
+from types import ModuleType
+
+from backend.sync_server import SyncServerMetrics
+
+try:
+    import resource
+except ImportError:  # resource is only available on Unix, memory limits are skipped elsewhere
+    resource = None
+
+scripts_path = "../connection_scripts"
+default_batch_size = 1000
+
+default_session = "sync"  # the sync server, a backfill has a session of its own so it does not share its pool
+script_pools = {}  # per session: the pool of worker processes, see start_script_pool()
+script_pool_settings = {}  # per session: the workers, timeout and memory limit of its pool
+# per session: incremented on every start and stop of its pool, so a thread only restarts the pool it timed out on
+script_pool_generations = {}
+script_pools_lock = Lock()
+
+
+def load_script(script_id: str) -> ModuleType:
+    """ Function to import a connection script made by the user, the import is cached by Python after the first call
+
+    :param script_id: unique identifier of a script element, also the name of the script file
+    :return: the imported script
+    """
+    if scripts_path not in sys.path:
+        sys.path.append(scripts_path)
+    return importlib.import_module(script_id)
+
+
+def run_script(
+    script: ModuleType,
+    source_response: any,
+    variables: dict,
+    batch_size: int = default_batch_size,
+) -> any:
+    """ Function to convert a source response with a connection script
+
+    A script can expose main(source_response, **variables), which is called once with the whole response. It can also
+    expose main_batch(records, **variables), which is preferred when the response is a list of records. main_batch is
+    called with batches of at most batch_size records and returns a list of converted records, the batches are
+    concatenated. The variables are resolved once by the caller and shared by all batches.
+
+    :param script: the imported script
+    :param source_response: response data from a source
+    :param variables: a dict of variables, key is their name and value is the variables value
+    :param batch_size: maximum number of records given to main_batch at once, 0 to always use main
+    :return: the converted data
+    """
+    if (
+        batch_size
+        and hasattr(script, "main_batch")
+        and isinstance(source_response, list)
+    ):
+        if len(source_response) <= batch_size:
+            return script.main_batch(source_response, **variables)
+        converted = []
+        for start in range(0, len(source_response), batch_size):
+            converted.extend(
+                script.main_batch(
+                    source_response[start : start + batch_size], **variables
+                )
+            )
+        return converted
+    return script.main(source_response, **variables)
+
+
+def initialize_worker(memory_limit: int) -> None:
+    """ Function that runs once in every worker process of the script pool, it sets the import path of the scripts and
+    the memory limit of the worker
+
+    :param memory_limit: maximum memory of the worker in megabytes, 0 for no limit
+    """
+    if scripts_path not in sys.path:
+        sys.path.append(scripts_path)
+    if memory_limit and resource is not None:
+        limit = memory_limit * 1024 * 1024
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+
+
+def worker_run_script(
+    script_id: str, source_response: any, variables: dict, batch_size: int
+) -> any:
+    """ Function that is executed in a worker process of the script pool. The worker imports a script once and keeps
+    it for all following calls
+
+    :param script_id: unique identifier of a script element
+    :param source_response: response data from a source
+    :param variables: a dict of variables, key is their name and value is the variables value
+    :param batch_size: maximum number of records given to main_batch at once, 0 to always use main
+    :return: the converted data
+    """
+    return run_script(load_script(script_id), source_response, variables, batch_size)
+
+
+def start_script_pool(
+    workers: int, timeout: int, memory_limit: int = 0, session: str = default_session
+) -> None:
+    """ Function to start a warm pool of worker processes that execute the connection scripts
+
+    Scripts run outside the sync thread, so a slow script does not hold the GIL of the sync server, several scripts
+    can run on separate cores and a script that hangs is stopped after the timeout. Arguments and results are sent
+    to and from the workers pickled.
+
+    :param workers: number of worker processes, 0 to execute scripts in the sync thread itself
+    :param timeout: maximum number of seconds a single script call may take
+    :param memory_limit: maximum memory of a worker in megabytes, 0 for no limit
+    :param session: the sync server or a backfill, every session has its own pool
+    """
+    with script_pools_lock:
+        replace_script_pool(session, workers, timeout, memory_limit)
+
+
+def replace_script_pool(
+    session: str, workers: int = 0, timeout: int = 30, memory_limit: int = 0
+) -> None:
+    """ Function to stop the script pool of a session and start a new one when workers is given, the caller holds
+    script_pools_lock
+
+    :param session: the sync server or a backfill
+    :param workers: number of worker processes of the new pool, 0 to only stop the pool
+    :param timeout: maximum number of seconds a single script call may take
+    :param memory_limit: maximum memory of a worker in megabytes, 0 for no limit
+    """
+    script_pool = script_pools.pop(session, None)
+    script_pool_generations[session] = script_pool_generations.get(session, 0) + 1
+    if script_pool is not None:
+        script_pool.terminate()
+        script_pool.join()
+    script_pool_settings[session] = {
+        "workers": workers,
+        "timeout": timeout,
+        "memory": memory_limit,
+    }
+    if workers > 0:
+        # spawn instead of fork, the sync server is multithreaded and forking it could copy held locks
+        script_pools[session] = multiprocessing.get_context("spawn").Pool(
+            processes=workers,
+            initializer=initialize_worker,
+            initargs=(memory_limit,),
+        )
+
+
+def stop_script_pool(session: str = default_session) -> None:
+    """ Function to stop the worker processes of the script pool of a session if it is running
+
+    :param session: the sync server or a backfill
+    """
+    with script_pools_lock:
+        replace_script_pool(session)
+
+
+def restart_script_pool(session: str, generation: int) -> None:
+    """ Function to restart the script pool of a session after a script timed out in it
+
+    The pool is only restarted when it is still the pool the script ran in. When several scripts time out at once it
+    is restarted once, and a pool that was stopped in the meantime, because its session ended, stays stopped.
+
+    :param session: the sync server or a backfill
+    :param generation: the generation of the pool the script ran in, see script_pool_generations
+    """
+    with script_pools_lock:
+        if (
+            script_pool_generations.get(session) != generation
+            or session not in script_pools
+        ):
+            return
+        settings = script_pool_settings[session]
+        replace_script_pool(
+            session, settings["workers"], settings["timeout"], settings["memory"]
+        )
+
+
+def execute_script(
+    script_id: str,
+    source_response: any,
+    variables: dict,
+    batch_size: int = default_batch_size,
+    session: str = default_session,
+) -> any:
+    """ Function to execute a connection script, in the script pool of the session if it is running and in the calling
+    thread otherwise
+
+    When a call exceeds the timeout the pool is restarted, because the worker cannot be interrupted in any other way,
+    and a TimeoutError is raised, see restart_script_pool()
+
+    :param script_id: unique identifier of a script element
+    :param source_response: response data from a source
+    :param variables: a dict of variables, key is their name and value is the variables value
+    :param batch_size: maximum number of records given to main_batch at once, 0 to always use main
+    :param session: the sync server or a backfill, see start_script_pool()
+    :return: the converted data
+    """
+    timer = time.perf_counter()
+    with script_pools_lock:
+        script_pool = script_pools.get(session)
+        settings = script_pool_settings.get(session, {})
+        generation = script_pool_generations.get(session)
+    try:
+        if script_pool is None:
+            return run_script(
+                load_script(script_id), source_response, variables, batch_size
+            )
+        result = script_pool.apply_async(
+            worker_run_script, (script_id, source_response, variables, batch_size)
+        )
+        return result.get(settings["timeout"])
+    except multiprocessing.TimeoutError:
+        restart_script_pool(session, generation)
+        raise TimeoutError(
+            "Script "
+            + script_id
+            + " did not finish within "
+            + str(settings["timeout"])
+            + " seconds"
+        )
+    finally:
+        SyncServerMetrics.observe(
+            "sync_server_script_duration_seconds",
+            (("script", script_id),),
+            time.perf_counter() - timer,
+        )
@@ -0,0 +1,248 @@
+import atexit
+import os
+import signal
+import socket
+import sys
+import time
+from datetime import datetime, timedelta
+from threading import Lock, Thread, current_thread, main_thread
+
+from pymongo import DESCENDING
+from pymongo.errors import PyMongoError
+
+from backend import db
+from backend.sync_server import SyncServer
+
+collection = db["sync_state"]  # one state document per connection, with the connection id as _id
+checkpoint_interval = 30  # seconds between checkpoints while the sync server runs
+
+runtime_state = {}
+state_lock = Lock()
+last_checkpoint = 0.0
+
+
+def get_owner() -> str:
+    """ Function to get the identifier of this process, saved with the state so only one process resumes it
+
+    :return: the host name and process id
+    """
+    return socket.gethostname() + ":" + str(os.getpid())
+
+
+def start_state(
+    connection_id: str, settings: dict, mapping_config: list, restored_state: dict = None
+) -> tuple[int, float]:
+    """ Function to start the runtime state of a sync session, or to continue the state of a previous session
+
+    The cache ids of a restored state are put back on the endpoint mappings, so the first poll compares with the cache
+    instead of sending everything again
+
+    :param connection_id: a unique identifier of a connection between applications
+    :param settings: the settings of the sync session, see SyncServer.start_sync_server()
+    :param mapping_config: list of endpoint mappings, see SyncServerHelpers.get_mapping_config()
+    :param restored_state: the state of a previous session, see load_state()
+    :return: a tuple with the index of the endpoint to continue with and the seconds to wait before the first cycle
+    """
+    global last_checkpoint
+    position = 0
+    delay = 0.0
+    if restored_state and restored_state["connectionId"] == connection_id:
+        for endpoint in mapping_config:
+            if endpoint["id"] in restored_state["cacheIds"]:
+                endpoint["cacheId"] = restored_state["cacheIds"][endpoint["id"]]
+        if 0 < restored_state["position"] < len(mapping_config):
+            position = restored_state["position"]
+        elif restored_state["lastCycle"]:
+            delay = max(
+                0.0,
+                restored_state["lastCycle"] + settings["interval"] - time.time(),
+            )
+    with state_lock:
+        runtime_state.clear()
+        runtime_state.update(
+            {
+                "_id": connection_id,
+                "connectionId": connection_id,
+                "settings": settings,
+                "running": True,
+                "owner": get_owner(),
+                "position": position,
+                "lastCycle": restored_state["lastCycle"] if restored_state else None,
+                "cacheIds": {},
+            }
+        )
+    last_checkpoint = time.monotonic()
+    update_state(mapping_config, position)
+    save_state(take_over=True)
+    return position, delay
+
+
+def update_state(mapping_config: list, position: int, last_cycle: float = None) -> None:
+    """ Function to update the runtime state after an endpoint is synced, it is checkpointed once every
+    checkpoint_interval seconds
+
+    :param mapping_config: list of endpoint mappings, see SyncServerHelpers.get_mapping_config()
+    :param position: index of the next endpoint to sync in the current cycle
+    :param last_cycle: time the last cycle finished, as given by time.time(), None if a cycle is in progress
+    """
+    global last_checkpoint
+    with state_lock:
+        if not runtime_state:
+            return
+        runtime_state["position"] = position
+        if last_cycle is not None:
+            runtime_state["lastCycle"] = last_cycle
+        runtime_state["cacheIds"] = {
+            endpoint["id"]: endpoint["cacheId"]
+            for endpoint in mapping_config
+            if "cacheId" in endpoint
+        }
+    if time.monotonic() - last_checkpoint >= checkpoint_interval:
+        last_checkpoint = time.monotonic()
+        save_state()
+
+
+def save_state(take_over: bool = False) -> None:
+    """ Function to checkpoint the runtime state of the sync server to the DB
+
+    Only the owner of the state writes it. When another process claimed the state in the meantime, see claim_state(),
+    the local sync is stopped, so the connection is not synced twice
+
+    :param take_over: bool to write the state whoever owns it, used when a sync session starts
+    """
+    with state_lock:
+        if not runtime_state:
+            return
+        state = dict(runtime_state, updatedAt=datetime.utcnow())
+    try:
+        if take_over:
+            collection.replace_one({"_id": state["_id"]}, state, upsert=True)
+            return
+        saved = collection.replace_one(
+            {"_id": state["_id"], "owner": {"$in": [get_owner(), None]}}, state
+        )
+    except PyMongoError as e:
+        SyncServer.sync_server_log.error("Error while saving the sync state: %s", e)
+        return
+    if saved.matched_count == 0:
+        SyncServer.sync_server_log.error(
+            "The sync state is owned by another process, stopping the sync"
+        )
+        SyncServer.abandon_sync_server()
+
+
+def finish_state() -> None:
+    """ Function to mark the runtime state as stopped, a stopped sync server is not resumed after a restart"""
+    with state_lock:
+        if not runtime_state:
+            return
+        runtime_state["running"] = False
+    save_state()
+    with state_lock:
+        runtime_state.clear()
+
+
+def release_state() -> None:
+    """ Function for the shutdown checkpoint, the state stays running so it is resumed on the next start, but without an
+    owner so the next start does not have to wait until it is stale, see claim_state()
+    """
+    with state_lock:
+        if not runtime_state:
+            return
+        runtime_state["owner"] = None
+    save_state()
+
+
+def shutdown(signal_number: int, frame: any) -> None:
+    """ Signal handler that checkpoints the state on SIGTERM and turns it into a normal exit"""
+    release_state()
+    SyncServer.stop_thread = True
+    sys.exit(0)
+
+
+def install_shutdown_handler() -> None:
+    """ Function to checkpoint the state when the backend is stopped with SIGTERM, which does not run atexit. A handler
+    that the server process installed itself is left as it is
+    """
+    if (
+        current_thread() is main_thread()
+        and signal.getsignal(signal.SIGTERM) == signal.SIG_DFL
+    ):
+        signal.signal(signal.SIGTERM, shutdown)
+
+
+def abandon_state() -> None:
+    """ Function to drop the runtime state without saving it, used when another worker took over the connection and
+    now owns its state
+    """
+    with state_lock:
+        runtime_state.clear()
+
+
+def load_state(connection_id: str = None) -> dict | None:
+    """ Function to get the last checkpoint of the runtime state
+
+    :param connection_id: a unique identifier of a connection between applications, None for the state of the latest
+    session that was running
+    :return: the state, None if there is none
+    """
+    if connection_id is not None:
+        return collection.find_one({"_id": connection_id})
+    return collection.find_one({"running": True}, sort=[("updatedAt", DESCENDING)])
+
+
+def claim_state(state: dict) -> bool:
+    """ Function to take over a state that was running, when the backend runs several processes only the first one
+    resumes it. A state can be claimed when its owner released it on shutdown, or when it was not checkpointed for two
+    polling intervals, because its owner crashed
+
+    :param state: the state, see load_state()
+    :return: bool if this process claimed the state
+    """
+    now = datetime.utcnow()
+    stale = now - timedelta(
+        seconds=2 * (state["settings"]["interval"] + checkpoint_interval)
+    )
+    claimed = collection.update_one(
+        {
+            "_id": state["_id"],
+            "running": True,
+            "$or": [{"owner": None}, {"updatedAt": {"$lt": stale}}],
+        },
+        {"$set": {"owner": get_owner(), "updatedAt": now}},
+    )
+    return claimed.modified_count == 1
+
+
+def resume_sync_server(wait: bool = False) -> None:
+    """ Function to restart the sync server with the settings and state of the last checkpoint, if the sync server was
+    running when the backend stopped. By default the sync server is started in a separate thread, so the backend does
+    not wait for the SDKs to be imported
+
+    :param wait: bool to resume in the calling thread
+    """
+    try:
+        state = load_state()
+        if state is None or not state["running"] or not claim_state(state):
+            return
+    except PyMongoError as e:
+        SyncServer.sync_server_log.error("Error while loading the sync state: %s", e)
+        return
+
+    def resume() -> None:
+        success, reason, _ = SyncServer.start(
+            state["connectionId"], state["settings"], state
+        )
+        if not success:
+            SyncServer.sync_server_log.error(
+                "Resuming the sync server failed: %s", reason
+            )
+            collection.update_one({"_id": state["_id"]}, {"$set": {"running": False}})
+
+    if wait:
+        resume()
+    else:
+        Thread(target=resume).start()
+
+
+atexit.register(release_state)  # a shutdown checkpoint, see install_shutdown_handler() for SIGTERM
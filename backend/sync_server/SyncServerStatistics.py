@@ -0,0 +1,233 @@
+import time
+from datetime import datetime
+
+from flask import jsonify, request, Blueprint
+from pymongo import DESCENDING
+from pymongo.errors import CollectionInvalid, PyMongoError
+
+from backend import db
+from backend.sync_server import SyncServer, SyncServerMetrics
+
+sync_server_statistics = Blueprint("SyncServerStatistics", __name__)
+collection = db["sync_runs"]
+collection_ready = False
+run_history_size = 64 * 1024 * 1024  # bytes, the oldest runs are dropped by Mongo when the history is full
+
+
+def ensure_collection() -> None:
+    """ Function to create the run history as a capped collection, which bounds its size"""
+    global collection_ready
+    if not collection_ready:
+        if "sync_runs" not in db.list_collection_names():
+            try:
+                db.create_collection("sync_runs", capped=True, size=run_history_size)
+            except CollectionInvalid:  # created in the meantime by another process
+                pass
+        collection_ready = True
+
+
+def start_cycle(connection_config: dict) -> dict:
+    """ Function to start the record of a sync cycle, a run over all endpoints of the connection
+
+    :param connection_config: configuration of the connection between applications
+    :return: the cycle record that the runs of its endpoints are collected in
+    """
+    return {
+        "type": "cycle",
+        "connectionId": connection_config["id"],
+        "start": datetime.utcnow(),
+        "timer": time.perf_counter(),
+        "runs": [],
+    }
+
+
+def start_run(connection_config: dict, endpoint: dict) -> dict:
+    """ Function to start the record of a single endpoint execution within a cycle
+
+    The sync engine fills in the latencies (in milliseconds) of the source, transform and target stage, the bytes and
+    records received from the source, if changes were found and the class of an error if one occurred
+
+    :param connection_config: configuration of the connection between applications
+    :param endpoint: current row of the list of connections that need to be synced
+    :return: the run record
+    """
+    return {
+        "type": "endpoint",
+        "connectionId": connection_config["id"],
+        "mappingId": endpoint["id"],
+        "url": endpoint["source"]["url"] if "url" in endpoint["source"] else "Variables",
+        "start": datetime.utcnow(),
+        "timer": time.perf_counter(),
+        "source": None,
+        "transform": None,
+        "target": None,
+        "bytes": None,
+        "records": None,
+        "changed": False,
+        "error": None,
+    }
+
+
+def count_records(response: any) -> int:
+    """ Function to count the records in a source response, a list counts its items, anything else is one record
+
+    :param response: response data from a source
+    :return: the number of records
+    """
+    if response is None:
+        return 0
+    if isinstance(response, list):
+        return len(response)
+    return 1
+
+
+def elapsed(timer: float) -> float:
+    """ Function to get the milliseconds since a timer was taken with time.perf_counter()
+
+    :param timer: the value of time.perf_counter() at the start
+    :return: elapsed time in milliseconds
+    """
+    return round((time.perf_counter() - timer) * 1000, 3)
+
+
+def finish_run(cycle: dict, run: dict) -> None:
+    """ Function to close a run record, add it to its cycle and update the metrics with it
+
+    :param cycle: the cycle record the run is part of
+    :param run: the run record
+    """
+    run["duration"] = elapsed(run.pop("timer"))
+    cycle["runs"].append(run)
+    SyncServerMetrics.observe_run(run)
+
+
+def finish_cycle(cycle: dict) -> None:
+    """ Function to close a cycle record and write it, together with the runs of its endpoints, to the run history
+
+    All records of a cycle are written with one insert, so the history adds a single round trip per cycle
+
+    :param cycle: the cycle record
+    """
+    runs = cycle.pop("runs")
+    cycle["duration"] = elapsed(cycle.pop("timer"))
+    cycle["endpoints"] = len(runs)
+    cycle["changed"] = sum(1 for run in runs if run["changed"])
+    cycle["errors"] = sum(1 for run in runs if run["error"])
+    SyncServerMetrics.observe_cycle(cycle)
+    try:
+        ensure_collection()
+        collection.insert_many(runs + [cycle], ordered=False)
+    except PyMongoError as e:
+        SyncServer.sync_server_log.error("Error while saving the run history: %s", e)
+
+
+def get_runs(limit: int, run_type: str = None, connection_id: str = None) -> list:
+    """ Function to get the latest records from the run history, newest first
+
+    :param limit: maximum number of records
+    :param run_type: either cycle or endpoint, None for both
+    :param connection_id: a unique identifier of a connection between applications, None for all connections
+    :return: list of run records
+    """
+    query = {}
+    if run_type:
+        query["type"] = run_type
+    if connection_id:
+        query["connectionId"] = connection_id
+    runs = []
+    for run in collection.find(query, {"_id": 0}).sort("$natural", DESCENDING).limit(
+        limit
+    ):
+        runs.append(run)
+    return runs
+
+
+def percentile(values: list, percentage: int) -> float | None:
+    """ Function to calculate a percentile with the nearest rank method
+
+    :param values: sorted list of numbers
+    :param percentage: the requested percentile, for example 90
+    :return: the value at the percentile, None for an empty list
+    """
+    if not values:
+        return None
+    rank = max(1, -(-len(values) * percentage // 100))  # ceiling division
+    return values[rank - 1]
+
+
+def get_endpoint_statistics(limit: int, connection_id: str = None) -> list:
+    """ Function to aggregate the latest endpoint runs into latency percentiles per endpoint mapping
+
+    The endpoints are sorted by their 90th percentile of total latency, so the endpoints that dominate the cycle time
+    come first
+
+    :param limit: number of latest endpoint runs to aggregate
+    :param connection_id: a unique identifier of a connection between applications, None for all connections
+    :return: list of statistics per endpoint mapping
+    """
+    grouped = {}
+    for run in get_runs(limit, "endpoint", connection_id):
+        if run["mappingId"] not in grouped:
+            grouped[run["mappingId"]] = {
+                "connectionId": run["connectionId"],
+                "mappingId": run["mappingId"],
+                "url": run["url"],
+                "runs": [],
+            }
+        grouped[run["mappingId"]]["runs"].append(run)
+    statistics = []
+    for endpoint in grouped.values():
+        runs = endpoint.pop("runs")
+        endpoint["count"] = len(runs)
+        endpoint["changed"] = sum(1 for run in runs if run["changed"])
+        endpoint["errors"] = {}
+        for run in runs:
+            if run["error"]:
+                endpoint["errors"][run["error"]] = (
+                    endpoint["errors"].get(run["error"], 0) + 1
+                )
+        for stage in ["duration", "source", "transform", "target"]:
+            values = sorted(run[stage] for run in runs if run.get(stage) is not None)
+            endpoint[stage] = {
+                "p50": percentile(values, 50),
+                "p90": percentile(values, 90),
+                "p99": percentile(values, 99),
+            }
+        statistics.append(endpoint)
+    statistics.sort(key=lambda item: item["duration"]["p90"] or 0, reverse=True)
+    return statistics
+
+
+@sync_server_statistics.route("/api/server/runs", methods=["GET"])
+def get_run_history() -> tuple:
+    """ Function to get the latest sync cycles and endpoint runs
+
+    :return: Flask response containing the run records, newest first
+    """
+    args = request.args
+    limit = args.get("limit", default=100, type=int)
+    run_type = args.get("type", default=None, type=str)
+    connection_id = args.get("id", default=None, type=str)
+    return (
+        jsonify({"success": True, "data": get_runs(limit, run_type, connection_id)}),
+        200,
+        {"ContentType": "application/json"},
+    )
+
+
+@sync_server_statistics.route("/api/server/statistics", methods=["GET"])
+def get_statistics() -> tuple:
+    """ Function to get the latency percentiles per endpoint, over the latest endpoint runs
+
+    :return: Flask response containing the statistics per endpoint mapping
+    """
+    args = request.args
+    limit = args.get("limit", default=1000, type=int)
+    connection_id = args.get("id", default=None, type=str)
+    return (
+        jsonify(
+            {"success": True, "data": get_endpoint_statistics(limit, connection_id)}
+        ),
+        200,
+        {"ContentType": "application/json"},
+    )
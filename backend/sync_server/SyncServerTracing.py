@@ -0,0 +1,226 @@
+import json
+import random
+import time
+from collections import deque
+from contextlib import contextmanager, nullcontext
+from contextvars import ContextVar
+from threading import Lock
+
+import requests
+from flask import jsonify, request, Blueprint
+
+from backend.sync_server import SyncServer, SyncServerControl
+
+sync_server_tracing = Blueprint("SyncServerTracing", __name__)
+
+current_span = ContextVar("sync_server_span", default=None)
+disabled_span = nullcontext({"attributes": {}})
+pending_spans = []
+pending_spans_lock = Lock()
+ring_buffer = deque(maxlen=10000)
+
+exporter = None  # tracing is off while no exporter is configured
+exporter_target = None
+targeted_exporters = ["file", "otlp"]  # exporters that can not run without a tracing target
+
+
+def export_to_memory(spans: list) -> None:
+    """ Exporter that keeps the latest spans in an in-memory ring buffer, readable through /api/server/traces
+
+    :param spans: finished spans
+    """
+    ring_buffer.extend(spans)
+
+
+def export_to_file(spans: list) -> None:
+    """ Exporter that appends the spans as JSON lines to the file given as tracing target
+
+    :param spans: finished spans
+    """
+    with open(exporter_target, "a", encoding="utf-8") as file:
+        for span in spans:
+            file.write(json.dumps(span, default=str) + "\n")
+
+
+def convert_to_otlp(spans: list) -> dict:
+    """ Function to convert spans to an OTLP/HTTP JSON trace export request
+
+    :param spans: finished spans
+    :return: the request body as a dict
+    """
+    otlp_spans = []
+    for span in spans:
+        otlp_span = {
+            "traceId": span["traceId"],
+            "spanId": span["spanId"],
+            "name": span["name"],
+            "kind": 1,
+            "startTimeUnixNano": str(span["start"]),
+            "endTimeUnixNano": str(span["end"]),
+            "attributes": [
+                {"key": key, "value": {"stringValue": str(value)}}
+                for key, value in span["attributes"].items()
+            ],
+        }
+        if span["parentId"]:
+            otlp_span["parentSpanId"] = span["parentId"]
+        otlp_spans.append(otlp_span)
+    return {
+        "resourceSpans": [
+            {
+                "resource": {
+                    "attributes": [
+                        {"key": "service.name", "value": {"stringValue": "sync_server"}}
+                    ]
+                },
+                "scopeSpans": [{"scope": {"name": "sync_server"}, "spans": otlp_spans}],
+            }
+        ]
+    }
+
+
+def export_to_otlp(spans: list) -> None:
+    """ Exporter that sends the spans to an OTLP/HTTP collector, the tracing target is the url of its traces endpoint,
+    for example http://localhost:4318/v1/traces
+
+    :param spans: finished spans
+    """
+    try:
+        requests.post(exporter_target, json=convert_to_otlp(spans), timeout=5)
+    except requests.exceptions.RequestException as e:
+        SyncServer.sync_server_log.error("Error while exporting spans: %s", e)
+
+
+exporters = {
+    "memory": export_to_memory,
+    "file": export_to_file,
+    "otlp": export_to_otlp,
+}
+
+
+def register_exporter(name: str, exporter_function: callable) -> None:
+    """ Function to add an exporter, an exporter is a function that receives a list of finished spans
+
+    :param name: name to select the exporter with
+    :param exporter_function: the exporter
+    """
+    exporters[name] = exporter_function
+
+
+def configure_tracing(
+    exporter_name: str | None, target: str | None = None
+) -> tuple[bool, str | None]:
+    """ Function to turn tracing on with the given exporter, or off when no exporter name is given
+
+    :param exporter_name: name of a registered exporter, None to turn tracing off
+    :param target: file path or url for the exporter, if it needs one
+    :return: a tuple with a bool if tracing is configured and the reason if it is not
+    """
+    global exporter, exporter_target
+    if exporter_name is None:
+        exporter = None
+        return True, None
+    if exporter_name not in exporters:
+        return False, "Unknown tracing exporter"
+    if exporter_name in targeted_exporters and not target:
+        return False, exporter_name + " tracing needs a tracing target"
+    exporter = exporters[exporter_name]
+    exporter_target = target
+    return True, None
+
+
+@contextmanager
+def record_span(name: str, attributes: dict) -> dict:
+    """ Function to record a span, the span of the calling context becomes its parent
+
+    Spans are exported in batches, once the root span of a trace ends
+
+    :param name: name of the stage
+    :param attributes: attributes of the span
+    :return: the span, as a context manager
+    """
+    parent = current_span.get()
+    span = {
+        "name": name,
+        "traceId": parent["traceId"] if parent else "%032x" % random.getrandbits(128),
+        "spanId": "%016x" % random.getrandbits(64),
+        "parentId": parent["spanId"] if parent else None,
+        "start": time.time_ns(),
+        "end": None,
+        "attributes": attributes,
+    }
+    token = current_span.set(span)
+    try:
+        yield span
+    except BaseException as e:
+        attributes["error"] = type(e).__name__
+        raise
+    finally:
+        span["end"] = time.time_ns()
+        current_span.reset(token)
+        with pending_spans_lock:
+            pending_spans.append(span)
+            if parent is None or len(pending_spans) >= 1000:
+                spans = pending_spans[:]
+                pending_spans.clear()
+            else:
+                spans = None
+        if spans and exporter is not None:
+            try:
+                exporter(spans)
+            except Exception as e:  # a failing exporter must not end the traced sync cycle
+                SyncServer.sync_server_log.error("Error while exporting spans: %s", e)
+
+
+def span(name: str, **attributes) -> contextmanager:
+    """ Function to trace a stage of the sync engine, used as: with span("stage", url=url) as stage_span
+
+    When tracing is off a shared no-op context manager is returned, so the overhead is a single check
+
+    :param name: name of the stage
+    :param attributes: attributes of the span, for example the url or payload size
+    :return: a context manager that gives the span
+    """
+    if exporter is None:
+        return disabled_span
+    return record_span(name, attributes)
+
+
+def set_attribute(stage_span: dict, key: str, value: any) -> None:
+    """ Function to add an attribute to a span after it has started
+
+    :param stage_span: the span given by span()
+    :param key: name of the attribute
+    :param value: value of the attribute
+    """
+    if exporter is not None:
+        stage_span["attributes"][key] = value
+
+
+@sync_server_tracing.route("/api/server/traces", methods=["GET"])
+def get_traces() -> tuple:
+    """ Function to get the latest spans kept by the memory exporter
+
+    The spans are kept in the process that syncs, in worker mode that is a sync worker and not this process, so the
+    spans can not be returned then
+
+    :return: Flask response containing the spans, oldest first
+    """
+    if SyncServerControl.remote_sync:
+        return (
+            jsonify(
+                {
+                    "success": False,
+                    "reason": "Traces are kept by the sync workers, use the file or otlp exporter in worker mode",
+                }
+            ),
+            409,
+            {"ContentType": "application/json"},
+        )
+    limit = request.args.get("limit", default=1000, type=int)
+    spans = list(ring_buffer)[-limit:] if limit > 0 else []
+    return (
+        jsonify({"success": True, "data": spans}),
+        200,
+        {"ContentType": "application/json"},
+    )
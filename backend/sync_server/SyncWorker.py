@@ -0,0 +1,216 @@
+""" Standalone sync worker, it runs the sync server outside the API process
+
+Start workers with: python -m backend.sync_server.SyncWorker --processes 4 and run the API with SYNC_SERVER_MODE=worker,
+the API then sends its start and stop commands to the workers through the sync_control collection. Every worker process
+syncs one connection at a time, which it owns through a lease in the sync_leases collection. Workers can run on several
+hosts, when a worker dies an idle worker takes over its connections once their lease expired.
+"""
+import argparse
+import multiprocessing
+import os
+import signal
+import socket
+import sys
+import time
+from threading import Event, Lock, Thread
+
+from backend.sync_server import (
+    SyncServer,
+    SyncServerControl,
+    SyncServerMetrics,
+    SyncServerScripts,
+    SyncServerState,
+)
+
+worker_id = None
+owned_connection = None  # the connection this worker owns the lease of
+owned_connection_lock = Lock()
+stop_heartbeat = Event()
+retry_delay = 30  # seconds before a connection that failed to start is tried again
+
+
+def start_connection(connection_id: str, settings: dict) -> tuple[bool, str | None]:
+    """ Function to start the sync of a connection this worker owns the lease of, it continues with the state the
+    previous owner checkpointed
+
+    When the connection can not be started because of its config or settings (a 400) the lease is removed, any other
+    failure can be temporary, for example an SDK that can not be generated yet, so the lease expires after
+    retry_delay seconds and a worker tries again
+
+    :param connection_id: a unique identifier of a connection between applications
+    :param settings: the settings of the sync session, see SyncServer.start_sync_server()
+    :return: a tuple with a bool if the sync started and the reason if it did not
+    """
+    global owned_connection
+    with owned_connection_lock:
+        owned_connection = connection_id
+    success, reason, status = SyncServer.start(
+        connection_id, settings, SyncServerState.load_state(connection_id)
+    )
+    if not success and status == 400:
+        release_connection()
+    elif not success:
+        SyncServer.sync_server_log.error(
+            "Starting %s failed, retrying in %s seconds: %s",
+            connection_id,
+            retry_delay,
+            reason,
+        )
+        with owned_connection_lock:
+            SyncServerControl.expire_lease(connection_id, worker_id, retry_delay)
+            owned_connection = None
+    return success, reason
+
+
+def release_connection() -> None:
+    """ Function to remove the lease of the connection this worker owns, after its sync stopped"""
+    global owned_connection
+    with owned_connection_lock:
+        if owned_connection is not None:
+            SyncServerControl.release_lease(owned_connection, worker_id)
+            owned_connection = None
+
+
+def handle_command(command: dict) -> tuple[bool, str | None]:
+    """ Function to execute a command of the API
+
+    :param command: the command, see SyncServerControl.claim_command()
+    :return: a tuple with a bool if the command succeeded and the reason if it did not
+    """
+    if command["command"] == "start":
+        if not SyncServerControl.create_lease(
+            command["connectionId"], command["settings"], worker_id
+        ):
+            return False, "server is already running"
+        return start_connection(command["connectionId"], command["settings"])
+    elif command["command"] == "stop":
+        if not SyncServer.get_state_sync_server():
+            return False, "server not running"
+        SyncServer.stop_sync_server(emergency_stop=True)
+        release_connection()
+        return True, None
+    return False, "Unknown command: " + str(command["command"])
+
+
+def heartbeat(interval: float) -> None:
+    """ Function that runs in a separate thread and renews the lease of the worker and publishes its status, also while
+    the main thread is busy starting or stopping a connection
+
+    :param interval: seconds between heartbeats
+    """
+    global owned_connection
+    while not stop_heartbeat.is_set():
+        with owned_connection_lock:
+            if owned_connection is not None and not SyncServerControl.renew_lease(
+                owned_connection, worker_id
+            ):
+                # this worker missed its renewals for longer than the lease and another worker took over
+                SyncServer.abandon_sync_server()
+                owned_connection = None
+            connection_id = owned_connection
+        SyncServerControl.publish_status(
+            worker_id,
+            connection_id,
+            SyncServer.get_state_sync_server(),
+            SyncServerMetrics.get_snapshot(),
+        )
+        stop_heartbeat.wait(interval)
+
+
+def shutdown(signal_number: int, frame: any) -> None:
+    """ Signal handler that turns SIGTERM into a normal exit, so the worker checkpoints its state"""
+    sys.exit(0)
+
+
+def main(poll_interval: float) -> None:
+    """ Function that runs a worker process: it takes commands and expired leases and syncs one connection at a time,
+    until it is stopped
+
+    :param poll_interval: seconds between checks for new commands
+    """
+    global worker_id
+    SyncServerControl.remote_sync = False
+    worker_id = socket.gethostname() + ":" + str(os.getpid())
+    SyncServer.start_log_listener()
+    signal.signal(signal.SIGTERM, shutdown)
+    heartbeat_thread = Thread(
+        target=heartbeat, args=[SyncServerControl.lease_duration / 3], daemon=True
+    )
+    heartbeat_thread.start()
+    SyncServer.sync_server_log.info("Sync worker started: %s", worker_id)
+    try:
+        while True:
+            running = SyncServer.get_state_sync_server()
+            if owned_connection is not None and not running:
+                release_connection()  # stopped because of an error
+            if running and owned_connection is not None:
+                command = SyncServerControl.claim_command(worker_id, owned_connection)
+            elif running:
+                command = None  # waiting for an abandoned sync thread to end
+            else:
+                lease = SyncServerControl.acquire_lease(worker_id)
+                if lease is not None:
+                    start_connection(lease["_id"], lease["settings"])
+                    continue
+                command = SyncServerControl.claim_command(worker_id, None)
+            if command is not None:
+                success, reason = handle_command(command)
+                SyncServerControl.finish_command(command, success, reason)
+                continue
+            time.sleep(poll_interval)
+    finally:
+        # the sync thread has to end before Python exits, the lease is expired so another worker resumes the
+        # connection right away with the checkpointed state
+        SyncServer.stop_thread = True
+        stop_heartbeat.set()
+        SyncServerState.save_state()
+        with owned_connection_lock:
+            if owned_connection is not None:
+                SyncServerControl.expire_lease(owned_connection, worker_id)
+        SyncServerScripts.stop_script_pool()
+        SyncServerControl.remove_status(worker_id)
+
+
+def run_processes(processes: int, poll_interval: float) -> None:
+    """ Function to run several worker processes, each process syncs its own connection on its own core
+
+    :param processes: number of worker processes
+    :param poll_interval: seconds between checks for new commands
+    """
+    context = multiprocessing.get_context("spawn")
+    workers = [
+        context.Process(target=main, args=[poll_interval]) for _ in range(processes)
+    ]
+    for worker in workers:
+        worker.start()
+    signal.signal(signal.SIGTERM, shutdown)
+    try:
+        for worker in workers:
+            worker.join()
+    finally:
+        for worker in workers:
+            if worker.is_alive():
+                worker.terminate()  # SIGTERM, which the worker turns into a normal exit
+        for worker in workers:
+            worker.join()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run sync workers")
+    parser.add_argument(
+        "--processes",
+        type=int,
+        default=1,
+        help="number of worker processes, each syncs one connection at a time",
+    )
+    parser.add_argument(
+        "--poll",
+        type=float,
+        default=1,
+        help="seconds between checks for new commands and expired leases",
+    )
+    arguments = parser.parse_args()
+    if arguments.processes > 1:
+        run_processes(arguments.processes, arguments.poll)
+    else:
+        main(arguments.poll)
@@ -1,6 +1,16 @@
 from flask import Blueprint
 
 from backend.sync_server.SyncServer import sync_server
+from backend.sync_server.SyncServerBackfill import sync_server_backfill
+from backend.sync_server.SyncServerControl import sync_server_control
+from backend.sync_server.SyncServerMetrics import sync_server_metrics
+from backend.sync_server.SyncServerStatistics import sync_server_statistics
+from backend.sync_server.SyncServerTracing import sync_server_tracing
 
 server = Blueprint("Server", __name__)
-server.register_blueprint(sync_server)
\ No newline at end of file
+server.register_blueprint(sync_server)
+server.register_blueprint(sync_server_backfill)
+server.register_blueprint(sync_server_control)
+server.register_blueprint(sync_server_metrics)
+server.register_blueprint(sync_server_statistics)
+server.register_blueprint(sync_server_tracing)
\ No newline at end of file
@@ -134,6 +134,7 @@ export const ApplicationEndpoints: React.FC<APIEndpointsInterface> = ({id, setOp
             body: JSON.stringify({
                 operation: operation,
                 url: apiUrl + getParameters(true),
+                endpointUrl: apiUrl,
                 body: crawlBody,
             })
         }).then(response => response.json())